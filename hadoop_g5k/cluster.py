@@ -1,20 +1,26 @@
 import getpass
 import os
+import pipes
 import re
 import shutil
 import sys
 import tempfile
+import time
 
 from ConfigParser import ConfigParser
 
 from execo.log import style
-from execo.action import Put, TaktukPut, Get, Remote, TaktukRemote, \
-    SequentialActions
-from execo.process import SshProcess
+from execo.action import SequentialActions
 from execo_engine import logger
-from execo_g5k.api_utils import get_host_attributes, get_host_cluster
+from execo_g5k.api_utils import get_host_cluster
 
+from hadoop_g5k.dfs import BlockDistribution, parse_dfsadmin_report, \
+    parse_ls, parse_under_replicated_blocks
+from hadoop_g5k.local import is_local_deployment, local_path, expand_path, \
+    get_local_port, get_host_attributes, get_process, get_remote, get_put, \
+    get_get, get_stream_process, get_pipe_process
 from hadoop_g5k.objects import HadoopJarJob, HadoopTopology, HadoopException
+from hadoop_g5k.properties import JOB, V1_PROPERTIES, get_property_component
 from hadoop_g5k.util import ColorDecorator, replace_in_xml_file, get_xml_params
 
 # Configuration files
@@ -27,12 +33,35 @@ DEFAULT_HADOOP_BASE_DIR = "/tmp/hadoop"
 DEFAULT_HADOOP_CONF_DIR = DEFAULT_HADOOP_BASE_DIR + "/conf"
 DEFAULT_HADOOP_LOGS_DIR = DEFAULT_HADOOP_BASE_DIR + "/logs"
 DEFAULT_HADOOP_TEMP_DIR = DEFAULT_HADOOP_BASE_DIR + "/tmp"
+DEFAULT_HADOOP_SNAPSHOTS_DIR = "/tmp/hadoop_snapshots"
 
 DEFAULT_HADOOP_HDFS_PORT = 54310
 DEFAULT_HADOOP_MR_PORT = 54311
 
 DEFAULT_HADOOP_LOCAL_CONF_DIR = "conf"
 
+# Default ports of the slave daemons
+DEFAULT_DATANODE_PORT = 50010
+DEFAULT_DATANODE_IPC_PORT = 50020
+DEFAULT_DATANODE_HTTP_PORT = 50075
+DEFAULT_TASKTRACKER_HTTP_PORT = 50060
+
+# Default ports of the web interfaces of the master daemons
+DEFAULT_NAMENODE_HTTP_PORT = 50070
+DEFAULT_JOBTRACKER_HTTP_PORT = 50030
+
+# Seconds during which the queried state of the daemons is reused
+DEFAULT_STATE_TTL = 10
+
+# Default threshold of the balancer (percentage of utilization)
+DEFAULT_BALANCER_THRESHOLD = 10
+
+# Hadoop's default replication factor
+DEFAULT_REPLICATION = 3
+
+# Seconds between two checks of the replication of a dfs path
+DEFAULT_REPLICATION_CHECK_INTERVAL = 10
+
 
 class HadoopNotInitializedException(HadoopException):
     pass
@@ -62,6 +91,14 @@ class HadoopCluster(object):
         True if the NameNode is running, False otherwise.
       running_map_reduce (bool):
         True if the JobTracker is running, False otherwise.
+      local (bool):
+        True if the cluster is a pseudo-distributed deployment composed of
+        virtual hosts in the local machine, False otherwise.
+      snapshots (frozenset of str):
+        The names of the dfs snapshots stored in the nodes.
+
+    The running flags are updated with the actual state of the daemons by
+    refresh_state() before the cluster is started, stopped or used.
     """
 
     @staticmethod
@@ -74,12 +111,26 @@ class HadoopCluster(object):
     running_dfs = False
     running_map_reduce = False
 
+    local = False
+
+    snapshots = frozenset()
+    snapshots_dir = DEFAULT_HADOOP_SNAPSHOTS_DIR
+
+    # Daemon state, as queried in the hosts
+    state_ttl = DEFAULT_STATE_TTL
+    _state = None
+    _state_time = 0
+
+    # Classification of the configuration properties
+    properties = V1_PROPERTIES
+
     # Default properties
     defaults = {
         "hadoop_base_dir": DEFAULT_HADOOP_BASE_DIR,
         "hadoop_conf_dir": DEFAULT_HADOOP_CONF_DIR,
         "hadoop_logs_dir": DEFAULT_HADOOP_LOGS_DIR,
         "hadoop_temp_dir": DEFAULT_HADOOP_TEMP_DIR,
+        "hadoop_snapshots_dir": DEFAULT_HADOOP_SNAPSHOTS_DIR,
         "hdfs_port": str(DEFAULT_HADOOP_HDFS_PORT),
         "mapred_port": str(DEFAULT_HADOOP_MR_PORT),
 
@@ -111,10 +162,20 @@ class HadoopCluster(object):
         self.conf_dir = config.get("cluster", "hadoop_conf_dir")
         self.logs_dir = config.get("cluster", "hadoop_logs_dir")
         self.hadoop_temp_dir = config.get("cluster", "hadoop_temp_dir")
+        self.snapshots_dir = config.get("cluster", "hadoop_snapshots_dir")
         self.hdfs_port = config.getint("cluster", "hdfs_port")
         self.mapred_port = config.getint("cluster", "mapred_port")
         self.local_base_conf_dir = config.get("local", "local_base_conf_dir")
 
+        # Virtual hosts store their files under their own root dir
+        self.local = is_local_deployment(hosts)
+        if self.local:
+            self.base_dir = local_path(self.base_dir)
+            self.conf_dir = local_path(self.conf_dir)
+            self.logs_dir = local_path(self.logs_dir)
+            self.hadoop_temp_dir = local_path(self.hadoop_temp_dir)
+            self.snapshots_dir = local_path(self.snapshots_dir)
+
         self.bin_dir = self.base_dir + "/bin"
         self.sbin_dir = self.base_dir + "/bin"
 
@@ -127,7 +188,12 @@ class HadoopCluster(object):
         # Store cluster information
         self.host_clusters = {}
         for h in self.hosts:
-            g5k_cluster = get_host_cluster(h)
+            if self.local:
+                # Virtual hosts use different ports, so each one is
+                # configured separately
+                g5k_cluster = "vh" + str(h.index)
+            else:
+                g5k_cluster = get_host_cluster(h)
             if g5k_cluster in self.host_clusters:
                 self.host_clusters[g5k_cluster].append(h)
             else:
@@ -155,23 +221,24 @@ class HadoopCluster(object):
         """
 
         # 0. Check that required packages are present
-        required_packages = "openjdk-7-jre openjdk-7-jdk"
-        check_packages = TaktukRemote("dpkg -s " + required_packages,
-                                      self.hosts)
-        for p in check_packages.processes:
-            p.nolog_exit_code = p.nolog_error = True
-        check_packages.run()
-        if not check_packages.ok:
-            logger.info("Packages not installed, trying to install")
-            install_packages = TaktukRemote(
-                "export DEBIAN_MASTER=noninteractive ; " +
-                "apt-get update && apt-get install -y --force-yes " +
-                required_packages, self.hosts).run()
-            if not install_packages.ok:
-                logger.error("Unable to install the packages")
-
-        get_java_home = SshProcess('echo $(readlink -f /usr/bin/javac | '
-                                   'sed "s:/bin/javac::")', self.master)
+        if not self.local:
+            required_packages = "openjdk-7-jre openjdk-7-jdk"
+            check_packages = get_remote("dpkg -s " + required_packages,
+                                        self.hosts, taktuk=True)
+            for p in check_packages.processes:
+                p.nolog_exit_code = p.nolog_error = True
+            check_packages.run()
+            if not check_packages.ok:
+                logger.info("Packages not installed, trying to install")
+                install_packages = get_remote(
+                    "export DEBIAN_MASTER=noninteractive ; " +
+                    "apt-get update && apt-get install -y --force-yes " +
+                    required_packages, self.hosts, taktuk=True).run()
+                if not install_packages.ok:
+                    logger.error("Unable to install the packages")
+
+        get_java_home = get_process('echo $(readlink -f /usr/bin/javac | '
+                                    'sed "s:/bin/javac::")', self.master)
         get_java_home.run()
         self.java_home = get_java_home.stdout.strip()
 
@@ -179,42 +246,49 @@ class HadoopCluster(object):
 
         # 1. Copy hadoop tar file and uncompress
         logger.info("Copy " + tar_file + " to hosts and uncompress")
-        rm_dirs = Remote("rm -rf " + self.base_dir +
-                         " " + self.conf_dir +
-                         " " + self.logs_dir +
-                         " " + self.hadoop_temp_dir,
-                         self.hosts)
-        put_tar = TaktukPut(self.hosts, [tar_file], "/tmp")
-        tar_xf = TaktukRemote(
-            "tar xf /tmp/" + os.path.basename(tar_file) + " -C /tmp",
-            self.hosts)
+        if self.local:
+            tmp_dir = local_path("/tmp")
+        else:
+            tmp_dir = "/tmp"
+        rm_dirs = get_remote("rm -rf " + self.base_dir +
+                             " " + self.conf_dir +
+                             " " + self.logs_dir +
+                             " " + self.hadoop_temp_dir,
+                             self.hosts)
+        put_tar = get_put(self.hosts, [tar_file], tmp_dir, taktuk=True)
+        tar_xf = get_remote(
+            "tar xf " + tmp_dir + "/" + os.path.basename(tar_file) +
+            " -C " + tmp_dir,
+            self.hosts, taktuk=True)
         SequentialActions([rm_dirs, put_tar, tar_xf]).run()
 
         # 2. Move installation to base dir and create other dirs
         logger.info("Create installation directories")
-        mv_base_dir = TaktukRemote(
-            "mv /tmp/" +
+        mv_base_dir = get_remote(
+            "mv " + tmp_dir + "/" +
             os.path.basename(tar_file).replace(".tar.gz", "") + " " +
             self.base_dir,
-            self.hosts)
-        mkdirs = TaktukRemote("mkdir -p " + self.conf_dir +
-                              " && mkdir -p " + self.logs_dir +
-                              " && mkdir -p " + self.hadoop_temp_dir,
-                              self.hosts)
-        chmods = TaktukRemote("chmod g+w " + self.base_dir +
-                              " && chmod g+w " + self.conf_dir +
-                              " && chmod g+w " + self.logs_dir +
-                              " && chmod g+w " + self.hadoop_temp_dir,
-                              self.hosts)
+            self.hosts, taktuk=True)
+        mkdirs = get_remote("mkdir -p " + self.conf_dir +
+                            " && mkdir -p " + self.logs_dir +
+                            " && mkdir -p " + self.hadoop_temp_dir,
+                            self.hosts, taktuk=True)
+        chmods = get_remote("chmod g+w " + self.base_dir +
+                            " && chmod g+w " + self.conf_dir +
+                            " && chmod g+w " + self.logs_dir +
+                            " && chmod g+w " + self.hadoop_temp_dir,
+                            self.hosts, taktuk=True)
         SequentialActions([mv_base_dir, mkdirs, chmods]).run()
 
         # 4. Specify environment variables
         command = "cat >> " + self.conf_dir + "/hadoop-env.sh << EOF\n"
         command += "export JAVA_HOME=" + self.java_home + "\n"
         command += "export HADOOP_LOG_DIR=" + self.logs_dir + "\n"
+        if self.local:
+            command += "export HADOOP_PID_DIR=" + self.hadoop_temp_dir + "\n"
         command += "HADOOP_HOME_WARN_SUPPRESS=\"TRUE\"\n"
         command += "EOF"
-        action = Remote(command, self.hosts)
+        action = get_remote(command, self.hosts)
         action.run()
 
         # 5. Check version
@@ -295,7 +369,8 @@ class HadoopCluster(object):
         remote_missing_files = [os.path.join(self.conf_dir, f)
                                 for f in missing_conf_files]
 
-        action = Get([self.master], remote_missing_files, self.temp_conf_dir)
+        action = get_get([self.master], remote_missing_files,
+                         self.temp_conf_dir)
         action.run()
 
     def _create_master_and_slave_conf(self):
@@ -350,10 +425,11 @@ class HadoopCluster(object):
                             True)
         replace_in_xml_file(os.path.join(self.temp_conf_dir, CORE_CONF_FILE),
                             "hadoop.tmp.dir",
-                            self.hadoop_temp_dir, True)
+                            expand_path(self.hadoop_temp_dir, hosts[0]), True)
         replace_in_xml_file(os.path.join(self.temp_conf_dir, CORE_CONF_FILE),
                             "topology.script.file.name",
-                            self.conf_dir + "/topo.sh", True)
+                            expand_path(self.conf_dir, hosts[0]) + "/topo.sh",
+                            True)
 
         replace_in_xml_file(os.path.join(self.temp_conf_dir, MR_CONF_FILE),
                             "mapred.job.tracker",
@@ -372,6 +448,36 @@ class HadoopCluster(object):
                                 "mapred.child.java.opts",
                                 "-Xmx" + str(mem_per_slot_mb) + "m", True)
 
+        if self.local:
+            self._configure_local_ports(hosts[0])
+            replace_in_xml_file(os.path.join(self.temp_conf_dir, MR_CONF_FILE),
+                                "mapred.task.tracker.http.address",
+                                "0.0.0.0:" +
+                                str(get_local_port(
+                                    DEFAULT_TASKTRACKER_HTTP_PORT, hosts[0])),
+                                True)
+
+    def _configure_local_ports(self, host):
+        """Assign the ports of the DataNode of a virtual host, so that several
+        of them can run in the same machine.
+
+        Args:
+          host (LocalHost):
+            The virtual host to be configured.
+        """
+
+        ports = {
+            "dfs.datanode.address": DEFAULT_DATANODE_PORT,
+            "dfs.datanode.ipc.address": DEFAULT_DATANODE_IPC_PORT,
+            "dfs.datanode.http.address": DEFAULT_DATANODE_HTTP_PORT
+        }
+        for name, port in ports.iteritems():
+            replace_in_xml_file(os.path.join(self.temp_conf_dir,
+                                             HDFS_CONF_FILE),
+                                name,
+                                "0.0.0.0:" + str(get_local_port(port, host)),
+                                True)
+
     def _copy_conf(self, conf_dir, hosts=None):
         """Copy configuration files from given dir to remote dir in cluster
         hosts.
@@ -389,7 +495,7 @@ class HadoopCluster(object):
 
         conf_files = [os.path.join(conf_dir, f) for f in os.listdir(conf_dir)]
 
-        action = TaktukPut(hosts, conf_files, self.conf_dir)
+        action = get_put(hosts, conf_files, self.conf_dir, taktuk=True)
         action.run()
 
         if not action.finished_ok:
@@ -412,7 +518,7 @@ class HadoopCluster(object):
             hosts = self.host_clusters[g5k_cluster]
 
             # Copy conf files from first host in the cluster
-            action = Remote("ls " + self.conf_dir + "/*.xml", [hosts[0]])
+            action = get_remote("ls " + self.conf_dir + "/*.xml", [hosts[0]])
             action.run()
             output = action.processes[0].stdout
 
@@ -420,11 +526,11 @@ class HadoopCluster(object):
             for f in output.split():
                 remote_conf_files.append(os.path.join(self.conf_dir, f))
 
-            tmp_dir = "/tmp/mliroz_temp_hadoop/"
-            if not os.path.exists(tmp_dir):
-                os.makedirs(tmp_dir)
+            # Each call uses its own dir, as several clusters may be
+            # configured at the same time
+            tmp_dir = tempfile.mkdtemp("", "hadoop-conf-", "/tmp")
 
-            action = Get([hosts[0]], remote_conf_files, tmp_dir)
+            action = get_get([hosts[0]], remote_conf_files, tmp_dir)
             action.run()
 
             # Do replacements in temp file
@@ -442,6 +548,7 @@ class HadoopCluster(object):
 
             # Copy back the files to all hosts
             self._copy_conf(tmp_dir, hosts)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
 
     def get_conf(self, param_names):
 
@@ -449,7 +556,7 @@ class HadoopCluster(object):
         remaining_param_names = param_names[:]
 
         # Copy conf files from first host in the cluster
-        action = Remote("ls " + self.conf_dir + "/*.xml", [self.hosts[0]])
+        action = get_remote("ls " + self.conf_dir + "/*.xml", [self.hosts[0]])
         action.run()
         output = action.processes[0].stdout
 
@@ -457,11 +564,9 @@ class HadoopCluster(object):
         for f in output.split():
             remote_conf_files.append(os.path.join(self.conf_dir, f))
 
-        tmp_dir = "/tmp/mliroz_temp_hadoop/"
-        if not os.path.exists(tmp_dir):
-            os.makedirs(tmp_dir)
+        tmp_dir = tempfile.mkdtemp("", "hadoop-conf-", "/tmp")
 
-        action = Get([self.hosts[0]], remote_conf_files, tmp_dir)
+        action = get_get([self.hosts[0]], remote_conf_files, tmp_dir)
         action.run()
 
         # Do replacements in temp file
@@ -475,6 +580,8 @@ class HadoopCluster(object):
                     params[p] = fparams[p]
                     remaining_param_names.remove(p)
 
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
         return params
 
     def format_dfs(self):
@@ -482,8 +589,8 @@ class HadoopCluster(object):
 
         logger.info("Formatting HDFS")
 
-        proc = SshProcess(self.bin_dir + "/hadoop namenode -format",
-                          self.master)
+        proc = get_process(self.bin_dir + "/hadoop namenode -format",
+                           self.master)
         proc.run()
 
         if proc.finished_ok:
@@ -491,6 +598,198 @@ class HadoopCluster(object):
         else:
             logger.warn("Error while formatting HDFS")
 
+    def get_block_distribution(self, path="/"):
+        """Return the distribution of the blocks of the given dfs path among
+        the DataNodes.
+
+        Args:
+          path (str, optional):
+            The dfs path whose blocks are analyzed.
+
+        Returns (BlockDistribution):
+          The block and byte counts of each DataNode along with their usage.
+        """
+
+        (fsck_out, _) = self.execute("fsck " + path +
+                                     " -files -blocks -locations",
+                                     verbose=False)
+        (report_out, _) = self.execute("dfsadmin -report", verbose=False)
+
+        return BlockDistribution(fsck_out, report_out)
+
+    def get_dfs_capacity(self):
+        """Return the total capacity of the live DataNodes in bytes."""
+
+        (report_out, _) = self.execute("dfsadmin -report", verbose=False)
+        return sum(usage.get("capacity", 0) for usage in
+                   parse_dfsadmin_report(report_out).values())
+
+    def rebalance_dfs(self, threshold=DEFAULT_BALANCER_THRESHOLD,
+                      bandwidth=None):
+        """Execute the balancer to even the utilization of the DataNodes. The
+        balancer is not executed if the cluster is already balanced.
+
+        Args:
+          threshold (float, optional):
+            The maximum difference, in percentage points, allowed between the
+            utilization of a DataNode and the utilization of the cluster.
+          bandwidth (int, optional):
+            The maximum bandwidth, in bytes per second, that each DataNode can
+            use for balancing. If not indicated, Hadoop's value is used.
+
+        Returns (BlockDistribution):
+          The distribution of the blocks after balancing.
+        """
+
+        distribution = self.get_block_distribution()
+        if distribution.get_max_deviation() <= threshold:
+            logger.info("DFS is already balanced (threshold = " +
+                        str(threshold) + "%)")
+            return distribution
+
+        logger.info("Rebalancing DFS: " + distribution.get_summary())
+
+        if bandwidth:
+            self.execute("dfsadmin -setBalancerBandwidth " +
+                         str(int(bandwidth)), verbose=False)
+        self.execute("balancer -threshold " + str(threshold), verbose=False)
+
+        distribution = self.get_block_distribution()
+        logger.info("DFS rebalanced: " + distribution.get_summary())
+
+        return distribution
+
+    def snapshot_dfs(self, name, hard_link=True):
+        """Save the current state of the dfs (NameNode metadata and DataNode
+        blocks) in the local disk of each node, so that it can be restored
+        later with restore_dfs. The dfs is stopped while copying.
+
+        Only the default storage dirs, under hadoop.tmp.dir, are saved.
+
+        Args:
+          name (str):
+            The name of the snapshot. Any previous snapshot with the same name
+            is replaced.
+          hard_link (bool, optional):
+            If True, block files are hard-linked instead of copied. Blocks are
+            never modified once written, so this is safe as long as no file of
+            the dfs is appended.
+
+        Returns (bool):
+          True if the snapshot was created in all the nodes, False otherwise.
+        """
+
+        self._check_initialization()
+
+        logger.info("Creating dfs snapshot " + name)
+
+        restart = self.running
+        if restart:
+            self.stop()
+
+        action = get_remote(
+            self._get_copy_dfs_command(self.hadoop_temp_dir + "/dfs",
+                                       self.snapshots_dir + "/" + name,
+                                       hard_link),
+            self.hosts)
+        action.run()
+
+        if restart:
+            self.start_and_wait()
+
+        if action.ok:
+            self.snapshots = self.snapshots | frozenset([name])
+        else:
+            logger.warn("Error while creating dfs snapshot " + name)
+
+        return action.ok
+
+    def restore_dfs(self, name, hard_link=True):
+        """Replace the dfs with the state saved in the given snapshot. The dfs
+        is stopped while copying.
+
+        Args:
+          name (str):
+            The name of the snapshot.
+          hard_link (bool, optional):
+            If True, block files are hard-linked instead of copied.
+
+        Returns (bool):
+          True if the snapshot was restored in all the nodes, False otherwise.
+        """
+
+        self._check_initialization()
+
+        if name not in self.snapshots:
+            logger.warn("There is no dfs snapshot named " + name)
+            return False
+
+        logger.info("Restoring dfs snapshot " + name)
+
+        restart = self.running
+        if restart:
+            self.stop()
+
+        action = get_remote(
+            self._get_copy_dfs_command(self.snapshots_dir + "/" + name,
+                                       self.hadoop_temp_dir + "/dfs",
+                                       hard_link),
+            self.hosts)
+        action.run()
+
+        if not action.ok:
+            logger.warn("Error while restoring dfs snapshot " + name)
+            self.snapshots = self.snapshots - frozenset([name])
+            return False
+
+        if restart:
+            self.start_and_wait()
+
+        return True
+
+    def _get_copy_dfs_command(self, src, dest, hard_link=True):
+        """Return the command copying a dfs storage dir.
+
+        When hard-linking, the whole tree is linked and then the files which
+        are not blocks (metadata, VERSION, etc.) are replaced by copies, as
+        Hadoop modifies them in place. If the dirs are in different
+        filesystems, everything is copied.
+
+        Args:
+          src (str):
+            The source dir.
+          dest (str):
+            The destination dir. It is replaced if it exists.
+          hard_link (bool, optional):
+            If True, block files are hard-linked instead of copied.
+
+        Returns (str):
+          The command to be executed in each node.
+        """
+
+        command = ("test -d " + src + " && rm -rf " + dest +
+                   " && mkdir -p $(dirname " + dest + ") && ")
+        if hard_link:
+            command += ("(cp -al " + src + " " + dest + " 2>/dev/null || " +
+                        "(rm -rf " + dest + " && cp -a " + src + " " + dest +
+                        ")) && find " + dest + " -type f ! -name 'blk_*' " +
+                        "-exec sh -c 'cp -p \"$0\" \"$0.tmp\" && " +
+                        "mv \"$0.tmp\" \"$0\"' {} \\;")
+        else:
+            command += "cp -a " + src + " " + dest
+
+        return command
+
+    def clean_snapshots(self):
+        """Remove all the dfs snapshots stored in the nodes."""
+
+        if self.snapshots:
+            logger.info("Removing dfs snapshots")
+            action = get_remote("rm -rf " + self.snapshots_dir, self.hosts)
+            action.run()
+
+        self.snapshots = frozenset()
+
     def start(self):
         """Start the NameNode and DataNodes and then the JobTracker and
         TaskTrackers."""
@@ -514,18 +813,26 @@ class HadoopCluster(object):
         self.running = True
 
     def start_dfs(self):
-        """Start the NameNode and DataNodes."""
+        """Start the NameNode and DataNodes. If some of them are already
+        running, only the missing daemons are started."""
 
         self._check_initialization()
 
         logger.info("Starting HDFS")
 
-        if self.running_dfs:
+        missing_daemons = self._get_missing_daemons(self._get_dfs_daemons())
+        if not missing_daemons:
             logger.warn("Dfs was already started")
+            self.running_dfs = True
             return
 
-        proc = SshProcess(self.sbin_dir + "/start-dfs.sh", self.master)
+        if self.local or self.running_dfs:
+            proc = self._get_daemons_action(
+                self.sbin_dir + "/hadoop-daemon.sh", "start", missing_daemons)
+        else:
+            proc = get_process(self.sbin_dir + "/start-dfs.sh", self.master)
         proc.run()
+        self._invalidate_state()
 
         if not proc.finished_ok:
             logger.warn("Error while starting HDFS")
@@ -540,8 +847,8 @@ class HadoopCluster(object):
         self.start_dfs()
 
         logger.info("Waiting for safe mode to be off")
-        proc = SshProcess(self.bin_dir + "/hadoop dfsadmin -safemode wait",
-                          self.master)
+        proc = get_process(self.bin_dir + "/hadoop dfsadmin -safemode wait",
+                           self.master)
         proc.run()
 
         if not proc.finished_ok:
@@ -550,18 +857,26 @@ class HadoopCluster(object):
             self.running_dfs = True
 
     def start_map_reduce(self):
-        """Start the JobTracker and TaskTrackers."""
+        """Start the JobTracker and TaskTrackers. If some of them are already
+        running, only the missing daemons are started."""
 
         self._check_initialization()
 
         logger.info("Starting MapReduce")
 
-        if self.running_map_reduce:
-            logger.warn("Error while starting MapReduce")
+        missing_daemons = self._get_missing_daemons(self._get_mr_daemons())
+        if not missing_daemons:
+            logger.warn("MapReduce was already started")
+            self.running_map_reduce = True
             return
 
-        proc = SshProcess(self.sbin_dir + "/start-mapred.sh", self.master)
+        if self.local or self.running_map_reduce:
+            proc = self._get_daemons_action(
+                self.sbin_dir + "/hadoop-daemon.sh", "start", missing_daemons)
+        else:
+            proc = get_process(self.sbin_dir + "/start-mapred.sh", self.master)
         proc.run()
+        self._invalidate_state()
 
         if not proc.finished_ok:
             logger.info("MapReduce started successfully")
@@ -596,14 +911,27 @@ class HadoopCluster(object):
         self.running = False
 
     def stop_dfs(self):
-        """Stop the NameNode and DataNodes."""
+        """Stop the NameNode and DataNodes. Nothing is done if none of them is
+        running."""
 
         self._check_initialization()
 
         logger.info("Stopping HDFS")
 
-        proc = SshProcess(self.sbin_dir + "/stop-dfs.sh", self.master)
+        running_daemons = self._get_running_daemons(self._get_dfs_daemons())
+        if not running_daemons:
+            logger.warn("Dfs was already stopped")
+            self.running_dfs = False
+            return
+
+        if self.local:
+            proc = self._get_daemons_action(
+                self.sbin_dir + "/hadoop-daemon.sh", "stop",
+                list(reversed(running_daemons)))
+        else:
+            proc = get_process(self.sbin_dir + "/stop-dfs.sh", self.master)
         proc.run()
+        self._invalidate_state()
 
         if not proc.finished_ok:
             logger.warn("Error while stopping HDFS")
@@ -611,20 +939,303 @@ class HadoopCluster(object):
             self.running_dfs = False
 
     def stop_map_reduce(self):
-        """Stop the JobTracker and TaskTrackers."""
+        """Stop the JobTracker and TaskTrackers. Nothing is done if none of
+        them is running."""
 
         self._check_initialization()
 
         logger.info("Stopping MapReduce")
 
-        proc = SshProcess(self.sbin_dir + "/stop-mapred.sh", self.master)
+        running_daemons = self._get_running_daemons(self._get_mr_daemons())
+        if not running_daemons:
+            logger.warn("MapReduce was already stopped")
+            self.running_map_reduce = False
+            return
+
+        if self.local:
+            proc = self._get_daemons_action(
+                self.sbin_dir + "/hadoop-daemon.sh", "stop",
+                list(reversed(running_daemons)))
+        else:
+            proc = get_process(self.sbin_dir + "/stop-mapred.sh", self.master)
         proc.run()
+        self._invalidate_state()
 
         if not proc.finished_ok:
             logger.warn("Error while stopping MapReduce")
         else:
             self.running_map_reduce = False
 
+    def classify_properties(self, params):
+        """Separate the given properties into those read by the jobs and those
+        read by the daemons.
+
+        Args:
+          params (dict of str:str):
+            The properties in the form key:value.
+
+        Returns (tuple):
+          The job-level properties (dict of str:str) and the names of the
+          daemons reading each of the rest of properties (dict of str: list of
+          str). Properties not classified are considered to be read by all the
+          daemons.
+        """
+
+        all_daemons = [name for (name, _) in
+                       self._get_dfs_daemons() + self._get_mr_daemons()]
+
+        job_params = {}
+        daemon_params = {}
+        for (pn, pv) in params.items():
+            component = get_property_component(pn, self.properties)
+            if component == JOB:
+                job_params[pn] = pv
+            elif component is None:
+                daemon_params[pn] = all_daemons
+            else:
+                daemon_params[pn] = component
+
+        return (job_params, daemon_params)
+
+    def restart_daemons(self, names):
+        """Restart the given daemons in all their hosts so that they take the
+        current configuration. If any HDFS daemon is restarted, wait for the
+        dfs to exit safemode.
+
+        Args:
+          names (collection of str):
+            The names of the daemons, e.g., "NameNode" or "TaskTracker".
+
+        Returns (bool):
+          True if all the daemons were restarted successfully, False
+          otherwise.
+        """
+
+        self._check_initialization()
+
+        dfs_daemons = [d for d in self._get_dfs_daemons() if d[0] in names]
+        mr_daemons = [d for d in self._get_mr_daemons() if d[0] in names]
+        daemons = dfs_daemons + mr_daemons
+        if not daemons:
+            return True
+
+        logger.info("Restarting " + ", ".join(name for (name, _) in daemons))
+
+        # 1. Stop the running daemons in reverse starting order
+        for (name, hosts) in reversed(self._get_running_daemons(daemons)):
+            self._get_daemons_action(self._get_daemon_script(name), "stop",
+                                     [(name, hosts)]).run()
+        self._invalidate_state()
+
+        # 2. Start them in order
+        ok = True
+        for (name, hosts) in daemons:
+            action = self._get_daemons_action(self._get_daemon_script(name),
+                                              "start", [(name, hosts)])
+            action.run()
+            if not action.ok:
+                logger.warn("Error while starting " + name)
+                ok = False
+        self._invalidate_state()
+
+        # 3. Wait for the dfs
+        if dfs_daemons:
+            logger.info("Waiting for safe mode to be off")
+            proc = get_process(self.bin_dir +
+                               "/hadoop dfsadmin -safemode wait", self.master)
+            proc.run()
+            ok = ok and proc.finished_ok
+
+        self.refresh_state()
+        return ok
+
+    def _get_daemon_script(self, name):
+        """Return the path of the script managing the given daemon."""
+
+        return self.sbin_dir + "/hadoop-daemon.sh"
+
+    def _get_dfs_daemons(self):
+        """Return the HDFS daemons of the cluster.
+
+        Returns (list of tuple):
+          The pairs (daemon name, list of hosts) in starting order.
+        """
+
+        return [("NameNode", [self.master]),
+                ("SecondaryNameNode", [self.master]),
+                ("DataNode", self.hosts)]
+
+    def _get_mr_daemons(self):
+        """Return the MapReduce daemons of the cluster.
+
+        Returns (list of tuple):
+          The pairs (daemon name, list of hosts) in starting order.
+        """
+
+        return [("JobTracker", [self.master]),
+                ("TaskTracker", self.hosts)]
+
+    def _get_http_ports(self):
+        """Return the ports of the web interfaces of the master daemons.
+
+        Returns (dict of str: int):
+          The port of each master daemon.
+        """
+
+        return {"NameNode": DEFAULT_NAMENODE_HTTP_PORT,
+                "JobTracker": DEFAULT_JOBTRACKER_HTTP_PORT}
+
+    def refresh_state(self, force=False):
+        """Query the Hadoop daemons actually running in the cluster.
+
+        jps is executed in parallel in all the hosts and the web interfaces of
+        the master daemons are checked. The result is cached during
+        state_ttl seconds and the running flags of the cluster are updated
+        accordingly.
+
+        Args:
+          force (bool, optional):
+            If True, the cached state is ignored.
+
+        Returns (dict of Host: set of str):
+          The names of the Hadoop daemons running in each host.
+        """
+
+        if (not force and self._state is not None and
+                time.time() - self._state_time < self.state_ttl):
+            return self._state
+
+        daemon_names = set(name for (name, _) in
+                           self._get_dfs_daemons() + self._get_mr_daemons())
+
+        jps = get_remote("jps -v", self.hosts)
+        for p in jps.processes:
+            p.nolog_exit_code = p.nolog_error = True
+        jps.run()
+
+        state = {}
+        for h in self.hosts:
+            state[h] = set()
+        for p in jps.processes:
+            for line in p.stdout.splitlines():
+                fields = line.split()
+                if len(fields) < 2 or fields[1] not in daemon_names:
+                    continue
+                # Virtual hosts share jps: keep only their own daemons
+                if self.local and \
+                        expand_path(self.logs_dir, p.host) not in line:
+                    continue
+                state[p.host].add(fields[1])
+
+        # A master daemon is only considered running if it serves requests
+        http_ports = dict((d, p) for (d, p) in self._get_http_ports().items()
+                          if d in state[self.master])
+        if http_ports:
+            command = " ; ".join(
+                "(bash -c 'echo > /dev/tcp/localhost/" + str(p) + "') " +
+                "2>/dev/null && echo " + d
+                for (d, p) in http_ports.items())
+            check = get_process(command, self.master)
+            check.nolog_exit_code = check.nolog_error = True
+            check.run()
+            serving = set(check.stdout.split())
+            for d in http_ports:
+                if d not in serving:
+                    logger.warn(d + " is running but its web interface does "
+                                "not respond")
+                    state[self.master].discard(d)
+
+        self._state = state
+        self._state_time = time.time()
+        self._update_running_flags(state)
+
+        return state
+
+    def _invalidate_state(self):
+        """Discard the cached daemon state."""
+
+        self._state = None
+
+    def _update_running_flags(self, state):
+        """Update the running flags of the cluster with the given state.
+
+        Args:
+          state (dict of Host: set of str):
+            The names of the Hadoop daemons running in each host.
+        """
+
+        self.running_dfs = "NameNode" in state[self.master]
+        self.running_map_reduce = "JobTracker" in state[self.master]
+        self.running = self.running_dfs and self.running_map_reduce
+
+    def _get_missing_daemons(self, daemons):
+        """Return the daemons that should be running but are not.
+
+        Args:
+          daemons (list of tuple):
+            The pairs (daemon name, list of hosts) to be checked.
+
+        Returns (list of tuple):
+          The pairs (daemon name, list of hosts where it is not running) in
+          the same order, excluding the daemons running everywhere.
+        """
+
+        state = self.refresh_state()
+
+        missing = []
+        for (name, hosts) in daemons:
+            missing_hosts = [h for h in hosts if name not in state[h]]
+            if missing_hosts:
+                missing.append((name, missing_hosts))
+        return missing
+
+    def _get_running_daemons(self, daemons):
+        """Return the daemons that are running.
+
+        Args:
+          daemons (list of tuple):
+            The pairs (daemon name, list of hosts) to be checked.
+
+        Returns (list of tuple):
+          The pairs (daemon name, list of hosts where it is running) in the
+          same order, excluding the daemons not running anywhere.
+        """
+
+        state = self.refresh_state()
+
+        running = []
+        for (name, hosts) in daemons:
+            running_hosts = [h for h in hosts if name in state[h]]
+            if running_hosts:
+                running.append((name, running_hosts))
+        return running
+
+    def _get_daemons_action(self, script, action, daemons):
+        """Return an action that starts or stops the given daemons one by one.
+
+        The cluster scripts (start-dfs.sh, etc.) launch the daemons in all the
+        slaves through ssh with a common configuration. This action is used
+        instead for virtual hosts, which need their own configuration, and to
+        manage only a subset of the daemons.
+
+        Args:
+          script (str):
+            The path of the script used to manage the daemons.
+          action (str):
+            Either "start" or "stop".
+          daemons (list of tuple):
+            The pairs (daemon name, list of hosts) in the order in which they
+            should be managed.
+
+        Returns (SequentialActions):
+          The action managing the daemons.
+        """
+
+        return SequentialActions([
+            get_remote(script + " --config " + self.conf_dir + " " +
+                       action + " " + name.lower(), hosts)
+            for (name, hosts) in daemons])
+
     def execute(self, command, node=None, should_be_running=True,
                 verbose=True):
         """Execute the given Hadoop command in the given node.
@@ -648,9 +1259,12 @@ class HadoopCluster(object):
 
         self._check_initialization()
 
-        if should_be_running and not self.running:
-            logger.warn("The cluster was stopped. Starting it automatically")
-            self.start()
+        if should_be_running:
+            self.refresh_state()
+            if not self.running:
+                logger.warn("The cluster was stopped. Starting it "
+                            "automatically")
+                self.start()
 
         if not node:
             node = self.master
@@ -659,7 +1273,7 @@ class HadoopCluster(object):
             logger.info("Executing {" + self.bin_dir + "/hadoop " +
                         command + "} in " + str(node))
 
-        proc = SshProcess(self.bin_dir + "/hadoop " + command, node)
+        proc = get_process(self.bin_dir + "/hadoop " + command, node)
 
         if verbose:
             red_color = '\033[01;31m'
@@ -673,6 +1287,420 @@ class HadoopCluster(object):
 
         return (proc.stdout, proc.stderr)
 
+    def stream_to_dfs(self, local_file, dest, node=None, length=None,
+                      filter_command=None, replication=None):
+        """Copy a local file into the dfs through the given node. The file is
+        piped into the standard input of fs -put, so it is never stored in the
+        node's disk.
+
+        Args:
+          local_file (str):
+            The path of the local file.
+          dest (str):
+            The dfs path of the new file.
+          node (Host, optional):
+            The host were the command should be executed. If not provided,
+            self.master is chosen.
+          length (int, optional):
+            If indicated, only the given number of bytes from the beginning of
+            the file are copied.
+          filter_command (str, optional):
+            A shell command executed in the node which transforms the stream
+            before it is stored (e.g., a decompressor).
+          replication (int, optional):
+            The replication factor of the new file. The default one if not
+            indicated.
+
+        Returns (int):
+          The number of bytes stored in the dfs, or None if the copy failed.
+        """
+
+        self._check_initialization()
+
+        if not node:
+            node = self.master
+
+        command = self.bin_dir + "/hadoop " + \
+            self.get_put_command("-", dest, replication)
+        if filter_command:
+            # The filtered stream is also sent to wc through fd 3 to count
+            # the bytes actually stored
+            command = "bash -c " + pipes.quote(
+                "set -o pipefail; { " + filter_command + " | tee /dev/fd/3 | " +
+                command + " >&2 ; } 3>&1 | wc -c")
+
+        proc = get_stream_process(local_file, command, node, length)
+        proc.run()
+
+        if not proc.finished_ok:
+            logger.warn("Error while copying " + local_file + " into " + dest +
+                        " through " + str(node))
+            return None
+
+        if filter_command:
+            return int(proc.stdout.split()[-1])
+        elif length is not None:
+            return length
+        else:
+            return os.path.getsize(local_file)
+
+    def put_node_file(self, src, dest, node=None, replication=None):
+        """Copy a file stored in a node into the dfs.
+
+        Args:
+          src (str):
+            The path of the file in the node.
+          dest (str):
+            The dfs path of the new file.
+          node (Host, optional):
+            The host were the file is stored. If not provided, self.master is
+            chosen.
+          replication (int, optional):
+            The replication factor of the new file. The default one if not
+            indicated.
+
+        Returns (bool):
+          True if the file was stored, False otherwise.
+        """
+
+        self._check_initialization()
+
+        if not node:
+            node = self.master
+
+        proc = get_process(self.bin_dir + "/hadoop " +
+                           self.get_put_command(src, dest, replication), node)
+        proc.nolog_exit_code = True
+        proc.run()
+
+        if not proc.finished_ok:
+            logger.warn("Error while storing " + src + " of " + str(node) +
+                        " into " + dest + ": " + proc.stderr.strip())
+            return False
+        return True
+
+    def pipe_to_dfs(self, command, dest, node=None, replication=None):
+        """Store the output of a command into a dfs file. The command is
+        executed in the given node and its output is piped into fs -put, so it
+        is never stored in the node's disk.
+
+        Args:
+          command (str):
+            The shell command producing the data.
+          dest (str):
+            The dfs path of the new file.
+          node (Host, optional):
+            The host were the command should be executed. If not provided,
+            self.master is chosen.
+          replication (int, optional):
+            The replication factor of the new file. The default one if not
+            indicated.
+
+        Returns (bool):
+          True if the file was stored, False otherwise.
+        """
+
+        self._check_initialization()
+
+        if not node:
+            node = self.master
+
+        proc = get_process(
+            "bash -c " + pipes.quote(
+                "set -o pipefail; " + command + " | " + self.bin_dir +
+                "/hadoop " + self.get_put_command("-", dest, replication)),
+            node)
+        proc.nolog_exit_code = True
+        proc.run()
+
+        if not proc.finished_ok:
+            logger.warn("Error while storing the output of {" + command +
+                        "} into " + dest + " through " + str(node) + ": " +
+                        proc.stderr.strip())
+            return False
+        return True
+
+    def stream_output_to_dfs(self, local_command, dest, node=None,
+                             replication=None):
+        """Store the output of a local command into a dfs file through the
+        given node. The output is piped into the standard input of fs -put, so
+        it is never stored in the node's disk.
+
+        Args:
+          local_command (str):
+            The shell command producing the data, executed locally.
+          dest (str):
+            The dfs path of the new file.
+          node (Host, optional):
+            The host were fs -put should be executed. If not provided,
+            self.master is chosen.
+          replication (int, optional):
+            The replication factor of the new file. The default one if not
+            indicated.
+
+        Returns (bool):
+          True if the file was stored, False otherwise.
+        """
+
+        self._check_initialization()
+
+        if not node:
+            node = self.master
+
+        proc = get_pipe_process(
+            local_command,
+            self.bin_dir + "/hadoop " +
+            self.get_put_command("-", dest, replication), node)
+        proc.nolog_exit_code = True
+        proc.run()
+
+        if not proc.finished_ok:
+            logger.warn("Error while storing the output of {" +
+                        local_command + "} into " + dest + " through " +
+                        str(node) + ": " + proc.stderr.strip())
+            return False
+        return True
+
+    def get_put_command(self, src, dest, replication=None):
+        """Return the Hadoop command copying a file into the dfs.
+
+        Args:
+          src (str):
+            The path of the file in the node, or - for the standard input.
+          dest (str):
+            The dfs path of the new file.
+          replication (int, optional):
+            The replication factor of the new file. The default one if not
+            indicated.
+        """
+
+        command = "fs "
+        if replication:
+            command += "-D dfs.replication=" + str(replication) + " "
+        return command + "-put " + src + " " + dest
+
+    def get_dfs_replication(self):
+        """Return the default replication factor of dfs files."""
+
+        value = self.get_conf(["dfs.replication"]).get("dfs.replication")
+        if value:
+            return int(value)
+        return DEFAULT_REPLICATION
+
+    def set_dfs_replication(self, path, replication, wait=True, node=None):
+        """Change the replication factor of the files under a dfs path. The
+        NameNode creates or removes the replicas asynchronously.
+
+        Args:
+          path (str):
+            The dfs path.
+          replication (int):
+            The new replication factor.
+          wait (bool, optional):
+            If False, the method returns as soon as the command is launched.
+          node (Host, optional):
+            The host were the command should be executed. If not provided,
+            self.master is chosen.
+
+        Returns (Process):
+          The process executing setrep, which is still running if wait is
+          False.
+        """
+
+        self._check_initialization()
+
+        if not node:
+            node = self.master
+
+        proc = get_process(self.bin_dir + "/hadoop fs -setrep -R " +
+                           str(replication) + " " + path, node)
+        proc.nolog_exit_code = True
+        proc.start()
+        if wait:
+            proc.wait()
+        return proc
+
+    def get_under_replicated_blocks(self, path):
+        """Return the number of blocks under a dfs path with fewer replicas
+        than their replication factor.
+
+        Args:
+          path (str):
+            The dfs path.
+
+        Returns (int):
+          The number of under-replicated blocks, or None if it could not be
+          obtained.
+        """
+
+        (stdout, _) = self.execute("fsck " + path, verbose=False)
+        return parse_under_replicated_blocks(stdout)
+
+    def wait_for_replication(self, path,
+                             interval=DEFAULT_REPLICATION_CHECK_INTERVAL,
+                             timeout=None):
+        """Wait until all the blocks under a dfs path have reached their
+        replication factor.
+
+        Args:
+          path (str):
+            The dfs path.
+          interval (float, optional):
+            The seconds between two checks.
+          timeout (float, optional):
+            The maximum number of seconds to wait. Unlimited if not indicated.
+
+        Returns (bool):
+          True if the blocks are fully replicated, False otherwise.
+        """
+
+        start = time.time()
+        while True:
+            under_replicated = self.get_under_replicated_blocks(path)
+            if under_replicated == 0:
+                return True
+            if under_replicated is None:
+                logger.warn("Could not obtain the replication of " + path)
+                return False
+            if timeout is not None and time.time() - start > timeout:
+                logger.warn(str(under_replicated) + " blocks of " + path +
+                            " are still under-replicated")
+                return False
+            logger.debug(str(under_replicated) + " blocks of " + path +
+                         " under-replicated")
+            time.sleep(interval)
+
+    def create_dfs_dirs(self, paths):
+        """Create the given directories in the dfs, including their parents.
+
+        Args:
+          paths (list of str):
+            The dfs paths of the directories.
+        """
+
+        if paths:
+            self.execute("fs -mkdir " + " ".join(paths), verbose=False)
+
+    def get_dfs_size(self, path):
+        """Return the total size of the files under the given dfs path.
+
+        Args:
+          path (str):
+            The dfs path.
+
+        Returns (int):
+          The size in bytes, or None if it could not be obtained.
+        """
+
+        (stdout, _) = self.execute(self._get_du_command(path), verbose=False)
+        for line in stdout.splitlines():
+            for field in line.split():
+                if field.isdigit():
+                    return int(field)
+        return None
+
+    def _get_du_command(self, path):
+        return "fs -dus " + path
+
+    def get_dfs_file_lengths(self, path):
+        """Return the length of the files under the given dfs path.
+
+        Args:
+          path (str):
+            The dfs path.
+
+        Returns (dict of str: int):
+          The length of each file, identified by its path.
+        """
+
+        (stdout, _) = self.execute(self._get_lsr_command(path), verbose=False)
+        return parse_ls(stdout)
+
+    def _get_lsr_command(self, path):
+        return "fs -lsr " + path
+
+    def get_dfs_checksums(self, paths):
+        """Return the checksums of the given dfs files. They are only
+        comparable with checksums computed by the dfs with the same block
+        size.
+
+        Args:
+          paths (list of str):
+            The dfs paths of the files.
+
+        Returns (dict of str: str):
+          The checksum of each file, or an empty dictionary if the version of
+          Hadoop does not provide checksums.
+        """
+
+        return {}
+
+    def get_dfs_block_size(self):
+        """Return the size of the blocks of new dfs files."""
+
+        (name, default) = self._get_block_size_conf()
+        value = self.get_conf([name]).get(name)
+        if not value:
+            return default
+
+        # Hadoop 2 accepts size suffixes
+        value = value.strip().lower()
+        multiplier = 1
+        for (idx, suffix) in enumerate("kmgtpe"):
+            if value.endswith(suffix):
+                multiplier = 1024 ** (idx + 1)
+                value = value[:-1]
+                break
+        return int(value) * multiplier
+
+    def _get_block_size_conf(self):
+        return ("dfs.block.size", 67108864)
+
+    def get_dfs_md5(self, path, node=None):
+        """Return the md5 checksum of the contents of a dfs file. Unlike the
+        checksums of fs -checksum, it can be compared with the checksum of a
+        local file, but the whole file is read.
+
+        Args:
+          path (str):
+            The dfs path of the file.
+          node (Host, optional):
+            The host were the file is read. If not provided, self.master is
+            chosen.
+
+        Returns (str):
+          The hexadecimal checksum, or None if the file could not be read.
+        """
+
+        self._check_initialization()
+
+        if not node:
+            node = self.master
+
+        proc = get_process(
+            "bash -c " + pipes.quote("set -o pipefail; " + self.bin_dir +
+                                     "/hadoop fs -cat " + path + " | md5sum"),
+            node)
+        proc.nolog_exit_code = True
+        proc.run()
+
+        if not proc.finished_ok or not proc.stdout.split():
+            return None
+        return proc.stdout.split()[0]
+
+    def get_map_slots(self):
+        """Return the number of map tasks that can be executed at the same
+        time in the cluster."""
+
+        name = "mapred.tasktracker.map.tasks.maximum"
+        slots_per_host = self.get_conf([name]).get(name)
+        if slots_per_host:
+            slots_per_host = int(slots_per_host)
+        else:
+            slots_per_host = 2  # Hadoop's default
+
+        return slots_per_host * len(self.hosts)
+
     def execute_job(self, job, node=None, verbose=True):
         """Execute the given MapReduce job in the specified node.
         
@@ -690,8 +1718,30 @@ class HadoopCluster(object):
           the job.
         """
 
+        proc = self.start_job(job, node, verbose)
+        return self.wait_job(job, proc)
+
+    def start_job(self, job, node=None, verbose=True):
+        """Submit the given MapReduce job in the specified node without
+        waiting for it to finish, so that several jobs can run at the same
+        time.
+
+        Args:
+          job (HadoopJarJob):
+            The job object.
+          node (Host, optional):
+            The host were the command should be executed. If not provided,
+            self.master is chosen.
+          verbose (bool, optional):
+            If True stdout and stderr of remote process is displayed.
+
+        Returns (Process):
+          The process executing the job, to be passed to wait_job().
+        """
+
         self._check_initialization()
 
+        self.refresh_state()
         if not self.running:
             logger.warn("The cluster was stopped. Starting it automatically")
             self.start()
@@ -703,7 +1753,7 @@ class HadoopCluster(object):
 
         # Copy necessary files to cluster
         files_to_copy = job.get_files_to_copy()
-        action = Put([node], files_to_copy, exec_dir)
+        action = get_put([node], files_to_copy, exec_dir)
         action.run()
 
         # Get command
@@ -713,7 +1763,7 @@ class HadoopCluster(object):
         logger.info("Executing jar job. Command = {" + self.bin_dir +
                     "/hadoop " + command + "} in " + str(node))
 
-        proc = SshProcess(self.bin_dir + "/hadoop " + command, node)
+        proc = get_process(self.bin_dir + "/hadoop " + command, node)
 
         if verbose:
             red_color = '\033[01;31m'
@@ -723,6 +1773,23 @@ class HadoopCluster(object):
                 ColorDecorator(sys.stderr, red_color))
 
         proc.start()
+        return proc
+
+    def wait_job(self, job, proc):
+        """Wait for a job started with start_job() to finish and update its
+        information.
+
+        Args:
+          job (HadoopJarJob):
+            The job object.
+          proc (Process):
+            The process executing the job.
+
+        Returns (tuple of str):
+          A tuple with the standard and error outputs of the process executing
+          the job.
+        """
+
         proc.wait()
 
         # Get job info
@@ -730,7 +1797,8 @@ class HadoopCluster(object):
         job.stderr = proc.stderr
         job.success = (proc.exit_code == 0)
 
-        for line in job.stdout.splitlines():
+        # Hadoop 2 clients log the job id to the standard error
+        for line in (job.stdout + job.stderr).splitlines():
             if "Running job" in line:
                 if "mapred.JobClient" in line or "mapreduce.Job" in line:
                     # TODO: more possible formats?
@@ -762,19 +1830,19 @@ class HadoopCluster(object):
         history_dir = os.path.join(self.logs_dir, "history")
         if job_ids:
             pattern = " -o ".join("-name " + jid + "*" for jid in job_ids)
-            list_dirs = SshProcess("find " + history_dir + " " + pattern,
-                                   self.master)
+            list_dirs = get_process("find " + history_dir + " " + pattern,
+                                    self.master)
             list_dirs.run()
         else:
-            list_dirs = SshProcess("find " + history_dir + " -name job_*",
-                                   self.master)
+            list_dirs = get_process("find " + history_dir + " -name job_*",
+                                    self.master)
             list_dirs.run()
 
         remote_files = []
         for line in list_dirs.stdout.splitlines():
             remote_files.append(line)
 
-        action = Get([self.master], remote_files, dest)
+        action = get_get([self.master], remote_files, dest)
         action.run()
 
     def clean_history(self):
@@ -788,8 +1856,8 @@ class HadoopCluster(object):
             self.stop()
             restart = True
 
-        action = Remote("rm -rf " + self.logs_dir + "/history",
-                        [self.master])
+        action = get_remote("rm -rf " + self.logs_dir + "/history",
+                            [self.master])
         action.run()
 
         if restart:
@@ -811,7 +1879,7 @@ class HadoopCluster(object):
             self.stop()
             restart = True
 
-        action = Remote("rm -rf " + self.logs_dir + "/*", self.hosts)
+        action = get_remote("rm -rf " + self.logs_dir + "/*", self.hosts)
         action.run()
 
         if restart:
@@ -831,8 +1899,8 @@ class HadoopCluster(object):
             self.stop()
             restart = True
 
-        action = Remote("rm -rf " + self.hadoop_temp_dir + " /tmp/hadoop-" +
-                        getpass.getuser() + "-*", self.hosts)
+        action = get_remote("rm -rf " + self.hadoop_temp_dir + " /tmp/hadoop-" +
+                            getpass.getuser() + "-*", self.hosts)
         action.run()
 
         if restart:
@@ -866,7 +1934,7 @@ class HadoopCluster(object):
 
         force_kill = False
         for h in self.hosts:
-            proc = SshProcess("jps", self.master)
+            proc = get_process("jps", self.master)
             proc.run()
 
             ids_to_kill = []
@@ -881,7 +1949,7 @@ class HadoopCluster(object):
                 for pid in ids_to_kill:
                     ids_to_kill_str += " " + pid
 
-                proc = SshProcess("kill -9" + ids_to_kill_str, h)
+                proc = get_process("kill -9" + ids_to_kill_str, h)
                 proc.run()
 
         if force_kill:
@@ -898,9 +1966,9 @@ class HadoopCluster(object):
           The version used by the Hadoop cluster.
         """
 
-        proc = SshProcess("export JAVA_HOME=" + self.java_home + ";" +
-                          self.bin_dir + "/hadoop version",
-                          self.master)
+        proc = get_process("export JAVA_HOME=" + self.java_home + ";" +
+                           self.bin_dir + "/hadoop version",
+                           self.master)
         proc.run()
         version = proc.stdout.splitlines()[0]
         return version
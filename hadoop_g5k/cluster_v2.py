@@ -3,31 +3,63 @@ import os
 import shutil
 import tempfile
 
-from execo import Get, Remote
-from execo.process import SshProcess
 from execo_engine import logger
-from execo_g5k import get_host_attributes
 
 from hadoop_g5k.cluster import HadoopCluster
-from hadoop_g5k.util import replace_in_xml_file
+from hadoop_g5k.dfs import parse_checksums
+from hadoop_g5k.local import expand_path, get_local_port, \
+    get_host_attributes, get_process, get_remote, get_get
+from hadoop_g5k.properties import V2_PROPERTIES
+from hadoop_g5k.util import replace_in_xml_file, create_xml_file
 
 # Configuration files
 CORE_CONF_FILE = "core-site.xml"
 HDFS_CONF_FILE = "hdfs-site.xml"
 MR_CONF_FILE = "mapred-site.xml"
 YARN_CONF_FILE = "yarn-site.xml"
+CAPACITY_SCHEDULER_CONF_FILE = "capacity-scheduler.xml"
+FAIR_SCHEDULER_CONF_FILE = "fair-scheduler.xml"
 
 # Default parameters
 DEFAULT_HADOOP_BASE_DIR = "/tmp/hadoop"
 DEFAULT_HADOOP_CONF_DIR = DEFAULT_HADOOP_BASE_DIR + "/etc/hadoop"
 DEFAULT_HADOOP_LOGS_DIR = DEFAULT_HADOOP_BASE_DIR + "/logs"
 DEFAULT_HADOOP_TEMP_DIR = DEFAULT_HADOOP_BASE_DIR + "/tmp"
+DEFAULT_HADOOP_SNAPSHOTS_DIR = "/tmp/hadoop_snapshots"
 
 DEFAULT_HADOOP_HDFS_PORT = 54310
 DEFAULT_HADOOP_MR_PORT = 54311
 
 DEFAULT_HADOOP_LOCAL_CONF_DIR = "conf"
 
+# Default ports of the web interfaces of the master daemons
+DEFAULT_NAMENODE_HTTP_PORT = 50070
+DEFAULT_RESOURCEMANAGER_HTTP_PORT = 8088
+
+# Default ports of the slave daemons
+DEFAULT_NODEMANAGER_PORT = 8041
+DEFAULT_NODEMANAGER_LOCALIZER_PORT = 8040
+DEFAULT_NODEMANAGER_WEBAPP_PORT = 8042
+DEFAULT_SHUFFLE_PORT = 13562
+
+# Maximum number of dfs files passed to a single command
+MAX_FILES_PER_COMMAND = 100
+
+# YARN schedulers
+CAPACITY_SCHEDULER = "capacity"
+FAIR_SCHEDULER = "fair"
+
+SCHEDULER_CLASSES = {
+    CAPACITY_SCHEDULER: "org.apache.hadoop.yarn.server.resourcemanager."
+                        "scheduler.capacity.CapacityScheduler",
+    FAIR_SCHEDULER: "org.apache.hadoop.yarn.server.resourcemanager."
+                    "scheduler.fair.FairScheduler"
+}
+
+# Fraction of the resources of a queue that ApplicationMasters can use, so
+# that several jobs can run at the same time
+DEFAULT_MAX_AM_RESOURCE_PERCENT = 0.5
+
 
 class HadoopV2Cluster(HadoopCluster):
     """This class manages the whole life-cycle of a Hadoop cluster with version
@@ -40,6 +72,13 @@ class HadoopV2Cluster(HadoopCluster):
 
     # Cluster state
     running_yarn = False    
+
+    # Classification of the configuration properties
+    properties = V2_PROPERTIES
+
+    # YARN scheduler and queues, configured when the cluster is initialized
+    scheduler = None
+    queues = None
     
     # Default properties
     defaults = {
@@ -47,6 +86,7 @@ class HadoopV2Cluster(HadoopCluster):
         "hadoop_conf_dir": DEFAULT_HADOOP_CONF_DIR,
         "hadoop_logs_dir": DEFAULT_HADOOP_LOGS_DIR,
         "hadoop_temp_dir": DEFAULT_HADOOP_TEMP_DIR,
+        "hadoop_snapshots_dir": DEFAULT_HADOOP_SNAPSHOTS_DIR,
         "hdfs_port": str(DEFAULT_HADOOP_HDFS_PORT),
         "mapred_port": str(DEFAULT_HADOOP_MR_PORT),
 
@@ -99,7 +139,8 @@ class HadoopV2Cluster(HadoopCluster):
         remote_missing_files = [os.path.join(self.conf_dir, f)
                                 for f in missing_conf_files]
 
-        action = Get([self.master], remote_missing_files, self.temp_conf_dir)
+        action = get_get([self.master], remote_missing_files,
+                         self.temp_conf_dir)
         action.run()
 
     def _configure_servers(self, hosts=None):
@@ -130,10 +171,11 @@ class HadoopV2Cluster(HadoopCluster):
                             True)
         replace_in_xml_file(os.path.join(self.temp_conf_dir, CORE_CONF_FILE),
                             "hadoop.tmp.dir",
-                            self.hadoop_temp_dir, True)
+                            expand_path(self.hadoop_temp_dir, hosts[0]), True)
         replace_in_xml_file(os.path.join(self.temp_conf_dir, CORE_CONF_FILE),
                             "topology.script.file.name",
-                            self.conf_dir + "/topo.sh", True)
+                            expand_path(self.conf_dir, hosts[0]) + "/topo.sh",
+                            True)
 
         replace_in_xml_file(os.path.join(self.temp_conf_dir, MR_CONF_FILE),
                             "mapreduce.framework.name", "yarn", True)
@@ -170,6 +212,133 @@ class HadoopV2Cluster(HadoopCluster):
                             "yarn.nodemanager.aux-services",
                             "mapreduce_shuffle", True)
 
+        if self.scheduler:
+            self._configure_scheduler(hosts[0])
+
+        if self.local:
+            self._configure_local_ports(hosts[0])
+
+    def set_queues(self, queues, scheduler=CAPACITY_SCHEDULER):
+        """Define the queues of the YARN scheduler. They are configured the
+        next time the cluster is initialized. Jobs are submitted to a queue
+        with the mapreduce.job.queuename property, and to the first one if
+        they do not give it.
+
+        Args:
+          queues (list of tuple):
+            The name and weight of each queue. Each queue receives a share of
+            the resources proportional to its weight, and can use the
+            resources left idle by the others.
+          scheduler (str, optional):
+            The scheduler: "capacity" or "fair".
+        """
+
+        if scheduler not in SCHEDULER_CLASSES:
+            raise ValueError("Unknown scheduler " + scheduler + ". Supported "
+                             "schedulers are " +
+                             ", ".join(sorted(SCHEDULER_CLASSES)))
+        if not queues:
+            raise ValueError("At least one queue should be given")
+
+        self.scheduler = scheduler
+        self.queues = [(name, float(weight)) for (name, weight) in queues]
+
+    def _configure_scheduler(self, host):
+        """Configure the scheduler of the ResourceManager and its queues."""
+
+        yarn_file = os.path.join(self.temp_conf_dir, YARN_CONF_FILE)
+        replace_in_xml_file(yarn_file,
+                            "yarn.resourcemanager.scheduler.class",
+                            SCHEDULER_CLASSES[self.scheduler], True)
+
+        total_weight = sum(weight for (_, weight) in self.queues)
+
+        if self.scheduler == CAPACITY_SCHEDULER:
+            conf_file = os.path.join(self.temp_conf_dir,
+                                     CAPACITY_SCHEDULER_CONF_FILE)
+            create_xml_file(conf_file)
+
+            prefix = "yarn.scheduler.capacity.root"
+            replace_in_xml_file(conf_file, prefix + ".queues",
+                                ",".join(name for (name, _) in self.queues),
+                                True)
+            replace_in_xml_file(conf_file,
+                                "yarn.scheduler.capacity."
+                                "maximum-am-resource-percent",
+                                str(DEFAULT_MAX_AM_RESOURCE_PERCENT), True)
+
+            # Capacities are percentages that should add up to 100
+            assigned = 0.0
+            for (idx, (name, weight)) in enumerate(self.queues):
+                if idx == len(self.queues) - 1:
+                    capacity = 100.0 - assigned
+                else:
+                    capacity = round(100.0 * weight / total_weight, 2)
+                assigned += capacity
+
+                queue = prefix + "." + name
+                replace_in_xml_file(conf_file, queue + ".capacity",
+                                    "%.2f" % capacity, True)
+                replace_in_xml_file(conf_file, queue + ".maximum-capacity",
+                                    "100", True)
+                replace_in_xml_file(conf_file, queue + ".user-limit-factor",
+                                    str(int(100.0 / max(capacity, 1)) + 1),
+                                    True)
+                replace_in_xml_file(conf_file, queue + ".state", "RUNNING",
+                                    True)
+        else:
+            conf_file = os.path.join(self.temp_conf_dir,
+                                     FAIR_SCHEDULER_CONF_FILE)
+            with open(conf_file, "w") as f:
+                f.write("<?xml version=\"1.0\"?>\n<allocations>\n")
+                for (name, weight) in self.queues:
+                    f.write("  <queue name=\"" + name + "\"><weight>" +
+                            str(weight) + "</weight></queue>\n")
+                f.write("</allocations>\n")
+
+            replace_in_xml_file(yarn_file,
+                                "yarn.scheduler.fair.allocation.file",
+                                expand_path(self.conf_dir, host) + "/" +
+                                FAIR_SCHEDULER_CONF_FILE, True)
+
+        # The default queue is not declared, so jobs not naming a queue are
+        # submitted to the first one
+        replace_in_xml_file(os.path.join(self.temp_conf_dir, MR_CONF_FILE),
+                            "mapreduce.job.queuename", self.queues[0][0],
+                            True)
+
+        logger.info("Configured " + self.scheduler + " scheduler with queues " +
+                    ", ".join(name + " (" + str(weight) + ")"
+                              for (name, weight) in self.queues))
+
+    def _configure_local_ports(self, host):
+        """Assign the ports of the DataNode and NodeManager of a virtual host,
+        so that several of them can run in the same machine.
+
+        Args:
+          host (LocalHost):
+            The virtual host to be configured.
+        """
+
+        super(HadoopV2Cluster, self)._configure_local_ports(host)
+
+        ports = {
+            "yarn.nodemanager.address": DEFAULT_NODEMANAGER_PORT,
+            "yarn.nodemanager.localizer.address":
+                DEFAULT_NODEMANAGER_LOCALIZER_PORT,
+            "yarn.nodemanager.webapp.address": DEFAULT_NODEMANAGER_WEBAPP_PORT
+        }
+        for name, port in ports.iteritems():
+            replace_in_xml_file(os.path.join(self.temp_conf_dir,
+                                             YARN_CONF_FILE),
+                                name,
+                                "0.0.0.0:" + str(get_local_port(port, host)),
+                                True)
+        replace_in_xml_file(os.path.join(self.temp_conf_dir, MR_CONF_FILE),
+                            "mapreduce.shuffle.port",
+                            str(get_local_port(DEFAULT_SHUFFLE_PORT, host)),
+                            True)
+
     def bootstrap(self, tar_file):
         """Install Hadoop in all cluster nodes from the specified tar.gz file.
 
@@ -179,12 +348,21 @@ class HadoopV2Cluster(HadoopCluster):
         """
 
         if super(HadoopV2Cluster, self).bootstrap(tar_file):
-            action = Remote("cp " + os.path.join(self.conf_dir,
-                                                 MR_CONF_FILE + ".template ") +
-                            os.path.join(self.conf_dir, MR_CONF_FILE),
-                            self.hosts)
+            action = get_remote("cp " + os.path.join(self.conf_dir,
+                                                     MR_CONF_FILE +
+                                                     ".template ") +
+                                os.path.join(self.conf_dir, MR_CONF_FILE),
+                                self.hosts)
             action.run()
 
+            if self.local:
+                command = "cat >> " + self.conf_dir + "/yarn-env.sh << EOF\n"
+                command += "export YARN_LOG_DIR=" + self.logs_dir + "\n"
+                command += "export YARN_PID_DIR=" + self.hadoop_temp_dir + "\n"
+                command += "EOF"
+                action = get_remote(command, self.hosts)
+                action.run()
+
     def _check_version_compliance(self):
         version = self.get_version()
         if not version.startswith("Hadoop 2."):
@@ -219,14 +397,26 @@ class HadoopV2Cluster(HadoopCluster):
         self.running = True
 
     def start_yarn(self):
-        """Start the YARN ResourceManager and NodeManagers."""
+        """Start the YARN ResourceManager and NodeManagers. If some of them are
+        already running, only the missing daemons are started."""
 
         logger.info("Starting YARN")
         
         self._check_initialization()
-        
-        proc = SshProcess(self.sbin_dir + "/start-yarn.sh", self.master)
-        proc.run()        
+
+        missing_daemons = self._get_missing_daemons(self._get_mr_daemons())
+        if not missing_daemons:
+            logger.warn("YARN was already started")
+            self.running_yarn = True
+            return
+
+        if self.local or self.running_yarn:
+            proc = self._get_daemons_action(
+                self.sbin_dir + "/yarn-daemon.sh", "start", missing_daemons)
+        else:
+            proc = get_process(self.sbin_dir + "/start-yarn.sh", self.master)
+        proc.run()
+        self._invalidate_state()
         
         if not proc.finished_ok:
             logger.warn("Error while starting YARN")
@@ -257,14 +447,27 @@ class HadoopV2Cluster(HadoopCluster):
         self.running = False        
         
     def stop_yarn(self):
-        """Stop the YARN ResourceManager and NodeManagers."""
+        """Stop the YARN ResourceManager and NodeManagers. Nothing is done if
+        none of them is running."""
         
         self._check_initialization()
 
         logger.info("Stopping YARN")
 
-        proc = SshProcess(self.sbin_dir + "/stop-yarn.sh", self.master)
+        running_daemons = self._get_running_daemons(self._get_mr_daemons())
+        if not running_daemons:
+            logger.warn("YARN was already stopped")
+            self.running_yarn = False
+            return
+
+        if self.local:
+            proc = self._get_daemons_action(
+                self.sbin_dir + "/yarn-daemon.sh", "stop",
+                list(reversed(running_daemons)))
+        else:
+            proc = get_process(self.sbin_dir + "/stop-yarn.sh", self.master)
         proc.run()
+        self._invalidate_state()
         
         if not proc.finished_ok:
             logger.warn("Error while stopping YARN")
@@ -277,6 +480,110 @@ class HadoopV2Cluster(HadoopCluster):
         logger.warn("MapReduce does not use any specific service in this "
                     "version of Hadoop.")
 
+    def _get_daemon_script(self, name):
+        """Return the path of the script managing the given daemon."""
+
+        if name in ["ResourceManager", "NodeManager"]:
+            return self.sbin_dir + "/yarn-daemon.sh"
+        return self.sbin_dir + "/hadoop-daemon.sh"
+
+    def _get_mr_daemons(self):
+        """Return the YARN daemons of the cluster, where MapReduce jobs run.
+
+        Returns (list of tuple):
+          The pairs (daemon name, list of hosts) in starting order.
+        """
+
+        return [("ResourceManager", [self.master]),
+                ("NodeManager", self.hosts)]
+
+    def _get_http_ports(self):
+        """Return the ports of the web interfaces of the master daemons.
+
+        Returns (dict of str: int):
+          The port of each master daemon.
+        """
+
+        return {"NameNode": DEFAULT_NAMENODE_HTTP_PORT,
+                "ResourceManager": DEFAULT_RESOURCEMANAGER_HTTP_PORT}
+
+    def _update_running_flags(self, state):
+        """Update the running flags of the cluster with the given state.
+
+        Args:
+          state (dict of Host: set of str):
+            The names of the Hadoop daemons running in each host.
+        """
+
+        self.running_dfs = "NameNode" in state[self.master]
+        self.running_yarn = "ResourceManager" in state[self.master]
+        self.running = self.running_dfs and self.running_yarn
+
+    def create_dfs_dirs(self, paths):
+        """Create the given directories in the dfs, including their parents.
+
+        Args:
+          paths (list of str):
+            The dfs paths of the directories.
+        """
+
+        if paths:
+            self.execute("fs -mkdir -p " + " ".join(paths), verbose=False)
+
+    def _get_block_size_conf(self):
+        return ("dfs.blocksize", 134217728)
+
+    def _get_du_command(self, path):
+        return "fs -du -s " + path
+
+    def _get_lsr_command(self, path):
+        return "fs -ls -R " + path
+
+    def get_dfs_checksums(self, paths):
+        """Return the checksums of the given dfs files. They are only
+        comparable with checksums computed by the dfs with the same block
+        size.
+
+        Args:
+          paths (list of str):
+            The dfs paths of the files.
+
+        Returns (dict of str: str):
+          The checksum of each file.
+        """
+
+        checksums = {}
+        for i in range(0, len(paths), MAX_FILES_PER_COMMAND):
+            (stdout, _) = self.execute(
+                "fs -checksum " +
+                " ".join(paths[i:i + MAX_FILES_PER_COMMAND]), verbose=False)
+            checksums.update(parse_checksums(stdout))
+        return checksums
+
+    def get_map_slots(self):
+        """Return the number of map tasks that can be executed at the same
+        time in the cluster, according to the memory and cores offered by
+        each NodeManager."""
+
+        # Hadoop's defaults
+        conf = {
+            "yarn.nodemanager.resource.memory-mb": 8192,
+            "yarn.nodemanager.resource.cpu-vcores": 8,
+            "mapreduce.map.memory.mb": 1024,
+            "mapreduce.map.cpu.vcores": 1
+        }
+        for (name, value) in self.get_conf(conf.keys()).items():
+            if value:
+                conf[name] = int(value)
+
+        slots_per_host = min(
+            conf["yarn.nodemanager.resource.memory-mb"] /
+            conf["mapreduce.map.memory.mb"],
+            conf["yarn.nodemanager.resource.cpu-vcores"] /
+            conf["mapreduce.map.cpu.vcores"])
+
+        return max(1, slots_per_host) * len(self.hosts)
+
     def copy_history(self, dest, job_ids=None):
         """Copy history logs from dfs.
 
@@ -300,12 +607,12 @@ class HadoopV2Cluster(HadoopCluster):
         hist_tmp_dir = "/tmp/hadoop_hist"
 
         # Remove file in tmp dir if exists
-        proc = SshProcess("rm -rf " + hist_tmp_dir, self.master)
+        proc = get_process("rm -rf " + hist_tmp_dir, self.master)
         proc.run()
 
         # Get files in master
         if job_ids:
-            proc = SshProcess("mkdir " + hist_tmp_dir, self.master)
+            proc = get_process("mkdir " + hist_tmp_dir, self.master)
             proc.run()
             for jid in job_ids:
                 self.execute("fs -get " + hist_dfs_dir + "/" + jid + "* " +
@@ -315,7 +622,7 @@ class HadoopV2Cluster(HadoopCluster):
                          verbose=False)
 
         # Copy files from master
-        action = Get([self.master], [hist_tmp_dir], dest)
+        action = get_get([self.master], [hist_tmp_dir], dest)
         action.run()
 
     def clean_history(self):
@@ -0,0 +1,580 @@
+"""This module provides the tools to pack small files into block-sized
+containers while they are loaded into the dfs, so that a dataset made of many
+small files does not become a large number of blocks and map tasks.
+
+Three container formats are supported:
+- text: The files are concatenated. A line break is added after a file not
+        ending with one, so that lines of different files are not mixed.
+- sequence: The files are stored in an uncompressed SequenceFile whose keys
+            are the original names (Text) and whose values are the contents
+            (BytesWritable).
+- har: The files are loaded individually and then packed into a Hadoop
+       archive. Jobs have to read them through har:// URIs.
+
+Along with the containers, a side index is stored in the dfs folder. It has a
+line for each packed file with its original name, its container, its offset
+in the container and its length, separated by tabs. Its name starts with an
+underscore, so it is ignored by the input formats of Hadoop.
+
+This module is also executed locally by itself to write the stream of a text
+or sequence container (see main).
+"""
+
+import fnmatch
+import hashlib
+import os
+import pipes
+import struct
+import sys
+import tempfile
+import urllib
+
+from execo_engine import logger
+
+# Container formats
+TEXT = "text"
+SEQUENCE = "sequence"
+HAR = "har"
+
+CONTAINER_FORMATS = [TEXT, SEQUENCE, HAR]
+
+# Files smaller than this fraction of the container size are packed by default
+DEFAULT_SMALL_FILE_FRACTION = 0.5
+
+# Names of the side index, the containers and the archive in the dfs folder
+INDEX_NAME = "_compaction_index"
+CONTAINER_NAME = "packed-%05d"
+CONTAINER_PATTERN = "packed-*"
+ARCHIVE_NAME = "packed.har"
+ARCHIVE_STAGING_NAME = "_packed_staging"
+
+# SequenceFile format (version 6, uncompressed)
+SEQUENCE_VERSION = 6
+SEQUENCE_KEY_CLASS = "org.apache.hadoop.io.Text"
+SEQUENCE_VALUE_CLASS = "org.apache.hadoop.io.BytesWritable"
+SEQUENCE_SYNC_SIZE = 16
+SEQUENCE_SYNC_ESCAPE = -1
+SEQUENCE_SYNC_INTERVAL = 100 * (4 + SEQUENCE_SYNC_SIZE)
+
+# Maximum number of dfs files passed to a single command
+MAX_FILES_PER_COMMAND = 100
+
+# Size of the buffer used to copy files into containers
+COPY_BUFFER_SIZE = 1048576
+
+
+# Serialization ###############################################################
+
+def _write_vint(value):
+    """Return the bytes of an integer serialized as WritableUtils.writeVLong
+    does."""
+
+    if -112 <= value <= 127:
+        return struct.pack(">b", value)
+
+    length = -112
+    if value < 0:
+        value = ~value
+        length = -120
+
+    tmp = value
+    while tmp != 0:
+        tmp >>= 8
+        length -= 1
+
+    data = struct.pack(">b", length)
+    if length < -120:
+        length = -(length + 120)
+    else:
+        length = -(length + 112)
+    for idx in range(length, 0, -1):
+        data += struct.pack(">B", (value >> ((idx - 1) * 8)) & 0xFF)
+    return data
+
+
+def _write_text(text):
+    """Return the bytes of a string serialized as org.apache.hadoop.io.Text
+    does."""
+
+    if isinstance(text, unicode):
+        text = text.encode("utf-8")
+    return _write_vint(len(text)) + text
+
+
+def get_sequence_sync(name):
+    """Return the sync marker of a SequenceFile. It is derived from the name
+    of the container, so that writing the same container twice produces the
+    same bytes."""
+
+    return hashlib.md5(name).digest()
+
+
+def get_sequence_header(sync):
+    """Return the header of an uncompressed SequenceFile.
+
+    Args:
+      sync (str):
+        The 16-byte sync marker.
+    """
+
+    return ("SEQ" + struct.pack(">B", SEQUENCE_VERSION) +
+            _write_text(SEQUENCE_KEY_CLASS) +
+            _write_text(SEQUENCE_VALUE_CLASS) +
+            struct.pack(">??", False, False) +  # No compression
+            struct.pack(">i", 0) +  # No metadata
+            sync)
+
+
+def get_sequence_record_header(name, length):
+    """Return the bytes preceding the contents of a file in a SequenceFile
+    record: the record and key lengths, the key and the length of the
+    value."""
+
+    key = _write_text(name)
+    return (struct.pack(">ii", len(key) + 4 + length, len(key)) + key +
+            struct.pack(">i", length))
+
+
+# Layout ######################################################################
+
+def _ends_with_line_break(path, length):
+    if not length:
+        return True
+    with open(path, "rb") as f:
+        f.seek(length - 1)
+        return f.read(1) == "\n"
+
+
+def get_container_layout(container_format, container_name, entries):
+    """Compute the position of the files packed in a container.
+
+    Args:
+      container_format (str):
+        The format of the container: text or sequence.
+      container_name (str):
+        The dfs path of the container.
+      entries (list of tuple):
+        The local path, the original name and the number of bytes to be
+        packed of each file, in order.
+
+    Returns (list of tuple):
+      A list of chunks to be written: the header bytes preceding each file
+      (possibly empty), the local path and length of the file, the bytes
+      following it, and the offset of the file in the container (for text,
+      the offset of its contents; for sequence, the offset of its record).
+    """
+
+    chunks = []
+    pos = 0
+    if container_format == TEXT:
+        for (path, _, length) in entries:
+            trailer = "" if _ends_with_line_break(path, length) else "\n"
+            chunks.append(("", path, length, trailer, pos))
+            pos += length + len(trailer)
+
+    elif container_format == SEQUENCE:
+        sync = get_sequence_sync(container_name)
+        file_header = get_sequence_header(sync)
+        pos = len(file_header)
+        last_sync = 0
+        for (path, name, length) in entries:
+            header = file_header
+            file_header = ""
+            if pos >= last_sync + SEQUENCE_SYNC_INTERVAL:
+                header += struct.pack(">i", SEQUENCE_SYNC_ESCAPE) + sync
+                pos += 4 + SEQUENCE_SYNC_SIZE
+                last_sync = pos
+            record_header = get_sequence_record_header(name, length)
+            chunks.append((header + record_header, path, length, "", pos))
+            pos += len(record_header) + length
+
+    else:
+        raise ValueError("Unknown container format " + container_format)
+
+    return chunks
+
+
+def is_compaction_file(path):
+    """Return whether a path relative to the dfs folder of a dataset belongs
+    to its compaction: a container, the side index or the archive and its
+    staging directory.
+
+    Args:
+      path (str):
+        The path relative to the dfs folder.
+    """
+
+    top = path.split("/", 1)[0]
+    return (fnmatch.fnmatch(top, CONTAINER_PATTERN) or
+            top in [INDEX_NAME, ARCHIVE_NAME, ARCHIVE_STAGING_NAME])
+
+
+def write_container(out, chunks):
+    """Write a container with the given layout.
+
+    Args:
+      out (file):
+        The binary output.
+      chunks (list of tuple):
+        The layout returned by get_container_layout.
+
+    Returns (int):
+      The number of bytes written.
+    """
+
+    written = 0
+    for (header, path, length, trailer, _) in chunks:
+        out.write(header)
+        with open(path, "rb") as f:
+            remaining = length
+            while remaining > 0:
+                data = f.read(min(COPY_BUFFER_SIZE, remaining))
+                if not data:
+                    raise IOError(path + " is shorter than " + str(length) +
+                                  " bytes")
+                out.write(data)
+                remaining -= len(data)
+        out.write(trailer)
+        written += len(header) + length + len(trailer)
+    return written
+
+
+def pack_files(files, sizes, container_size, threshold):
+    """Group the small files into containers. Files are taken in the given
+    order and a new container is started when the current one would exceed
+    the container size.
+
+    Args:
+      files (list of str):
+        The local paths of the files.
+      sizes (dict of str: int):
+        The number of bytes to be loaded from each file.
+      container_size (int):
+        The maximum size of a container.
+      threshold (int):
+        The size under which a file is packed.
+
+    Returns (tuple of list):
+      The list of groups of small files and the list of the other files.
+    """
+
+    groups = []
+    large_files = []
+    current = []
+    current_size = 0
+    for f in files:
+        if sizes[f] >= threshold:
+            large_files.append(f)
+            continue
+        if current and current_size + sizes[f] > container_size:
+            groups.append(current)
+            current = []
+            current_size = 0
+        current.append(f)
+        current_size += sizes[f]
+    if current:
+        groups.append(current)
+
+    return (groups, large_files)
+
+
+def parse_har_index(index_output):
+    """Parse the _index file of a Hadoop archive.
+
+    Args:
+      index_output (str):
+        The contents of the _index file.
+
+    Returns (dict of str: tuple):
+      The part file, offset and length of each file of the archive,
+      identified by its path inside the archive.
+    """
+
+    files = {}
+    for line in index_output.splitlines():
+        fields = line.split(" ")
+        if len(fields) < 5 or fields[1] != "file":
+            continue
+        try:
+            files[urllib.unquote_plus(fields[0])] = \
+                (fields[2], int(fields[3]), int(fields[4]))
+        except ValueError:
+            continue
+    return files
+
+
+# Ingestion ###################################################################
+
+class SmallFileCompactor(object):
+    """This class packs the small files of a load into containers.
+
+    The caller first obtains the containers with plan and dispatches them
+    among the hosts along with the other files, calling write_container for
+    each of them. Finally, finish archives the files if needed and stores the
+    side index in the dfs.
+
+    Attributes:
+      container_format (str):
+        The format of the containers.
+      container_size (int):
+        The maximum size of a container.
+      threshold (int):
+        The size under which a file is packed.
+      containers (dict of str: list):
+        The local files packed in each container, identified by its dfs path.
+    """
+
+    def __init__(self, hc, dest, container_format, container_size=None,
+                 threshold=None, replication=None):
+        """Create a new compactor.
+
+        Args:
+          hc (HadoopCluster):
+            The Hadoop cluster where the files are loaded.
+          dest (str):
+            The dfs destination folder.
+          container_format (str):
+            The format of the containers: text, sequence or har.
+          container_size (int, optional):
+            The maximum size of a container. The dfs block size by default.
+          threshold (int, optional):
+            The size under which a file is packed. By default, half the
+            container size.
+          replication (int, optional):
+            The replication factor of the containers. The default one if not
+            indicated.
+        """
+
+        if container_format not in CONTAINER_FORMATS:
+            raise ValueError("Unknown container format " + container_format +
+                             " (" + ", ".join(CONTAINER_FORMATS) +
+                             " are supported)")
+
+        self.hc = hc
+        self.dest = dest
+        self.container_format = container_format
+
+        if not container_size:
+            container_size = hc.get_dfs_block_size()
+        self.container_size = container_size
+        if not threshold:
+            threshold = int(container_size * DEFAULT_SMALL_FILE_FRACTION)
+        self.threshold = threshold
+        self.replication = replication
+
+        self.containers = {}
+        self._names = {}
+        self._lengths = {}
+        self._index = []
+
+    def _get_staging_dir(self):
+        return os.path.join(self.dest, ARCHIVE_STAGING_NAME)
+
+    def plan(self, files, sizes, names=None):
+        """Group the small files into containers.
+
+        Args:
+          files (list of str):
+            The local paths of the files to be loaded.
+          sizes (dict of str: int):
+            The number of bytes to be loaded from each file.
+          names (dict of str: str, optional):
+            The name of each file in the index. The base name by default.
+
+        Returns (tuple):
+          The list of the files which are not packed and a dictionary with
+          the size of each container, identified by its dfs path.
+        """
+
+        (groups, large_files) = pack_files(files, sizes, self.container_size,
+                                           self.threshold)
+
+        container_sizes = {}
+        for (idx, group) in enumerate(groups):
+            container = os.path.join(self.dest, CONTAINER_NAME % idx)
+            self.containers[container] = group
+            container_sizes[container] = sum(sizes[f] for f in group)
+            for f in group:
+                if names and f in names:
+                    self._names[f] = names[f]
+                else:
+                    self._names[f] = os.path.basename(f)
+                self._lengths[f] = sizes[f]
+
+        # Remove the leftovers of a previous compaction, which may have
+        # produced more containers
+        self.hc.execute("fs -rmr " + os.path.join(self.dest, INDEX_NAME) +
+                        " " + os.path.join(self.dest, ARCHIVE_NAME) +
+                        " " + self._get_staging_dir() + " " +
+                        pipes.quote(os.path.join(self.dest,
+                                                 CONTAINER_PATTERN)),
+                        verbose=False)
+
+        num_packed = sum(len(g) for g in groups)
+        if num_packed:
+            logger.info("Packing " + str(num_packed) + " files smaller "
+                        "than " + str(self.threshold) + " bytes into " +
+                        str(len(groups)) + " " + self.container_format +
+                        " containers")
+
+            if self.container_format == HAR:
+                dirs = set(os.path.dirname(os.path.join(
+                    self._get_staging_dir(), self._names[f]))
+                    for g in groups for f in g)
+                self.hc.create_dfs_dirs(sorted(dirs))
+
+        return (large_files, container_sizes)
+
+    def write_container(self, host, container):
+        """Write a container into the dfs through the given host. If it
+        fails, what was stored is removed so that it can be written again.
+
+        Args:
+          host (Host):
+            The host where the dfs client is executed.
+          container (str):
+            The dfs path of the container.
+
+        Returns (bool):
+          True if the container was stored, False otherwise.
+        """
+
+        group = self.containers[container]
+
+        if self.container_format == HAR:
+            # Files are archived together once all of them are in the dfs
+            ok = True
+            staged_files = []
+            for f in group:
+                staged = os.path.join(self._get_staging_dir(), self._names[f])
+                staged_files.append(staged)
+                ok = self.hc.stream_to_dfs(
+                    f, staged, host, self._lengths[f],
+                    replication=self.replication) is not None and ok
+            if not ok:
+                self._remove(staged_files)
+            return ok
+
+        entries = [(f, self._names[f], self._lengths[f]) for f in group]
+        layout = get_container_layout(self.container_format, container,
+                                      entries)
+
+        (fd, list_file) = tempfile.mkstemp(prefix="hg5k_container_")
+        try:
+            with os.fdopen(fd, "w") as f:
+                for (path, name, length) in entries:
+                    f.write(path + "\t" + name + "\t" + str(length) + "\n")
+
+            script = os.path.splitext(os.path.abspath(__file__))[0] + ".py"
+            ok = self.hc.stream_output_to_dfs(
+                sys.executable + " " + script + " " + self.container_format +
+                " " + container + " " + list_file, container, host,
+                self.replication)
+        finally:
+            os.remove(list_file)
+
+        if ok:
+            self._index.extend((name, container, chunk[4], length)
+                               for ((_, name, length), chunk)
+                               in zip(entries, layout))
+        else:
+            self._remove([container])
+        return ok
+
+    def _remove(self, dfs_files):
+        """Remove the given dfs files, if they exist."""
+
+        for i in range(0, len(dfs_files), MAX_FILES_PER_COMMAND):
+            chunk = dfs_files[i:i + MAX_FILES_PER_COMMAND]
+            self.hc.execute("fs -rm " + " ".join(chunk), verbose=False)
+
+    def _archive(self):
+        """Pack the staged files into a Hadoop archive and index them."""
+
+        archive = os.path.join(self.dest, ARCHIVE_NAME)
+        self.hc.execute("archive -archiveName " + ARCHIVE_NAME + " -p " +
+                        self.dest + " " + ARCHIVE_STAGING_NAME + " " +
+                        self.dest, verbose=False)
+
+        (stdout, _) = self.hc.execute(
+            "fs -cat " + os.path.join(archive, "_index"), verbose=False)
+        har_files = parse_har_index(stdout)
+        if not har_files:
+            logger.warn("Could not archive the small files into " + archive +
+                        ". They are left in " + self._get_staging_dir())
+            return
+
+        self.hc.execute("fs -rmr " + self._get_staging_dir(), verbose=False)
+
+        for f in sorted(self._names, key=lambda x: self._names[x]):
+            path = "/" + ARCHIVE_STAGING_NAME + "/" + self._names[f]
+            if path in har_files:
+                (part, offset, length) = har_files[path]
+                self._index.append((self._names[f],
+                                    os.path.join(archive, part),
+                                    offset, length))
+
+    def finish(self, node=None):
+        """Archive the packed files if needed and store the side index.
+
+        Args:
+          node (Host, optional):
+            The host through which the index is stored.
+
+        Returns (list of tuple):
+          The original name, the container, the offset and the length of
+          each packed file.
+        """
+
+        if not self.containers:
+            return []
+
+        if self.container_format == HAR:
+            self._archive()
+
+        (fd, index_file) = tempfile.mkstemp(prefix="hg5k_index_")
+        try:
+            with os.fdopen(fd, "w") as f:
+                for (name, container, offset, length) in sorted(self._index):
+                    f.write(name + "\t" + container + "\t" + str(offset) +
+                            "\t" + str(length) + "\n")
+            self.hc.stream_to_dfs(index_file,
+                                  os.path.join(self.dest, INDEX_NAME), node)
+        finally:
+            os.remove(index_file)
+
+        logger.info(str(len(self._index)) + " small files packed into " +
+                    str(len(self.containers)) + " containers. Index in " +
+                    os.path.join(self.dest, INDEX_NAME))
+
+        return self._index
+
+
+def main():
+    """Write a text or sequence container to the standard output.
+
+    Usage: python compaction.py FORMAT CONTAINER LIST_FILE
+
+    Each line of LIST_FILE contains the local path, the original name and the
+    number of bytes to be packed of a file, separated by tabs.
+    """
+
+    if len(sys.argv) != 4:
+        sys.exit("Usage: " + sys.argv[0] + " FORMAT CONTAINER LIST_FILE")
+
+    (container_format, container, list_file) = sys.argv[1:]
+
+    entries = []
+    with open(list_file) as f:
+        for line in f:
+            (path, name, length) = line.rstrip("\n").split("\t")
+            entries.append((path, name, int(length)))
+
+    out = getattr(sys.stdout, "buffer", sys.stdout)
+    write_container(out, get_container_layout(container_format, container,
+                                              entries))
+    out.flush()
+
+
+if __name__ == "__main__":
+    main()
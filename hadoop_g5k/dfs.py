@@ -0,0 +1,292 @@
+"""This module provides the tools to analyze the distribution of the data
+stored in the dfs among the DataNodes of a cluster.
+"""
+
+import math
+import re
+import urlparse
+
+# Pattern of a DataNode address (ip:port) in fsck and dfsadmin outputs
+DATANODE_ADDRESS_PATTERN = re.compile(r"(\d{1,3}(?:\.\d{1,3}){3}:\d+)")
+
+# Pattern of a block line in fsck -files -blocks -locations output
+FSCK_BLOCK_PATTERN = re.compile(r"^\d+\. \S+ len=(\d+) repl=(\d+) \[(.*)\]")
+
+# Pattern of the count of under-replicated blocks in the summary of fsck
+FSCK_UNDER_REPLICATED_PATTERN = re.compile(
+    r"Under-replicated blocks:\s+(\d+)")
+
+
+def parse_fsck_blocks(fsck_output):
+    """Parse the output of fsck -files -blocks -locations.
+
+    Args:
+      fsck_output (str):
+        The output of the fsck command.
+
+    Returns (tuple of dict):
+      Two dictionaries with the number of block replicas and the number of
+      bytes stored in each DataNode, identified by its address.
+    """
+
+    blocks = {}
+    num_bytes = {}
+    for line in fsck_output.splitlines():
+        match = FSCK_BLOCK_PATTERN.match(line.strip())
+        if not match:
+            continue
+        length = int(match.group(1))
+        for dn in DATANODE_ADDRESS_PATTERN.findall(match.group(3)):
+            blocks[dn] = blocks.get(dn, 0) + 1
+            num_bytes[dn] = num_bytes.get(dn, 0) + length
+
+    return (blocks, num_bytes)
+
+
+def get_dfs_path(uri):
+    """Return the path of a dfs uri, without its scheme and authority."""
+
+    return urlparse.urlparse(uri).path or uri
+
+
+def parse_ls(ls_output):
+    """Parse the output of a recursive fs -ls.
+
+    Args:
+      ls_output (str):
+        The output of the ls command.
+
+    Returns (dict of str: int):
+      The length of each file, identified by its path. Directories are
+      ignored.
+    """
+
+    lengths = {}
+    for line in ls_output.splitlines():
+        fields = line.split()
+        if len(fields) < 8 or not fields[0].startswith("-"):
+            continue
+        try:
+            lengths[get_dfs_path(fields[-1])] = int(fields[4])
+        except ValueError:
+            pass
+
+    return lengths
+
+
+def parse_checksums(checksum_output):
+    """Parse the output of fs -checksum.
+
+    Args:
+      checksum_output (str):
+        The output of the checksum command.
+
+    Returns (dict of str: str):
+      The checksum of each file (algorithm and value), identified by its path.
+    """
+
+    checksums = {}
+    for line in checksum_output.splitlines():
+        fields = line.split()
+        if len(fields) == 3:
+            checksums[get_dfs_path(fields[0])] = fields[1] + ":" + fields[2]
+
+    return checksums
+
+
+def parse_under_replicated_blocks(fsck_output):
+    """Parse the number of under-replicated blocks in the output of fsck.
+
+    Args:
+      fsck_output (str):
+        The output of the fsck command.
+
+    Returns (int):
+      The number of blocks with fewer replicas than their replication factor,
+      or None if the output does not contain the summary.
+    """
+
+    match = FSCK_UNDER_REPLICATED_PATTERN.search(fsck_output)
+    if match:
+        return int(match.group(1))
+    return None
+
+
+def parse_dfsadmin_report(report_output):
+    """Parse the output of dfsadmin -report. Only live DataNodes are taken
+    into account.
+
+    Args:
+      report_output (str):
+        The output of the dfsadmin command.
+
+    Returns (dict of str: dict):
+      A dictionary with the "capacity", "used" and "remaining" bytes of each
+      DataNode, identified by its address.
+    """
+
+    fields = {
+        "Configured Capacity": "capacity",
+        "DFS Used": "used",
+        "DFS Remaining": "remaining"
+    }
+
+    datanodes = {}
+    current = None
+    for line in report_output.splitlines():
+        line = line.strip()
+        if line.startswith("Dead datanodes"):
+            break
+        if line.startswith("Name:"):
+            match = DATANODE_ADDRESS_PATTERN.search(line)
+            if match:
+                current = {}
+                datanodes[match.group(1)] = current
+            continue
+        if current is None or ":" not in line:
+            continue
+
+        (name, value) = line.split(":", 1)
+        if name in fields:
+            try:
+                current[fields[name]] = int(value.split()[0])
+            except (IndexError, ValueError):
+                pass
+
+    return datanodes
+
+
+def get_skew_stats(values):
+    """Compute the skew statistics of the given values.
+
+    Args:
+      values (list of int):
+        The values, one per DataNode.
+
+    Returns (dict of str: float):
+      A dictionary with the "min", "max", "mean", "stdev", the coefficient of
+      variation ("cv") and the ratio between the maximum and the mean
+      ("max_mean_ratio").
+    """
+
+    if not values:
+        return {"min": 0, "max": 0, "mean": 0.0, "stdev": 0.0, "cv": 0.0,
+                "max_mean_ratio": 0.0}
+
+    mean = float(sum(values)) / len(values)
+    stdev = math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+
+    return {
+        "min": min(values),
+        "max": max(values),
+        "mean": mean,
+        "stdev": stdev,
+        "cv": stdev / mean if mean else 0.0,
+        "max_mean_ratio": max(values) / mean if mean else 0.0
+    }
+
+
+class BlockDistribution(object):
+    """This class represents the distribution of the dfs blocks among the
+    DataNodes of a cluster.
+
+    Attributes:
+      datanodes (list of str):
+        The addresses of the DataNodes.
+      blocks (dict of str: int):
+        The number of block replicas stored in each DataNode.
+      bytes (dict of str: int):
+        The number of bytes of the replicas stored in each DataNode.
+      usage (dict of str: dict):
+        The capacity, used and remaining bytes of each DataNode.
+    """
+
+    def __init__(self, fsck_output, report_output=""):
+        """Create a block distribution from the outputs of Hadoop commands.
+
+        Args:
+          fsck_output (str):
+            The output of fsck -files -blocks -locations.
+          report_output (str, optional):
+            The output of dfsadmin -report.
+        """
+
+        (self.blocks, self.bytes) = parse_fsck_blocks(fsck_output)
+        self.usage = parse_dfsadmin_report(report_output)
+
+        # DataNodes without blocks are only present in the report
+        self.datanodes = sorted(set(self.blocks.keys()) |
+                                set(self.bytes.keys()) |
+                                set(self.usage.keys()))
+
+    def get_block_stats(self):
+        """Return the skew statistics of the number of blocks per DataNode."""
+
+        return get_skew_stats([self.blocks.get(dn, 0)
+                               for dn in self.datanodes])
+
+    def get_bytes_stats(self):
+        """Return the skew statistics of the number of bytes per DataNode."""
+
+        return get_skew_stats([self.bytes.get(dn, 0)
+                               for dn in self.datanodes])
+
+    def get_utilization(self, datanode):
+        """Return the utilization of the given DataNode as a percentage of its
+        capacity, or None if it is unknown."""
+
+        usage = self.usage.get(datanode, {})
+        if usage.get("capacity"):
+            return 100.0 * usage.get("used", 0) / usage["capacity"]
+        return None
+
+    def get_max_deviation(self):
+        """Return the maximum difference, in percentage points, between the
+        utilization of a DataNode and the utilization of the whole cluster.
+        This is the measure compared with the threshold of the balancer.
+
+        Returns (float):
+          The maximum deviation, or 0 if utilization is unknown.
+        """
+
+        used = sum(u.get("used", 0) for u in self.usage.values())
+        capacity = sum(u.get("capacity", 0) for u in self.usage.values())
+        if not capacity:
+            return 0.0
+
+        avg_utilization = 100.0 * used / capacity
+        deviations = [abs(self.get_utilization(dn) - avg_utilization)
+                      for dn in self.usage
+                      if self.get_utilization(dn) is not None]
+        return max(deviations) if deviations else 0.0
+
+    def get_summary(self):
+        """Return a one-line summary of the skew of the distribution."""
+
+        block_stats = self.get_block_stats()
+        bytes_stats = self.get_bytes_stats()
+        return ("datanodes = %d, blocks/dn = %.1f (cv = %.2f, max/mean = "
+                "%.2f), bytes/dn = %d (cv = %.2f, max/mean = %.2f), max "
+                "utilization deviation = %.2f%%" %
+                (len(self.datanodes),
+                 block_stats["mean"], block_stats["cv"],
+                 block_stats["max_mean_ratio"],
+                 bytes_stats["mean"], bytes_stats["cv"],
+                 bytes_stats["max_mean_ratio"],
+                 self.get_max_deviation()))
+
+    def __str__(self):
+        lines = ["%-24s %10s %16s %12s" %
+                 ("DataNode", "Blocks", "Bytes", "Utilization")]
+        for dn in self.datanodes:
+            utilization = self.get_utilization(dn)
+            if utilization is None:
+                utilization_str = "-"
+            else:
+                utilization_str = "%.2f%%" % utilization
+            lines.append("%-24s %10d %16d %12s" %
+                         (dn, self.blocks.get(dn, 0), self.bytes.get(dn, 0),
+                          utilization_str))
+        lines.append("")
+        lines.append(self.get_summary())
+        return "\n".join(lines)
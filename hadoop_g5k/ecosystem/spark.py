@@ -8,13 +8,13 @@ from abc import abstractmethod
 from ConfigParser import ConfigParser
 from subprocess import call
 
-from execo.action import Put, TaktukPut, Get, Remote, TaktukRemote, \
-    SequentialActions
+from execo.action import SequentialActions
 from execo.log import style
-from execo.process import SshProcess
 from execo_engine import logger
-from execo_g5k import get_host_attributes
 
+from hadoop_g5k.local import is_local_deployment, local_path, \
+    get_local_port, get_host_attributes, get_process, get_remote, get_put, \
+    get_get
 from hadoop_g5k.util import ColorDecorator
 
 # Default parameters
@@ -24,6 +24,8 @@ DEFAULT_SPARK_LOGS_DIR = DEFAULT_SPARK_BASE_DIR + "/logs"
 DEFAULT_SPARK_EVENTS_DIR = ""
 DEFAULT_SPARK_WORK_DIR = DEFAULT_SPARK_BASE_DIR + "/work"
 DEFAULT_SPARK_PORT = 7077
+DEFAULT_SPARK_WORKER_PORT = 7078
+DEFAULT_SPARK_WORKER_WEBUI_PORT = 8081
 
 DEFAULT_SPARK_LOCAL_CONF_DIR = "spark-conf"
 
@@ -213,6 +215,9 @@ class SparkCluster(object):
         The cluster manager that is used (STANDALONE_MODE or YARN_MODE).
       hc (HadoopCluster):
         A reference to the Hadoop cluster if spark is deployed on top of one.
+      local (bool):
+        True if the cluster is a pseudo-distributed deployment composed of
+        virtual hosts in the local machine, False otherwise.
     """
 
     @staticmethod
@@ -223,6 +228,8 @@ class SparkCluster(object):
     initialized = False
     running = False
 
+    local = False
+
     # Default properties
     defaults = {
         "spark_base_dir": DEFAULT_SPARK_BASE_DIR,
@@ -286,6 +293,18 @@ class SparkCluster(object):
                                  " directly or indirectly through a Hadoop "
                                  "cluster.")
 
+        # Virtual hosts store their files under their own root dir
+        self.local = is_local_deployment(self.hosts)
+        if self.local:
+            self.base_dir = local_path(self.base_dir)
+            self.conf_dir = local_path(self.conf_dir)
+            self.logs_dir = local_path(self.logs_dir)
+            self.work_dir = local_path(self.work_dir)
+            if self.evs_log_dir and "://" not in self.evs_log_dir:
+                self.evs_log_dir = local_path(self.evs_log_dir)
+            self.bin_dir = self.base_dir + "/bin"
+            self.sbin_dir = self.base_dir + "/sbin"
+
         
         # Store reference to Hadoop cluster and check if mandatory
         self.hc = hadoop_cluster
@@ -308,23 +327,24 @@ class SparkCluster(object):
     def bootstrap(self, tar_file):
 
         # 0. Check that required packages are present
-        required_packages = "openjdk-7-jre openjdk-7-jdk"
-        check_packages = TaktukRemote("dpkg -s " + required_packages,
-                                      self.hosts)
-        for p in check_packages.processes:
-            p.nolog_exit_code = p.nolog_error = True
-        check_packages.run()
-        if not check_packages.ok:
-            logger.info("Packages not installed, trying to install")
-            install_packages = TaktukRemote(
-                "export DEBIAN_MASTER=noninteractive ; " +
-                "apt-get update && apt-get install -y --force-yes " +
-                required_packages, self.hosts).run()
-            if not install_packages.ok:
-                logger.error("Unable to install the packages")
-
-        get_java_home = SshProcess('echo $(readlink -f /usr/bin/javac | '
-                                   'sed "s:/bin/javac::")', self.master)
+        if not self.local:
+            required_packages = "openjdk-7-jre openjdk-7-jdk"
+            check_packages = get_remote("dpkg -s " + required_packages,
+                                        self.hosts, taktuk=True)
+            for p in check_packages.processes:
+                p.nolog_exit_code = p.nolog_error = True
+            check_packages.run()
+            if not check_packages.ok:
+                logger.info("Packages not installed, trying to install")
+                install_packages = get_remote(
+                    "export DEBIAN_MASTER=noninteractive ; " +
+                    "apt-get update && apt-get install -y --force-yes " +
+                    required_packages, self.hosts, taktuk=True).run()
+                if not install_packages.ok:
+                    logger.error("Unable to install the packages")
+
+        get_java_home = get_process('echo $(readlink -f /usr/bin/javac | '
+                                    'sed "s:/bin/javac::")', self.master)
         get_java_home.run()
         self.java_home = get_java_home.stdout.strip()
 
@@ -332,37 +352,43 @@ class SparkCluster(object):
 
         # 1. Copy hadoop tar file and uncompress
         logger.info("Copy " + tar_file + " to hosts and uncompress")
-        rm_dirs = TaktukRemote("rm -rf " + self.base_dir +
-                               " " + self.conf_dir,
-                               self.hosts)
-        put_tar = TaktukPut(self.hosts, [tar_file], "/tmp")
-        tar_xf = TaktukRemote(
-            "tar xf /tmp/" + os.path.basename(tar_file) + " -C /tmp",
-            self.hosts)
+        if self.local:
+            tmp_dir = local_path("/tmp")
+        else:
+            tmp_dir = "/tmp"
+        rm_dirs = get_remote("rm -rf " + self.base_dir +
+                             " " + self.conf_dir,
+                             self.hosts, taktuk=True)
+        put_tar = get_put(self.hosts, [tar_file], tmp_dir, taktuk=True)
+        tar_xf = get_remote(
+            "tar xf " + tmp_dir + "/" + os.path.basename(tar_file) +
+            " -C " + tmp_dir,
+            self.hosts, taktuk=True)
         SequentialActions([rm_dirs, put_tar, tar_xf]).run()
 
         # 2. Move installation to base dir
         logger.info("Create installation directories")
-        mv_base_dir = TaktukRemote(
-            "mv /tmp/" + os.path.basename(tar_file).replace(".tgz", "") + " " +
+        mv_base_dir = get_remote(
+            "mv " + tmp_dir + "/" +
+            os.path.basename(tar_file).replace(".tgz", "") + " " +
             self.base_dir,
-            self.hosts)
-        mkdirs = TaktukRemote("mkdir -p " + self.conf_dir +
-                              " && mkdir -p " + self.logs_dir,
-                              self.hosts)
-        chmods = TaktukRemote("chmod g+w " + self.base_dir +
-                              " && chmod g+w " + self.conf_dir +
-                              " && chmod g+w " + self.logs_dir,
-                              self.hosts)
+            self.hosts, taktuk=True)
+        mkdirs = get_remote("mkdir -p " + self.conf_dir +
+                            " && mkdir -p " + self.logs_dir,
+                            self.hosts, taktuk=True)
+        chmods = get_remote("chmod g+w " + self.base_dir +
+                            " && chmod g+w " + self.conf_dir +
+                            " && chmod g+w " + self.logs_dir,
+                            self.hosts, taktuk=True)
         SequentialActions([mv_base_dir, mkdirs, chmods]).run()
 
         # 2.1. Create spark-events dir
         if self.evs_log_dir:
             if self.evs_log_dir.startswith("file://") or \
                             "://" not in self.evs_log_dir:
-                mk_evs_dir = TaktukRemote("mkdir -p " + self.evs_log_dir +
-                                          " && chmod g+w " + self.evs_log_dir,
-                                          self.hosts)
+                mk_evs_dir = get_remote("mkdir -p " + self.evs_log_dir +
+                                        " && chmod g+w " + self.evs_log_dir,
+                                        self.hosts, taktuk=True)
                 mk_evs_dir.run()
             elif self.evs_log_dir.startswith("hdfs://"):
                 self.hc.execute("fs -mkdir -p " + self.evs_log_dir)
@@ -375,9 +401,12 @@ class SparkCluster(object):
             command += "HADOOP_CONF_DIR=" + self.hc.conf_dir + "\n"
         if self.mode == YARN_MODE:
             command += "YARN_CONF_DIR=" + self.hc.conf_dir + "\n"
+        if self.local:
+            command += "SPARK_PID_DIR=" + self.work_dir + "\n"
+            command += "SPARK_WORKER_DIR=" + self.work_dir + "\n"
         command += "EOF\n"
         command += "chmod +x " + self.conf_dir + "/spark-env.sh"
-        action = Remote(command, self.hosts)
+        action = get_remote(command, self.hosts)
         action.run()
 
     def initialize(self):
@@ -436,7 +465,8 @@ class SparkCluster(object):
         remote_missing_files = [os.path.join(self.conf_dir, f)
                                 for f in missing_conf_files]
 
-        action = Get([self.master], remote_missing_files, self.temp_conf_dir)
+        action = get_get([self.master], remote_missing_files,
+                         self.temp_conf_dir)
         action.run()
 
     def _create_master_and_slave_conf(self):
@@ -472,7 +502,7 @@ class SparkCluster(object):
 
         conf_files = [os.path.join(conf_dir, f) for f in os.listdir(conf_dir)]
 
-        action = TaktukPut(hosts, conf_files, self.conf_dir)
+        action = get_put(hosts, conf_files, self.conf_dir, taktuk=True)
         action.run()
 
         if not action.finished_ok:
@@ -505,9 +535,23 @@ class SparkCluster(object):
         command += "SPARK_MASTER_PORT=" + str(self.port) + "\n"
         command += "SPARK_WORKER_MEMORY=" + str(memory_per_worker) + "m\n"
         command += "EOF\n"
-        action = Remote(command, self.hosts)
+        action = get_remote(command, self.hosts)
         action.run()
 
+        # Virtual hosts need their own worker ports
+        if self.local:
+            for h in self.hosts:
+                command = "cat >> " + self.conf_dir + "/spark-env.sh << EOF\n"
+                command += "SPARK_WORKER_PORT=" + \
+                           str(get_local_port(DEFAULT_SPARK_WORKER_PORT, h)) + \
+                           "\n"
+                command += "SPARK_WORKER_WEBUI_PORT=" + \
+                           str(get_local_port(DEFAULT_SPARK_WORKER_WEBUI_PORT,
+                                              h)) + "\n"
+                command += "EOF\n"
+                action = get_remote(command, [h])
+                action.run()
+
         # Default parameters
         driver_mem = "1g"
         executor_mem = str(memory_per_task) + "m"
@@ -541,9 +585,18 @@ class SparkCluster(object):
             return
 
         if self.mode == STANDALONE_MODE:
-            proc = SshProcess(self.sbin_dir + "/start-master.sh;" +
-                              self.sbin_dir + "/start-slaves.sh;",
-                              self.master)
+            if self.local:
+                proc = SequentialActions([
+                    get_remote(self.sbin_dir + "/start-master.sh",
+                               [self.master]),
+                    get_remote(self.sbin_dir + "/spark-daemon.sh start " +
+                               "org.apache.spark.deploy.worker.Worker 1 " +
+                               "spark://" + self.master.address + ":" +
+                               str(self.port), self.hosts)])
+            else:
+                proc = get_process(self.sbin_dir + "/start-master.sh;" +
+                                   self.sbin_dir + "/start-slaves.sh;",
+                                   self.master)
             proc.run()
             if not proc.finished_ok:
                 logger.warn("Error while starting Spark")
@@ -566,9 +619,17 @@ class SparkCluster(object):
         logger.info("Stopping Spark")
 
         if self.mode == STANDALONE_MODE:
-            proc = SshProcess(self.sbin_dir + "/stop-slaves.sh;" +
-                              self.sbin_dir + "/stop-master.sh;",
-                              self.master)
+            if self.local:
+                proc = SequentialActions([
+                    get_remote(self.sbin_dir + "/spark-daemon.sh stop " +
+                               "org.apache.spark.deploy.worker.Worker 1",
+                               self.hosts),
+                    get_remote(self.sbin_dir + "/stop-master.sh",
+                               [self.master])])
+            else:
+                proc = get_process(self.sbin_dir + "/stop-slaves.sh;" +
+                                   self.sbin_dir + "/stop-master.sh;",
+                                   self.master)
             proc.run()
             if not proc.finished_ok:
                 logger.warn("Error while stopping Spark")
@@ -652,7 +713,7 @@ class SparkCluster(object):
 
         # Copy necessary files to cluster
         files_to_copy = job.get_files_to_copy()
-        action = Put([node], files_to_copy, exec_dir)
+        action = get_put([node], files_to_copy, exec_dir)
         action.run()
 
         # Get command
@@ -662,7 +723,7 @@ class SparkCluster(object):
         logger.info("Executing spark job. Command = {" + self.bin_dir +
                     "/spark-submit " + command + "} in " + str(node))
 
-        proc = SshProcess(self.bin_dir + "/spark-submit " + command, node)
+        proc = get_process(self.bin_dir + "/spark-submit " + command, node)
 
         if verbose:
             red_color = '\033[01;31m'
@@ -698,9 +759,9 @@ class SparkCluster(object):
             self.stop()
             restart = True
 
-        action = Remote("rm -rf " + self.logs_dir + "/* " +
-                                    self.work_dir + "/*",
-                        self.hosts)
+        action = get_remote("rm -rf " + self.logs_dir + "/* " +
+                                        self.work_dir + "/*",
+                            self.hosts)
         action.run()
 
         if restart:
@@ -729,7 +790,7 @@ class SparkCluster(object):
 
         force_kill = False
         for h in self.hosts:
-            proc = SshProcess("jps", h)
+            proc = get_process("jps", h)
             proc.run()
 
             ids_to_kill = []
@@ -748,7 +809,7 @@ class SparkCluster(object):
                     "Killing running Spark processes in host %s" %
                     style.host(h.address.split('.')[0]))
 
-                proc = SshProcess("kill -9" + ids_to_kill_str, h)
+                proc = get_process("kill -9" + ids_to_kill_str, h)
                 proc.run()
 
         if force_kill:
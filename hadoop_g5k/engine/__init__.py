@@ -1,2 +1,3 @@
 from engine import HadoopEngine
-from dataset import Dataset, StaticDataset, DynamicDataset
\ No newline at end of file
+from dataset import Dataset, StaticDataset, SyntheticDataset, \
+    RemoteSourceDataset, DynamicDataset
\ No newline at end of file
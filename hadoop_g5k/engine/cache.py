@@ -0,0 +1,175 @@
+"""This module keeps track of the datasets resident in the dfs, so that a
+combination using a dataset already loaded by a previous one reuses it instead
+of loading it again.
+
+Resident datasets are evicted in least recently used order when a new one does
+not fit in the fraction of the dfs capacity allowed to them, and when a new
+dataset is loaded into the same dfs folder.
+"""
+
+from collections import OrderedDict
+
+from execo_engine import logger
+
+# Default fraction of the dfs capacity that resident datasets can use
+DEFAULT_MAX_FRACTION = 0.5
+
+
+class DatasetCache(object):
+    """This class keeps track of the datasets resident in the dfs of a
+    cluster, so that they can be reused by later combinations instead of
+    being loaded again.
+
+    Datasets are identified by a key built from their class and parameters.
+    The space they use, including replication, is bounded by a fraction of
+    the dfs capacity. When a new dataset does not fit, the least recently
+    used ones are removed from the dfs.
+
+    Attributes:
+      max_fraction (float):
+        The fraction of the dfs capacity that the datasets can use.
+      entries (OrderedDict):
+        The information of each resident dataset ("ds", "ds_id", "dest" and
+        "size"), from the least to the most recently used.
+    """
+
+    def __init__(self, max_fraction=DEFAULT_MAX_FRACTION):
+        """Create an empty cache.
+
+        Args:
+          max_fraction (float, optional):
+            The fraction of the dfs capacity that the datasets can use.
+        """
+
+        self.max_fraction = max_fraction
+        self.entries = OrderedDict()
+        self._replication = None
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _get_replication(self, hc):
+        if self._replication is None:
+            self._replication = hc.get_dfs_replication()
+        return self._replication
+
+    def get_used(self):
+        """Return the dfs space used by the resident datasets."""
+
+        return sum(e["size"] for e in self.entries.values())
+
+    def get(self, key):
+        """Return the entry of a resident dataset and mark it as the most
+        recently used.
+
+        Args:
+          key (tuple):
+            The key of the dataset.
+
+        Returns (dict):
+          The entry of the dataset, or None if it is not resident.
+        """
+
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.entries[key] = entry
+        return entry
+
+    def add(self, hc, key, ds, ds_id, dest):
+        """Register a dataset loaded in the dfs as the most recently used.
+
+        Args:
+          hc (HadoopCluster):
+            The Hadoop cluster where the dataset has been loaded.
+          key (tuple):
+            The key of the dataset.
+          ds (Dataset):
+            The dataset object.
+          ds_id (int):
+            The identifier of the dataset in the engine.
+          dest (str):
+            The dfs folder of the dataset.
+        """
+
+        size = (hc.get_dfs_size(dest) or 0) * self._get_replication(hc)
+        self.entries.pop(key, None)
+        self.entries[key] = {"ds": ds, "ds_id": ds_id, "dest": dest,
+                             "size": size}
+
+    def remove(self, key):
+        """Forget a dataset without removing it from the dfs.
+
+        Returns (dict):
+          The entry of the dataset, or None if it was not resident.
+        """
+
+        return self.entries.pop(key, None)
+
+    def clear(self):
+        """Forget all the datasets, e.g., after the dfs is formatted."""
+
+        self.entries.clear()
+
+    def evict_dest(self, hc, dest, keep=None):
+        """Remove from the dfs the datasets stored in the given folder, which
+        is about to be overwritten by another dataset.
+
+        Args:
+          hc (HadoopCluster):
+            The Hadoop cluster where the datasets are loaded.
+          dest (str):
+            The dfs folder.
+          keep (tuple, optional):
+            The key of a dataset which is not removed (e.g., the one resized
+            into the folder).
+
+        Returns (list of tuple):
+          The keys of the removed datasets.
+        """
+
+        evicted = []
+        for (key, entry) in self.entries.items():
+            if entry["dest"] == dest and key != keep:
+                logger.info("Evicting dataset " + str(entry["ds_id"]) +
+                            " from " + dest + ", which is reused by a new "
+                            "dataset")
+                del self.entries[key]
+                entry["ds"].clean(hc)
+                evicted.append(key)
+        return evicted
+
+    def make_room(self, hc, size):
+        """Remove the least recently used datasets from the dfs until a new
+        dataset fits in the allowed space.
+
+        Args:
+          hc (HadoopCluster):
+            The Hadoop cluster where the datasets are loaded.
+          size (int):
+            The size of the new dataset, without replication.
+
+        Returns (list of tuple):
+          The keys of the removed datasets.
+        """
+
+        needed = size * self._get_replication(hc)
+        budget = self.max_fraction * hc.get_dfs_capacity()
+
+        evicted = []
+        while self.entries and self.get_used() + needed > budget:
+            (key, entry) = self.entries.popitem(last=False)
+            logger.info("Evicting dataset " + str(entry["ds_id"]) + " from " +
+                        entry["dest"] + " (" + str(entry["size"]) +
+                        " bytes)")
+            entry["ds"].clean(hc)
+            evicted.append(key)
+
+        if self.get_used() + needed > budget:
+            logger.warn("The dataset does not fit in the " +
+                        str(100 * self.max_fraction) + "% of the dfs "
+                        "capacity allowed to datasets")
+
+        return evicted
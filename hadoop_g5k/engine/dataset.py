@@ -1,13 +1,57 @@
 import os
 import threading
+import time
 
 from abc import ABCMeta, abstractmethod
+from multiprocessing.pool import ThreadPool
 
-from execo.action import Put, TaktukRemote
-from execo.process import SshProcess
 from execo_engine import logger
+from hadoop_g5k.cluster_v2 import HadoopV2Cluster
+from hadoop_g5k.compaction import SmallFileCompactor, CONTAINER_FORMATS, \
+    is_compaction_file
+from hadoop_g5k.engine import generator
+from hadoop_g5k.engine.manifest import DatasetManifest, LoadJournal
+from hadoop_g5k.engine.source import get_data_source, DEFAULT_CONNECTIONS, \
+    DEFAULT_RANGE_SIZE
+from hadoop_g5k.local import get_process, get_remote, get_put, \
+    get_stream_process
 from hadoop_g5k.objects import HadoopJarJob
-from hadoop_g5k.util import import_function
+from hadoop_g5k.transfer import FileDispatcher, DEFAULT_MAX_TRANSFERS, \
+    DEFAULT_MAX_TRANSFERS_PER_HOST
+from hadoop_g5k.util import import_function, uncompress, get_stream_codec, \
+    get_uncompressed_name, get_stream_decompression_command
+
+# Generators of Hadoop examples supported by DynamicDataset: size of their
+# records (if the size is given as a number of records) and names of the
+# properties indicating the number of maps, the total bytes and the bytes per
+# map in Hadoop 1 and 2
+GENERATORS = {
+    "teragen": (
+        100,
+        ("mapred.map.tasks", None, None),
+        ("mapreduce.job.maps", None, None)),
+    "randomwriter": (
+        None,
+        ("mapred.map.tasks", "test.randomwrite.total_bytes",
+         "test.randomwrite.bytes_per_map"),
+        ("mapreduce.job.maps", "mapreduce.randomwriter.totalbytes",
+         "mapreduce.randomwriter.bytespermap")),
+    "randomtextwriter": (
+        None,
+        ("mapred.map.tasks", "test.randomtextwrite.total_bytes",
+         "test.randomtextwrite.bytes_per_map"),
+        ("mapreduce.job.maps", "mapreduce.randomtextwriter.totalbytes",
+         "mapreduce.randomtextwriter.bytespermap"))
+}
+
+# Relative difference between the desired and the generated sizes tolerated
+DEFAULT_SIZE_TOLERANCE = 0.05
+
+# Maximum number of dfs files passed to a single command
+MAX_FILES_PER_COMMAND = 100
+
+# Number of local files whose checksum is computed at the same time
+CHECKSUM_THREADS = 4
 
 
 class Dataset(object):
@@ -17,17 +61,50 @@ class Dataset(object):
 
     __metaclass__ = ABCMeta
 
-    deployments = {}
-
     def __init__(self, params):
         """Create a dataset with the given params.
         
         Args:
-          params (dict): Parameters of the dataset.
+          params (dict): Parameters of the dataset. The following parameters
+            are common to all datasets:
+            - rebalance_threshold: If indicated, the balancer is executed
+                                   after loading with the given threshold.
+            - rebalance_bandwidth: The bandwidth in bytes per second used by
+                                   each DataNode while balancing.
+            - load_replication: If indicated, the dataset is written with
+                                this replication factor (usually 1) and,
+                                once loaded, raised to the default one in the
+                                background (in DynamicDataset, only with
+                                generators). Use wait_for_replication to
+                                wait for the missing replicas.
+            - report_blocks: If "true", the block distribution of the dataset
+                             is logged after loading. It runs a fsck of the
+                             dataset folder, which is slow for large ones.
         
         """
 
         self.params = params
+        self.deployments = {}
+        self.replicating = {}
+
+        if "rebalance_threshold" in params:
+            self.rebalance_threshold = float(params["rebalance_threshold"])
+        else:
+            self.rebalance_threshold = None
+
+        if "rebalance_bandwidth" in params:
+            self.rebalance_bandwidth = int(params["rebalance_bandwidth"])
+        else:
+            self.rebalance_bandwidth = None
+
+        if "load_replication" in params:
+            self.load_replication = int(params["load_replication"])
+        else:
+            self.load_replication = None
+
+        self.report_blocks = \
+            str(params.get("report_blocks", "false")).lower() in \
+            ["true", "yes", "1"]
 
     @abstractmethod
     def load(self, hc, dest, desired_size=None):
@@ -44,6 +121,110 @@ class Dataset(object):
 
         self.deployments[hc, desired_size] = dest
 
+    def resize(self, hc, dest, desired_size):
+        """Change the size of the dataset already loaded in the cluster,
+        reusing the data in the dfs. By default datasets cannot be resized.
+
+        Args:
+          hc (HadoopCluster):
+            The Hadoop cluster where the dataset has been deployed.
+          dest (str):
+            The new dfs folder of the dataset.
+          desired_size (int):
+            The new size of the dataset.
+
+        Returns (bool):
+          True if the dataset has been resized, False if it has to be loaded
+          again.
+        """
+
+        return False
+
+    def _post_load(self, hc, dest):
+        """Rebalance the dfs, raise the replication of the loaded dataset and
+        report its block distribution if required.
+
+        Args:
+          hc (HadoopCluster):
+            The Hadoop cluster where the dataset has been deployed.
+          dest (str):
+            The dfs destination folder.
+        """
+
+        if self.report_blocks:
+            distribution = hc.get_block_distribution(dest)
+            logger.info("Block distribution of " + dest + ": " +
+                        distribution.get_summary())
+
+        if self.rebalance_threshold is not None:
+            hc.rebalance_dfs(self.rebalance_threshold,
+                             self.rebalance_bandwidth)
+
+        if self.load_replication:
+            self._raise_replication(hc, dest)
+
+    def _raise_replication(self, hc, dest):
+        """Start raising the replication of the loaded dataset to the default
+        factor in the background."""
+
+        # A block cannot have more replicas than DataNodes
+        replication = min(hc.get_dfs_replication(), len(hc.hosts))
+        if replication <= self.load_replication:
+            return
+
+        self._stop_replication(hc)
+        logger.info("Raising the replication of " + dest + " from " +
+                    str(self.load_replication) + " to " + str(replication) +
+                    " in the background")
+        proc = hc.set_dfs_replication(dest, replication, wait=False)
+        self.replicating[hc] = (dest, replication, proc)
+
+    def _stop_replication(self, hc):
+        """Stop the setrep command of the dataset if still running."""
+
+        if hc in self.replicating:
+            (_, _, proc) = self.replicating.pop(hc)
+            if not proc.ended:
+                proc.kill()
+
+    def wait_for_replication(self, hc, timeout=None):
+        """Wait until the dataset loaded with a low replication factor has
+        all its replicas. It returns immediately if the replication was not
+        lowered.
+
+        Args:
+          hc (HadoopCluster):
+            The Hadoop cluster where the dataset has been deployed.
+          timeout (float, optional):
+            The maximum number of seconds to wait.
+
+        Returns (bool):
+          True if the dataset is fully replicated, False otherwise.
+        """
+
+        if hc not in self.replicating:
+            return True
+        (dest, replication, proc) = self.replicating[hc]
+
+        start = time.time()
+        proc.wait()
+        if not proc.finished_ok:
+            # The command may fail if the cluster was restarted meanwhile
+            proc = hc.set_dfs_replication(dest, replication)
+            if not proc.finished_ok:
+                logger.warn("Could not raise the replication of " + dest +
+                            ": " + proc.stderr.strip())
+                return False
+
+        if timeout is not None:
+            timeout = max(0, timeout - (time.time() - start))
+        replicated = hc.wait_for_replication(dest, timeout=timeout)
+        if replicated:
+            del self.replicating[hc]
+            logger.info(dest + " fully replicated after waiting %.1f s" %
+                        (time.time() - start))
+        return replicated
+
     def clean(self, hc):
         """Remove the dataset from dfs.
         
@@ -52,10 +233,12 @@ class Dataset(object):
             The Hadoop cluster where the dataset has been deployed.
         """
 
+        self._stop_replication(hc)
+
         removed = False
-        for (hcd, sized) in self.deployments:
+        for (hcd, sized) in self.deployments.keys():
             if hc == hcd:
-                command = "fs -rmr " + self.deployments[hc, sized]
+                command = "fs -rmr " + self.deployments.pop((hc, sized))
                 hc.execute(command, should_be_running=True, verbose=False)
                 removed = True
 
@@ -79,6 +262,42 @@ class StaticDataset(Dataset):
                           locally.
             - pre_load_function: A function to be applied after transfers and
                                  before loading to dfs (usually decompression).
+            - streaming: If "true", files are piped directly into the dfs
+                         instead of being copied first to the nodes' disk. It
+                         is the default when there is no pre_load_function,
+                         which requires the files to be in the nodes, or when
+                         it is hadoop_g5k.util.uncompress. In the latter case
+                         files are decompressed in the stream (archives are
+                         still staged).
+            - max_transfers: The maximum number of concurrent transfers.
+            - max_transfers_per_host: The maximum number of concurrent
+                                      transfers in each host.
+            - exact_size: If "lines", the last file is cut at a line boundary
+                          to obtain exactly the desired size (up to one
+                          line). It can also be "bytes" or the size of
+                          fixed-length records. By default whole files are
+                          loaded.
+            - resume: If "true" (the default), the files completely loaded
+                      in the same dfs folder by a previous load, according
+                      to its journal, are not transferred again if their dfs
+                      length and checksum are still valid.
+            - compaction: If indicated, the files smaller than
+                          compaction_threshold are packed into containers of
+                          the given format (text, sequence or har) up to
+                          container_size bytes, with a side index in the dfs
+                          folder (see hadoop_g5k.compaction). Compacted
+                          datasets are not resized incrementally.
+            - container_size: The maximum size of a container. The dfs block
+                              size by default.
+            - compaction_threshold: The size under which a file is packed.
+                                    Half the container size by default.
+            - verify: If "true", the md5 checksum of every loaded file is
+                      computed in the nodes in parallel and compared with
+                      the checksum of the local file, which is cached in the
+                      manifest. Mismatched files are loaded again. It is not
+                      available with a pre_load_function, and packed files
+                      are not verified.
+            Common dataset parameters are also accepted.
         """
 
         super(StaticDataset, self).__init__(params)
@@ -93,8 +312,96 @@ class StaticDataset(Dataset):
         else:
             self.pre_load_function = None
 
+        # Decompression can be done in the stream
+        stream_pre_load = self.pre_load_function in [None, uncompress]
+
+        if "streaming" in params:
+            self.streaming = \
+                str(params["streaming"]).lower() in ["true", "yes", "1"]
+            if self.streaming and not stream_pre_load:
+                logger.warn("Streaming cannot be used with a "
+                            "pre_load_function. Files will be staged")
+                self.streaming = False
+        else:
+            self.streaming = stream_pre_load
+
+        self.max_transfers = int(params.get("max_transfers",
+                                            DEFAULT_MAX_TRANSFERS))
+        self.max_transfers_per_host = \
+            int(params.get("max_transfers_per_host",
+                           DEFAULT_MAX_TRANSFERS_PER_HOST))
+
+        exact_size = str(params.get("exact_size", "false")).lower()
+        self.exact_size = exact_size not in ["false", "no", "0"]
+        self.record_size = None
+        if self.exact_size and self.pre_load_function:
+            logger.warn("exact_size cannot be used with a pre_load_function. "
+                        "Whole files will be loaded")
+            self.exact_size = False
+        elif exact_size == "bytes":
+            self.record_size = 1
+        elif self.exact_size and exact_size != "lines":
+            self.record_size = int(exact_size)
+
+        self.resume = \
+            str(params.get("resume", "true")).lower() in ["true", "yes", "1"]
+
+        self.compaction = params.get("compaction")
+        if self.compaction and self.pre_load_function:
+            logger.warn("compaction cannot be used with a pre_load_function. "
+                        "Files will not be packed")
+            self.compaction = None
+        elif self.compaction and self.compaction not in CONTAINER_FORMATS:
+            logger.error("Unknown compaction format " + self.compaction +
+                         " (" + ", ".join(CONTAINER_FORMATS) + " are "
+                         "supported). Files will not be packed")
+            self.compaction = None
+        self.container_size = \
+            int(params["container_size"]) if "container_size" in params \
+            else None
+        self.compaction_threshold = \
+            int(params["compaction_threshold"]) \
+            if "compaction_threshold" in params else None
+
+        self.verify = \
+            str(params.get("verify", "false")).lower() in ["true", "yes", "1"]
+        if self.verify and self.pre_load_function:
+            logger.warn("verify cannot be used with a pre_load_function. "
+                        "Files will not be verified")
+            self.verify = False
+
         self.local_path = local_path
 
+        self.loaded = {}
+
+    def _select_files(self, manifest, desired_size):
+        """Return the files to be loaded to obtain the desired size.
+
+        Returns (tuple):
+          The list of local paths, their total size and the number of bytes
+          to be taken from the files which are cut.
+        """
+
+        lengths = {}
+        if desired_size and self.exact_size:
+            (files, real_size, lengths) = \
+                manifest.select_exact(desired_size, self.record_size)
+            if real_size < desired_size and not lengths:
+                logger.warn(
+                    "Dataset files do not fill up to desired size "
+                    "(real size = " + str(real_size) + ")")
+        elif desired_size:
+            (files, real_size) = manifest.select_prefix(desired_size)
+            if real_size < desired_size:
+                logger.warn(
+                    "Dataset files do not fill up to desired size "
+                    "(real size = " + str(real_size) + ")")
+        else:
+            files = manifest.get_files()
+            real_size = manifest.get_total_size()
+
+        return (files, real_size, lengths)
+
     def load(self, hc, dest, desired_size=None):
         """Load the dataset in the given dfs folder by copying it from the
         local folder.
@@ -107,52 +414,356 @@ class StaticDataset(Dataset):
           desired_size (int, optional):
             The size of the data to be copied. If indicated only the first files
             of the dataset up to the given size are copied, if not, the whole
-            dataset is transferred.
+            dataset is transferred. With exact_size, the last file is cut.
+        """
+
+        # Generate list of files to copy
+        manifest = DatasetManifest(self.local_path)
+        (all_files_to_copy, real_size, lengths) = \
+            self._select_files(manifest, desired_size)
+
+        if not hc.running:
+            hc.start()
+        hc.create_dfs_dirs([dest])
+
+        # Skip the files completed by a previous interrupted load
+        if self.resume:
+            journal = LoadJournal(LoadJournal.get_journal_path(
+                hc.master.address + ":" + str(hc.hdfs_port), dest,
+                self.local_path))
+            done = self._get_completed_files(hc, dest, journal, manifest,
+                                             all_files_to_copy, lengths)
+        else:
+            journal = None
+            done = {}
+
+        files_to_copy = [f for f in all_files_to_copy if f not in done]
+        (dfs_files, final_size) = self._transfer_files(
+            hc, dest, manifest, files_to_copy, lengths, journal)
+
+        if journal:
+            journal.set_checksums(hc.get_dfs_checksums(dfs_files.values()))
+
+        for (f, record) in done.items():
+            dfs_files[f] = record["dfs_file"]
+            if final_size:
+                final_size.increment(record["stored"])
+
+        if self.verify:
+            self._verify_files(hc, dest, manifest, dfs_files, lengths,
+                               journal)
+
+        # The size only changes in the transfer with a pre_load_function
+        if final_size:
+            remote_size = final_size.size
+        else:
+            remote_size = hc.get_dfs_size(dest)
+        logger.info("Loading completed: real local size = " + str(real_size) +
+                    ", final remote size = " + str(remote_size))
+
+        self._post_load(hc, dest)
+
+        # Keep track of the loaded files to be able to resize the dataset
+        # (packed files cannot be moved individually)
+        if not self.compaction:
+            self.loaded[hc] = {
+                "dest": dest,
+                "pool": dest.rstrip("/") + "_pool",
+                "files": dict((f, (dfs_files[f], lengths.get(f)))
+                              for f in dfs_files),
+                "in_dest": set(dfs_files),
+                "pool_created": False
+            }
+
+        self.deployments[hc, desired_size] = dest
+
+    def resize(self, hc, dest, desired_size):
+        """Change the size of the dataset loaded in the cluster and move it to
+        the given dfs folder.
+
+        When growing, only the files which are not in the cluster are loaded.
+        When shrinking, the files which are not needed are moved to a pool
+        folder, so that they can be reused if the dataset grows again. Moving
+        a dfs file only modifies the metadata of the NameNode.
+
+        Args:
+          hc (HadoopCluster):
+            The Hadoop cluster where the dataset has been deployed.
+          dest (str):
+            The new dfs folder of the dataset.
+          desired_size (int):
+            The new size of the dataset.
+
+        Returns (bool):
+          True if the dataset has been resized, False if it has to be loaded
+          again.
+        """
+
+        if hc not in self.loaded:
+            return False
+        state = self.loaded[hc]
+
+        manifest = DatasetManifest(self.local_path)
+        (files, real_size, lengths) = self._select_files(manifest,
+                                                         desired_size)
+        wanted = set(files)
+
+        # 1. Move the dataset folder
+        if dest != state["dest"]:
+            parent = os.path.dirname(dest.rstrip("/"))
+            if parent and parent != "/":
+                hc.create_dfs_dirs([parent])
+            hc.execute("fs -mv " + state["dest"] + " " + dest, verbose=False)
+            for key in [k for k in self.deployments
+                        if k[0] == hc and self.deployments[k] == state["dest"]]:
+                del self.deployments[key]
+            old_dest = state["dest"].rstrip("/") + "/"
+            for (f, (dfs_file, length)) in state["files"].items():
+                if f in state["in_dest"]:
+                    state["files"][f] = \
+                        (os.path.join(dest, dfs_file[len(old_dest):]), length)
+            state["dest"] = dest
+
+        # 2. Remove the files cut with a different length
+        stale = [f for f in files
+                 if f in state["files"] and
+                 state["files"][f][1] != lengths.get(f)]
+        if stale:
+            hc.execute("fs -rm " + " ".join(state["files"][f][0]
+                                            for f in stale), verbose=False)
+            for f in stale:
+                del state["files"][f]
+                state["in_dest"].discard(f)
+
+        # 3. Move the files which are not needed to the pool and the needed
+        # ones from the pool
+        to_pool = [f for f in state["in_dest"] if f not in wanted]
+        from_pool = [f for f in files
+                     if f in state["files"] and f not in state["in_dest"]]
+        if to_pool and not state["pool_created"]:
+            hc.create_dfs_dirs([state["pool"]])
+            state["pool_created"] = True
+        self._move_dfs_files(hc, state, to_pool, state["pool"])
+        self._move_dfs_files(hc, state, from_pool, dest)
+        state["in_dest"].difference_update(to_pool)
+        state["in_dest"].update(from_pool)
+
+        # 4. Load the missing files
+        to_load = [f for f in files if f not in state["files"]]
+        if to_load:
+            (dfs_files, _) = self._transfer_files(hc, dest, manifest, to_load,
+                                                  lengths)
+            if self.verify:
+                self._verify_files(hc, dest, manifest, dfs_files, lengths)
+            for f in dfs_files:
+                state["files"][f] = (dfs_files[f], lengths.get(f))
+            state["in_dest"].update(dfs_files)
+            self._post_load(hc, dest)
+
+        logger.info("Dataset resized to " + str(real_size) + " bytes: " +
+                    str(len(to_load)) + " files loaded, " +
+                    str(len(from_pool)) + " reused and " +
+                    str(len(to_pool)) + " set aside")
+
+        self.deployments[hc, desired_size] = dest
+        return True
+
+    def _move_dfs_files(self, hc, state, files, dest_dir):
+        """Move the dfs copies of the given local files to a dfs folder."""
+
+        dfs_files = [state["files"][f][0] for f in files]
+        for i in range(0, len(dfs_files), MAX_FILES_PER_COMMAND):
+            hc.execute("fs -mv " +
+                       " ".join(dfs_files[i:i + MAX_FILES_PER_COMMAND]) +
+                       " " + dest_dir, verbose=False)
+        for (f, dfs_file) in zip(files, dfs_files):
+            state["files"][f] = \
+                (os.path.join(dest_dir, os.path.basename(dfs_file)),
+                 state["files"][f][1])
+
+    def clean(self, hc):
+        """Remove the dataset and the files set aside from dfs.
+
+        Args:
+          hc (HadoopCluster):
+            The Hadoop cluster where the dataset has been deployed.
+        """
+
+        super(StaticDataset, self).clean(hc)
+
+        state = self.loaded.pop(hc, None)
+        if state and state["pool_created"]:
+            hc.execute("fs -rmr " + state["pool"], should_be_running=True,
+                       verbose=False)
+
+    def _get_completed_files(self, hc, dest, journal, manifest, files,
+                             lengths):
+        """Return the files already loaded according to the journal whose dfs
+        copy is still valid. Any other file in the dfs folder is removed, as
+        it may be a partial copy, except for the files of a compaction.
+
+        Returns (dict of str: dict):
+          The journal record of each completed file.
+        """
+
+        if not journal.entries:
+            return {}
+
+        dfs_lengths = hc.get_dfs_file_lengths(dest)
+        dfs_checksums = hc.get_dfs_checksums(
+            [r["dfs_file"] for r in journal.entries.values()
+             if r["dfs_file"] in dfs_lengths])
+        done = journal.get_loaded(manifest, files, lengths, dfs_lengths,
+                                  dfs_checksums)
+
+        # The files of a compaction are not in the journal, and are replaced
+        # when the containers are planned again
+        done_dfs_files = set(r["dfs_file"] for r in done.values())
+        partial = [p for p in dfs_lengths
+                   if p not in done_dfs_files and
+                   not is_compaction_file(os.path.relpath(p, dest))]
+        for i in range(0, len(partial), MAX_FILES_PER_COMMAND):
+            hc.execute("fs -rm " +
+                       " ".join(partial[i:i + MAX_FILES_PER_COMMAND]),
+                       verbose=False)
+
+        logger.info("Resuming load: " + str(len(done)) + " files already "
+                    "loaded, " + str(len(partial)) + " partial copies "
+                    "removed")
+
+        return done
+
+    def _verify_files(self, hc, dest, manifest, dfs_files, lengths,
+                      journal=None):
+        """Compare the checksums of the loaded files with the local ones and
+        load again the files which do not match.
+
+        Args:
+          hc (HadoopCluster):
+            The Hadoop cluster where the dataset has been deployed.
+          dest (str):
+            The dfs destination folder.
+          manifest (DatasetManifest):
+            The manifest of the local folder, where local checksums are
+            cached.
+          dfs_files (dict of str: str):
+            The dfs path of each loaded local file. It is updated with the
+            files loaded again.
+          lengths (dict of str: int):
+            The number of bytes taken from the files which are cut.
+          journal (LoadJournal, optional):
+            The journal where files loaded again are recorded.
+
+        Returns (list of str):
+          The local files which still do not match after being loaded again.
+        """
+
+        def get_mismatched(files):
+            sizes = dict((f, lengths.get(f, os.path.getsize(f)))
+                         for f in files)
+
+            # 1. Local checksums, cached in the manifest
+            pool = ThreadPool(CHECKSUM_THREADS)
+            try:
+                local = dict(zip(files, pool.map(
+                    lambda f: manifest.get_checksum(os.path.basename(f),
+                                                    lengths.get(f)),
+                    files)))
+            finally:
+                pool.close()
+            manifest.save()
+
+            # 2. Dfs checksums, computed in all the nodes
+            remote = {}
+
+            def checksum_function(host, f):
+                remote[f] = hc.get_dfs_md5(dfs_files[f], host)
+
+            dispatcher = FileDispatcher(hc.hosts, files, sizes)
+            dispatcher.run(checksum_function, self.max_transfers,
+                           self.max_transfers_per_host)
+
+            return [f for f in files if remote.get(f) != local[f]]
+
+        logger.info("Verifying the checksums of " + str(len(dfs_files)) +
+                    " files")
+        mismatched = get_mismatched(sorted(dfs_files))
+        if not mismatched:
+            logger.info("All the files were loaded correctly")
+            return []
+
+        logger.warn(str(len(mismatched)) + " files do not match their local "
+                    "copy. Loading them again")
+        for i in range(0, len(mismatched), MAX_FILES_PER_COMMAND):
+            chunk = mismatched[i:i + MAX_FILES_PER_COMMAND]
+            hc.execute("fs -rm " + " ".join(dfs_files.pop(f) for f in chunk),
+                       verbose=False)
+        (reloaded, _) = self._transfer_files(hc, dest, manifest, mismatched,
+                                             lengths, journal)
+        dfs_files.update(reloaded)
+
+        failed = [f for f in mismatched if f not in reloaded]
+        failed.extend(get_mismatched(sorted(reloaded)))
+        if failed:
+            logger.error(str(len(failed)) + " files are still corrupted: " +
+                         ", ".join(failed))
+        return failed
+
+    def _transfer_files(self, hc, dest, manifest, files, lengths,
+                        journal=None):
+        """Transfer the given files into the dfs folder in parallel.
+
+        Args:
+          hc (HadoopCluster):
+            The Hadoop cluster where to deploy the dataset.
+          dest (str):
+            The dfs destination folder.
+          manifest (DatasetManifest):
+            The manifest of the local folder.
+          files (list of str):
+            The local paths of the files.
+          lengths (dict of str: int):
+            The number of bytes to be taken from the files which are cut.
+          journal (LoadJournal, optional):
+            The journal where completed files are recorded.
+
+        Returns (tuple):
+          A dictionary with the dfs path of each transferred file and the
+          collector of the final size, which is None if the size is not
+          changed by the transfer.
         """
 
-        dataset_files = [os.path.join(self.local_path, f) for f in
-                         os.listdir(self.local_path)]
         hosts = hc.hosts
 
-        # Define and create temp dir
+        # Define and create temp dir (only needed if files are staged)
         tmp_dir = "/tmp" + dest
-        action_remove = TaktukRemote("rm -rf " + tmp_dir, hosts)
-        action_remove.run()
-        action_create = TaktukRemote("mkdir -p " + tmp_dir, hosts)
-        action_create.run()
+        if not self.streaming or self.pre_load_function:
+            action_remove = get_remote("rm -rf " + tmp_dir, hosts,
+                                       taktuk=True)
+            action_remove.run()
+            action_create = get_remote("mkdir -p " + tmp_dir, hosts,
+                                       taktuk=True)
+            action_create.run()
 
-        # Generate list of files to copy
-        if desired_size:
-            all_files_to_copy = []
-            dataset_files.sort()
-            real_size = 0
-            while real_size < desired_size:
-                if dataset_files:
-                    all_files_to_copy.append(dataset_files[0])
-                    real_size += os.path.getsize(dataset_files[0])
-                    del dataset_files[0]
-                else:
-                    logger.warn(
-                        "Dataset files do not fill up to desired size "
-                        "(real size = " + str(real_size) + ")")
-                    break
+        # Assign files to hosts balancing their sizes
+        sizes = dict((manifest.get_path(e), e["size"])
+                     for e in manifest.entries)
+        sizes.update(lengths)
 
-        else:
-            real_size = 0
-            all_files_to_copy = dataset_files
-            for f in all_files_to_copy:
-                real_size += os.path.getsize(f)
+        # Pack the small files into containers
+        containers = {}
+        if self.compaction:
+            compactor = SmallFileCompactor(hc, dest, self.compaction,
+                                           self.container_size,
+                                           self.compaction_threshold,
+                                           self.load_replication)
+            (files, containers) = compactor.plan(files, sizes)
+            sizes.update(containers)
 
-        # Assign files to hosts
-        files_per_host = [[]] * len(hosts)
-        for idx in range(0, len(hosts)):
-            files_per_host[idx] = all_files_to_copy[idx::len(hosts)]
+        dispatcher = FileDispatcher(hosts, files + containers.keys(), sizes)
 
-        # Create threads and launch them
         logger.info(
             "Loading dataset in parallel into " + str(len(hosts)) + " hosts")
-        if not hc.running:
-            hc.start()
 
         class SizeCollector:
             size = 0
@@ -168,48 +779,431 @@ class StaticDataset(Dataset):
                 finally:
                     self.lock.release()
 
-        def copy_function(host, files_to_copy, collector=None):
-            action = Put([host], files_to_copy, tmp_dir)
+        if self.pre_load_function:
+            final_size = SizeCollector()
+        else:
+            final_size = None
+
+        dfs_files = {}
+
+        def file_done(f, dfs_file, stored):
+            dfs_files[f] = dfs_file
+            if journal:
+                journal.record(manifest.get_entry(os.path.basename(f)),
+                               dfs_file, stored, lengths.get(f))
+
+        def stream_function(host, f):
+            if not self.pre_load_function:
+                dfs_file = os.path.join(dest, os.path.basename(f))
+                stored_size = hc.stream_to_dfs(
+                    f, dfs_file, host, lengths.get(f),
+                    replication=self.load_replication)
+                if stored_size is not None:
+                    file_done(f, dfs_file, stored_size)
+                return
+
+            codec = get_stream_codec(f)
+            if not codec:
+                # Archives need to be staged to be uncompressed
+                copy_function(host, f)
+                return
+
+            dfs_file = os.path.join(
+                dest, os.path.basename(get_uncompressed_name(f)))
+            stored_size = hc.stream_to_dfs(
+                f, dfs_file, host,
+                filter_command=get_stream_decompression_command(codec),
+                replication=self.load_replication)
+            if stored_size is not None:
+                final_size.increment(stored_size)
+                file_done(f, dfs_file, stored_size)
+
+        def copy_function(host, f):
+            if f in lengths:
+                action = get_stream_process(
+                    f, "cat > " + os.path.join(tmp_dir, os.path.basename(f)),
+                    host, lengths[f])
+            else:
+                action = get_put([host], [f], tmp_dir)
             action.run()
+            if not action.ok:
+                logger.warn("Could not copy " + f + " to " + str(host))
+                return
 
-            local_final_size = 0
+            src_file = os.path.join(tmp_dir, os.path.basename(f))
+            stored_size = sizes[f]
+            if self.pre_load_function:
+                src_file = self.pre_load_function(src_file, host)
+
+                action = get_process("du -b " + src_file + "| cut -f1",
+                                     host)
+                action.run()
+                try:
+                    stored_size = int(action.stdout.strip())
+                except ValueError:
+                    logger.warn("Could not get the size of " + src_file +
+                                " in " + str(host))
+                    return
 
-            for f in files_to_copy:
-                src_file = os.path.join(tmp_dir, os.path.basename(f))
+            dfs_file = os.path.join(dest, os.path.basename(src_file))
+            if hc.put_node_file(src_file, dfs_file, host,
+                                self.load_replication):
                 if self.pre_load_function:
-                    src_file = self.pre_load_function(src_file, host)
+                    final_size.increment(stored_size)
+                file_done(f, dfs_file, stored_size)
 
-                    action = SshProcess("du -b " + src_file + "| cut -f1", host)
-                    action.run()
+        failed_containers = []
 
-                    local_final_size += int(action.stdout.strip())
+        def dispatch_function(host, f):
+            if f in containers:
+                if not compactor.write_container(host, f):
+                    failed_containers.append(f)
+            elif self.streaming:
+                stream_function(host, f)
+            else:
+                copy_function(host, f)
 
-                hc.execute("fs -put " + src_file + " " +
-                           os.path.join(dest, os.path.basename(src_file)),
-                           host, True, False)
+        dispatcher.run(dispatch_function, self.max_transfers,
+                       self.max_transfers_per_host)
 
-            if collector:
-                collector.increment(local_final_size)
+        # Write again the containers which failed
+        if failed_containers:
+            logger.warn(str(len(failed_containers)) + " containers could not "
+                        "be written. Retrying")
+            retried = sorted(failed_containers)
+            del failed_containers[:]
+            dispatcher = FileDispatcher(hosts, retried, sizes)
+            dispatcher.run(dispatch_function, self.max_transfers,
+                           self.max_transfers_per_host)
+            if failed_containers:
+                logger.error(
+                    "Could not write " + str(len(failed_containers)) +
+                    " containers: " + ", ".join(sorted(failed_containers)) +
+                    ". The " + str(sum(len(compactor.containers[c])
+                                       for c in failed_containers)) +
+                    " files packed in them are missing from the dataset")
 
-        if self.pre_load_function:
-            final_size = SizeCollector()
+        if containers:
+            compactor.finish()
+
+        return (dfs_files, final_size)
+
+
+class SyntheticDataset(Dataset):
+    """This class manages a synthetic dataset, i.e., a dataset that is
+    generated in parallel by all the nodes of the cluster and stored directly
+    into the dfs.
+
+    The data is produced by hadoop_g5k.engine.generator, which is copied to
+    the nodes and requires NumPy there. The dataset is divided in parts, each
+    one generated with a seed depending only on the dataset seed and the index
+    of the part, so that the same dataset is obtained whatever the node
+    generating each part.
+    """
+
+    def __init__(self, params):
+        """Create a synthetic dataset with the given params.
+
+        Args:
+          params (dict):
+            A dictionary with the parameters. This dataset accepts the
+            following parameters:
+            - data_type: The type of data to be generated: "terasort" (records
+                         of 100 bytes in the format of TeraGen), "text" (lines
+                         of words following a Zipf distribution) or "kv"
+                         (lines with a key and a value separated by a tab).
+                         Default is "text".
+            - seed: The seed of the dataset. Default is 0.
+            - parts_per_host: The number of files generated by each host.
+            - python: The Python interpreter used in the nodes.
+            - vocabulary_size, zipf_exponent, words_per_line: The
+                         characteristics of the text.
+            - key_size, value_size: The size of the keys and values.
+            Common dataset parameters are also accepted.
+        """
+
+        super(SyntheticDataset, self).__init__(params)
+
+        self.data_type = params.get("data_type", generator.TEXT)
+        if self.data_type not in generator.DATA_TYPES:
+            raise ValueError("Unknown data type " + self.data_type +
+                             ". Supported types are " +
+                             ", ".join(generator.DATA_TYPES))
+
+        self.seed = int(params.get("seed", 0))
+        self.parts_per_host = int(params.get("parts_per_host",
+                                             DEFAULT_MAX_TRANSFERS_PER_HOST))
+        self.python = params.get("python", "python")
+
+        self.generator_options = {}
+        for name in ["vocabulary_size", "zipf_exponent", "words_per_line",
+                     "key_size", "value_size"]:
+            if name in params:
+                self.generator_options[name] = params[name]
+
+    def _get_part_sizes(self, size, num_parts):
+        """Divide the size among the parts. TeraSort parts contain whole
+        records."""
+
+        if self.data_type == generator.TERASORT:
+            unit = generator.TERASORT_RECORD_SIZE
         else:
-            final_size = None
+            unit = 1
 
-        threads = []
-        for idx, h in enumerate(hosts):
-            if files_per_host[idx]:
-                t = threading.Thread(target=copy_function,
-                                     args=(h, files_per_host[idx], final_size))
-                t.start()
-                threads.append(t)
+        units = size // unit
+        sizes = [(units // num_parts) * unit] * num_parts
+        for i in range(units % num_parts):
+            sizes[i] += unit
+        return [s for s in sizes if s > 0]
 
-        # Wait for the threads to finish
-        for t in threads:
-            t.join()
+    def _get_generator_command(self, script, size, part, first_record):
+        command = (self.python + " " + script + " " + self.data_type + " " +
+                   str(size) + " " + str(self.seed) + " " + str(part))
+        if self.data_type == generator.TERASORT:
+            command += " --first-record " + str(first_record)
+        for (name, value) in sorted(self.generator_options.items()):
+            command += " --" + name.replace("_", "-") + " " + str(value)
+        return command
+
+    def load(self, hc, dest, desired_size=None):
+        """Generate the dataset in the given dfs folder.
+
+        Args:
+          hc (HadoopCluster):
+            The Hadoop cluster where to deploy the dataset.
+          dest (str):
+            The dfs destination folder.
+          desired_size (int):
+            The size of the data to be generated. TeraSort datasets are
+            rounded down to whole records.
+        """
+
+        if not desired_size:
+            raise ValueError("The size of a synthetic dataset should be "
+                             "indicated")
+
+        hosts = hc.hosts
+
+        # 1. Copy the generator to the nodes
+        tmp_dir = "/tmp" + dest
+        get_remote("rm -rf " + tmp_dir, hosts, taktuk=True).run()
+        get_remote("mkdir -p " + tmp_dir, hosts, taktuk=True).run()
+        script_file = os.path.splitext(generator.__file__)[0] + ".py"
+        action = get_put(hosts, [script_file], tmp_dir, taktuk=True)
+        action.run()
+        if not action.ok:
+            logger.error("Could not copy the generator to the nodes")
+            get_remote("rm -rf " + tmp_dir, hosts, taktuk=True).run()
+            return
+        script = os.path.join(tmp_dir, os.path.basename(script_file))
+
+        # 2. Define the parts
+        part_sizes = self._get_part_sizes(desired_size,
+                                          len(hosts) * self.parts_per_host)
+        parts = ["part-%05d" % i for i in range(len(part_sizes))]
+        sizes = dict(zip(parts, part_sizes))
+        indexes = {}
+        first_records = {}
+        num_records = 0
+        for (idx, p) in enumerate(parts):
+            indexes[p] = idx
+            first_records[p] = num_records
+            num_records += sizes[p] // generator.TERASORT_RECORD_SIZE
+
+        # 3. Generate the parts in parallel
+        logger.info("Generating " + str(sum(part_sizes)) + " bytes of " +
+                    self.data_type + " data in " + str(len(parts)) +
+                    " parts in " + str(len(hosts)) + " hosts")
+        if not hc.running:
+            hc.start()
+        hc.create_dfs_dirs([dest])
+
+        failed = []
+
+        def generate_function(host, part):
+            command = self._get_generator_command(
+                script, sizes[part], indexes[part], first_records[part])
+            if not hc.pipe_to_dfs(command, os.path.join(dest, part), host,
+                                  self.load_replication):
+                failed.append(part)
+
+        dispatcher = FileDispatcher(hosts, parts, sizes)
+        dispatcher.run(generate_function, len(parts), self.parts_per_host)
+
+        if failed:
+            logger.error("Generation failed for " + str(len(failed)) +
+                         " parts: " + ", ".join(sorted(failed)))
+
+        get_remote("rm -rf " + tmp_dir, hosts, taktuk=True).run()
+
+        self._post_load(hc, dest)
+
+        self.deployments[hc, desired_size] = dest
 
-        logger.info("Loading completed: real local size = " + str(real_size) +
-                    ", final remote size = " + str(final_size.size))
+
+class RemoteSourceDataset(Dataset):
+    """This class manages a dataset stored in a remote source, i.e., an HTTP
+    server, an S3-compatible object store or a directory mounted in all the
+    nodes (e.g., through NFS).
+
+    Each node fetches its share of the files directly from the source and
+    pipes them into the dfs, so the frontend only coordinates the load. Large
+    files are fetched with several range requests in parallel.
+    """
+
+    def __init__(self, params):
+        """Create a remote source dataset with the given params.
+
+        Args:
+          params (dict):
+            A dictionary with the parameters. This dataset accepts the
+            following parameters:
+            - source: The URL of the directory containing the files:
+                      http(s)://..., s3://bucket/prefix or file:///path or
+                      nfs:///path for a directory mounted in every node.
+            - listing: The name, relative to the source, of a file listing
+                       the name and size of each file of the dataset. If not
+                       given, the HTML index (HTTP), the bucket listing (S3)
+                       or the directory (file and nfs) is used.
+            - connections: The number of parallel connections used to fetch
+                           a single file.
+            - range_size: The minimum number of bytes fetched by each
+                          connection.
+            - curl_options: Additional options of curl (e.g., headers).
+            - s3_endpoint, s3_region, s3_access_key, s3_secret_key: The
+                          endpoint and credentials of S3 sources. Requests
+                          are anonymous if no access key is given.
+            - tmp_dir: The directory of the nodes where the ranges of a file
+                       are stored before being put in the dfs.
+            - max_transfers: The maximum number of concurrent transfers.
+            - max_transfers_per_host: The maximum number of concurrent
+                                      transfers in each host.
+            Common dataset parameters are also accepted.
+        """
+
+        super(RemoteSourceDataset, self).__init__(params)
+
+        self.source = get_data_source(params["source"], params)
+
+        self.connections = int(params.get("connections",
+                                          DEFAULT_CONNECTIONS))
+        self.range_size = int(params.get("range_size", DEFAULT_RANGE_SIZE))
+        self.tmp_dir = params.get("tmp_dir", "/tmp")
+
+        self.max_transfers = int(params.get("max_transfers",
+                                            DEFAULT_MAX_TRANSFERS))
+        self.max_transfers_per_host = \
+            int(params.get("max_transfers_per_host",
+                           DEFAULT_MAX_TRANSFERS_PER_HOST))
+
+    def _select_files(self, sizes, desired_size):
+        """Return the shortest list of files, in name order, whose size
+        reaches the desired size, and their total size."""
+
+        files = []
+        real_size = 0
+        for name in sorted(sizes):
+            if desired_size and real_size >= desired_size:
+                break
+            files.append(name)
+            real_size += sizes[name]
+
+        if desired_size and real_size < desired_size:
+            logger.warn("Dataset files do not fill up to desired size "
+                        "(real size = " + str(real_size) + ")")
+
+        return (files, real_size)
+
+    def _fetch_files(self, hc, dest, files, sizes):
+        """Fetch the given files into the dfs folder in parallel. A file is
+        failed if any command of its pipe exits with an error, even if fs -put
+        stored what it received.
+
+        Returns (list of str):
+          The files which could not be fetched.
+        """
+
+        failed = []
+
+        def fetch_function(host, name):
+            num_ranges = -(-sizes[name] // self.range_size)
+            command = self.source.get_fetch_command(
+                name, sizes[name], min(self.connections, num_ranges),
+                self.tmp_dir)
+            if not hc.pipe_to_dfs(command, os.path.join(dest, name), host,
+                                  self.load_replication):
+                failed.append(name)
+
+        dispatcher = FileDispatcher(hc.hosts, files, sizes)
+        dispatcher.run(fetch_function, self.max_transfers,
+                       self.max_transfers_per_host)
+
+        return failed
+
+    def load(self, hc, dest, desired_size=None):
+        """Load the dataset in the given dfs folder by fetching it from the
+        source in all the nodes.
+
+        Args:
+          hc (HadoopCluster):
+            The Hadoop cluster where to deploy the dataset.
+          dest (str):
+            The dfs destination folder.
+          desired_size (int, optional):
+            The size of the data to be loaded. If indicated only the first
+            files of the dataset up to the given size are loaded, if not, the
+            whole dataset is transferred.
+        """
+
+        if not hc.running:
+            hc.start()
+
+        # 1. List the files
+        sizes = self.source.list_files(hc)
+        if not sizes:
+            logger.error("No files found in " + self.source.url)
+            return
+        (files, real_size) = self._select_files(sizes, desired_size)
+
+        # 2. Fetch them in parallel
+        logger.info("Fetching " + str(len(files)) + " files (" +
+                    str(real_size) + " bytes) from " + self.source.url +
+                    " into " + str(len(hc.hosts)) + " hosts")
+        hc.create_dfs_dirs([dest])
+        failed = self._fetch_files(hc, dest, files, sizes)
+
+        # 3. Verify the lengths and fetch again the incomplete files
+        dfs_lengths = hc.get_dfs_file_lengths(dest)
+        incomplete = [f for f in files
+                      if f in failed or
+                      dfs_lengths.get(os.path.join(dest, f)) != sizes[f]]
+        if incomplete:
+            logger.warn(str(len(incomplete)) + " files were not fetched "
+                        "correctly. Retrying")
+
+            # fs -put does not overwrite the truncated files
+            stored = [os.path.join(dest, f) for f in incomplete
+                      if os.path.join(dest, f) in dfs_lengths]
+            for i in range(0, len(stored), MAX_FILES_PER_COMMAND):
+                chunk = stored[i:i + MAX_FILES_PER_COMMAND]
+                hc.execute("fs -rm " + " ".join(chunk), verbose=False)
+
+            failed = self._fetch_files(hc, dest, incomplete, sizes)
+            dfs_lengths = hc.get_dfs_file_lengths(dest)
+            incomplete = [f for f in incomplete
+                          if f in failed or
+                          dfs_lengths.get(os.path.join(dest, f)) !=
+                          sizes[f]]
+            if incomplete:
+                logger.error("Could not fetch " + str(len(incomplete)) +
+                             " files: " + ", ".join(incomplete))
+
+        logger.info("Loading completed: source size = " + str(real_size) +
+                    ", final remote size = " +
+                    str(sum(dfs_lengths.get(os.path.join(dest, f), 0)
+                            for f in files)))
+
+        self._post_load(hc, dest)
 
         self.deployments[hc, desired_size] = dest
 
@@ -217,6 +1211,11 @@ class StaticDataset(Dataset):
 class DynamicDataset(Dataset):
     """This class manages a dynamic dataset, i.e., a dataset that is created
     dynamically by a Hadoop job.
+
+    The job can be one of the generators of Hadoop examples (teragen,
+    randomwriter and randomtextwriter), whose parameters are computed from the
+    desired size and the number of map slots of the cluster, or any other job
+    whose params contain the macros ${size}, ${maps} and ${dest}.
     """
 
     def __init__(self, params):
@@ -226,30 +1225,96 @@ class DynamicDataset(Dataset):
           params (dict):
             A dictionary with the parameters. This dataset needs the following
             parameters:
-            - job.jar: The path to the jar containing the job to be executed.
-            - job.params: The set of params of the job.
+            - job.jar: The path to the jar containing the job to be executed
+                       (e.g., the Hadoop examples jar).
+            - job.params: The set of params of the job. It can use the macros
+                          ${size}, ${maps} and ${dest}.
             - job.libjars: The list of jars to be used as libraries.
+            - generator: The generator of Hadoop examples used: "teragen",
+                         "randomwriter" or "randomtextwriter". If indicated,
+                         job.params are not needed.
+            - maps: The number of map tasks. By default, the number of map
+                    slots in the cluster, so that data is generated in a single
+                    wave.
+            - size_tolerance: The relative difference allowed between the
+                              desired and the generated sizes before warning.
+            Common dataset parameters are also accepted.
         """
 
         super(DynamicDataset, self).__init__(params)
 
         # Job parameters
-        jobjar = params["job.jar"]
+        self.jobjar = params["job.jar"]
 
-        if "libjars" in params:
-            libjars = params["job.libjars"].split()
+        if "job.libjars" in params:
+            self.libjars = params["job.libjars"].split()
         else:
-            libjars = []
+            self.libjars = []
 
         if "job.params" in params:
-            jobparams = params["job.params"]
+            self.jobparams = params["job.params"]
+        else:
+            self.jobparams = []
+
+        self.generator = params.get("generator")
+        if self.generator and self.generator not in GENERATORS:
+            raise ValueError("Unknown generator " + self.generator +
+                             ". Supported generators are " +
+                             ", ".join(sorted(GENERATORS)))
+
+        if "maps" in params:
+            self.maps = int(params["maps"])
         else:
-            jobparams = []
+            self.maps = None
 
-        self.job = HadoopJarJob(jobjar, jobparams, libjars)
+        self.size_tolerance = float(params.get("size_tolerance",
+                                               DEFAULT_SIZE_TOLERANCE))
 
-        # Other parameters
-        # TODO
+        self.job = HadoopJarJob(self.jobjar, self.jobparams, self.libjars)
+
+    def _get_job_params(self, hc, dest, desired_size, num_maps):
+        """Return the params of the job generating the dataset.
+
+        Args:
+          hc (HadoopCluster):
+            The Hadoop cluster where the dataset is generated.
+          dest (str):
+            The dfs destination folder.
+          desired_size (int):
+            The size of the data to be generated, or None.
+          num_maps (int):
+            The number of map tasks.
+        """
+
+        if not self.generator:
+            if isinstance(self.jobparams, basestring):
+                params = self.jobparams
+            else:
+                params = " ".join(self.jobparams)
+            params = params.replace("${size}", str(desired_size or ""))
+            params = params.replace("${maps}", str(num_maps))
+            params = params.replace("${dest}", dest)
+            return params
+
+        (record_size, v1_params, v2_params) = GENERATORS[self.generator]
+        if isinstance(hc, HadoopV2Cluster):
+            prop_names = v2_params
+        else:
+            prop_names = v1_params
+        (maps_prop, total_prop, per_map_prop) = prop_names
+
+        params = [self.generator, "-D" + maps_prop + "=" + str(num_maps)]
+        if self.load_replication:
+            params.append("-Ddfs.replication=" + str(self.load_replication))
+        if record_size:
+            params.append(str(desired_size // record_size))
+        else:
+            per_map = (desired_size + num_maps - 1) // num_maps
+            params.append("-D" + total_prop + "=" + str(desired_size))
+            params.append("-D" + per_map_prop + "=" + str(per_map))
+        params.append(dest)
+
+        return params
 
     def load(self, hc, dest, desired_size=None):
         """Load the dataset in the given dfs folder by generating it
@@ -261,9 +1326,47 @@ class DynamicDataset(Dataset):
           dest (str):
             The dfs destination folder.
           desired_size (int, optional):
-            The size of the data to be copied.
+            The size of the data to be generated. It is mandatory for
+            generators.
         """
 
+        if self.generator and not desired_size:
+            raise ValueError("The size of a dataset created with " +
+                             self.generator + " should be indicated")
+
+        # 1. Compute job params
+        if self.maps:
+            num_maps = self.maps
+        else:
+            num_maps = hc.get_map_slots()
+        if self.generator:
+            record_size = GENERATORS[self.generator][0]
+            if record_size:
+                num_maps = max(1, min(num_maps, desired_size // record_size))
+
+        self.job = HadoopJarJob(
+            self.jobjar, self._get_job_params(hc, dest, desired_size, num_maps),
+            self.libjars)
+
+        # 2. Generate
+        logger.info("Generating dataset in " + dest + " with " +
+                    str(num_maps) + " maps")
         hc.execute_job(self.job)
+        if not self.job.success:
+            logger.error("The job generating the dataset failed")
+
+        # 3. Verify size
+        if desired_size:
+            real_size = hc.get_dfs_size(dest)
+            logger.info("Generation completed: desired size = " +
+                        str(desired_size) + ", final remote size = " +
+                        str(real_size))
+            if real_size is None or \
+                    abs(real_size - desired_size) > \
+                    self.size_tolerance * desired_size:
+                logger.warn("The generated dataset does not have the desired "
+                            "size")
+
+        self._post_load(hc, dest)
 
         self.deployments[hc, desired_size] = dest
@@ -1,17 +1,16 @@
+import copy
 import datetime
 import os
 import re
 import sys
+import threading
 import time
 
 from ConfigParser import ConfigParser
 
-from execo.action import Get
-from execo.process import SshProcess
 from execo.time_utils import timedelta_to_seconds, format_date, get_seconds
 from execo_engine import logger
 from execo_engine.engine import Engine
-from execo_engine.sweep import ParamSweeper, sweep
 from execo_g5k.api_utils import get_cluster_site
 from execo_g5k.kadeploy import Deployment, deploy
 from execo_g5k.oar import oarsub, get_oar_job_nodes, get_oar_job_info, oardel
@@ -20,7 +19,13 @@ from execo_g5k.planning import get_jobs_specs, get_planning, compute_slots
 from networkx import DiGraph, NetworkXUnfeasible, topological_sort
 
 from hadoop_g5k.cluster import HadoopCluster
+from hadoop_g5k.cluster_v2 import HadoopV2Cluster, CAPACITY_SCHEDULER
+from hadoop_g5k.engine.cache import DatasetCache
+from hadoop_g5k.engine.scheduler import CombinationScheduler
+from hadoop_g5k.engine.store import CombinationStore
+from hadoop_g5k.local import get_process, get_get
 from hadoop_g5k.objects import HadoopJarJob
+from hadoop_g5k.properties import JOB, get_property_component
 from hadoop_g5k.util import import_class
 
 
@@ -282,6 +287,7 @@ class HadoopEngine(Engine):
                     default="1:00:00")
 
         self.hc = None
+        self.hc_class = HadoopCluster
 
         # Configuration variables
         self.macro_manager = MacroManager()
@@ -298,11 +304,37 @@ class HadoopEngine(Engine):
         self.num_repetitions = 1
 
         self.hadoop_props = None
+        self.hadoop_conf = None
+        self.job_properties = {}
+
+        self.scheduler = None
+        self.store = None
+
+        self.snapshot_datasets = False
+        self.ds_snapshots = {}
+
+        self.incremental_datasets = False
+        self.dataset_cache = None
+        self.ds = None
+        self.ds_key = None
+        self.ds_resize_key = None
 
         self.use_kadeploy = False
         self.kadeploy_env_file = None
         self.kadeploy_env_name = None
 
+        self.num_subclusters = 1
+        self.subclusters = []
+        self.subcluster_id = None
+        self.subcluster_ds_keys = {}
+
+        self.concurrent_jobs = 1
+        self.yarn_scheduler = CAPACITY_SCHEDULER
+        self.yarn_queues = None
+        self.throughput_file_name = "throughput.csv"
+        self.throughput_file = None
+        self.batch_id = 0
+
     def run(self):
         """Execute a test suite. The execution workflow is as follows:
 
@@ -322,6 +354,9 @@ class HadoopEngine(Engine):
           to the loaded dataset.
 
         4. Clean all resources.
+
+        If several sub-clusters are used, steps 3.2 and 3.3 are performed in
+        each of them in parallel until all the combinations are consumed.
         """
 
         # Get parameters
@@ -347,7 +382,7 @@ class HadoopEngine(Engine):
 
             job_is_dead = False
             # While they are combinations to treat
-            while len(self.sweeper.get_remaining()) > 0:
+            while self.store.get_num_remaining() > 0:
 
                 # SETUP
                 # If no job, we make a reservation and prepare the hosts for the
@@ -357,32 +392,22 @@ class HadoopEngine(Engine):
                     success = self.setup()
                     if not success:
                         break
+                    if self.dataset_cache is not None:
+                        self.dataset_cache.clear()
+                    # The dfs of the sub-clusters is lost with the reservation
+                    for engine in self.subclusters:
+                        engine.hc = None
                 else:
                     self.hosts = get_oar_job_nodes(self.oar_job_id,
                                                    self.frontend)
                 if not self.hc:
-                    self.hc = HadoopCluster(self.hosts)
+                    self.hc = self._create_cluster(self.hosts)
                 # SETUP FINISHED
 
-                # Getting the next combination (which requires a ds deployment)
-                comb = self.sweeper.get_next()
-                self.raw_comb = comb.copy()
-                self.comb = comb
-                self.prepare_dataset(comb)
-                self.xp_wrapper(comb)
-
-                # subloop over the combinations that use the same dataset
-                while True:
-                    newcomb = self.sweeper.get_next(
-                        lambda r: filter(self._uses_same_ds, r))
-                    if newcomb:
-                        self.raw_comb = newcomb.copy()
-                        try:
-                            self.xp_wrapper(newcomb)
-                        except:
-                            break
-                    else:
-                        break
+                if self.num_subclusters > 1:
+                    self.run_subclusters()
+                else:
+                    self.run_ds_combinations()
 
                 if get_oar_job_info(self.oar_job_id,
                                     self.frontend)['state'] == 'Error':
@@ -398,30 +423,275 @@ class HadoopEngine(Engine):
                     logger.info('Keeping job alive for debugging')
 
             # Clean cluster
-            if self.hc:
-                if self.hc.initialized:
-                    self.hc.clean()
+            for engine in [self] + self.subclusters:
+                if engine.hc:
+                    if engine.hc.initialized:
+                        engine.hc.clean()
+                    engine.hc.clean_snapshots()
 
             # Close summary files
-            if self.summary_file:
-                self.summary_file.close()
-            if self.ds_summary_file:
-                self.ds_summary_file.close()
-
-    def _uses_same_ds(self, candidate_comb):
-        """Determine if the candidate combination uses the same dataset as the
-        current one.
-        
-        Args:
-          candidate_comb (dict):
-            The combination candidate to be selected as the new combination.
+            for engine in [self] + self.subclusters:
+                if engine.summary_file:
+                    engine.summary_file.close()
+                if engine.ds_summary_file:
+                    engine.ds_summary_file.close()
+                if engine.throughput_file:
+                    engine.throughput_file.close()
+
+    def _create_cluster(self, hosts):
+        """Create the Hadoop cluster of the given hosts. If several jobs are
+        executed at the same time, its scheduler is configured with a queue
+        for each of them."""
+
+        hc = self.hc_class(hosts)
+        if self.concurrent_jobs > 1:
+            hc.set_queues(self.yarn_queues, self.yarn_scheduler)
+        return hc
+
+    def run_ds_combinations(self):
+        """Load the dataset of the next combination and perform the
+        experiments of all the combinations using it.
+
+        Returns (bool):
+          False if there was no combination left, True otherwise.
         """
 
-        for var in self.ds_parameters.keys():
-            if candidate_comb[var] != self.raw_comb[var]:
-                return False
+        # Getting the next combination (which requires a ds deployment)
+        comb = self._get_next_combination()
+        if comb is None:
+            return False
+        self.raw_comb = comb.copy()
+        self.comb = comb
+        self.prepare_dataset(comb)
+
+        if self.concurrent_jobs > 1:
+            self._run_ds_batches(comb)
+            return True
+
+        self.xp_wrapper(comb)
+
+        # subloop over the combinations that use the same dataset
+        while True:
+            newcomb = self._get_next_combination(same_ds=True)
+            if newcomb:
+                self.raw_comb = newcomb.copy()
+                try:
+                    self.xp_wrapper(newcomb)
+                except:
+                    break
+            else:
+                break
+
         return True
 
+    def _run_ds_batches(self, comb):
+        """Perform the experiments of all the combinations using the loaded
+        dataset, several of them at the same time.
+
+        Args:
+          comb (dict):
+            The first combination to be executed.
+        """
+
+        self.xp_batch_wrapper(self._get_batch(comb))
+
+        # subloop over the combinations that use the same dataset
+        while True:
+            newcomb = self._get_next_combination(same_ds=True)
+            if newcomb:
+                self.raw_comb = newcomb.copy()
+                try:
+                    self.xp_batch_wrapper(self._get_batch(newcomb))
+                except:
+                    break
+            else:
+                break
+
+    def _get_batch(self, comb):
+        """Return the given combination along with the next ones that can be
+        executed at the same time, i.e., those using the same dataset and
+        daemon configuration.
+
+        Args:
+          comb (dict):
+            The first combination of the batch.
+        """
+
+        batch = [comb]
+        while len(batch) < self.concurrent_jobs:
+            newcomb = self._get_next_combination(same_conf=True)
+            if not newcomb:
+                break
+            batch.append(newcomb)
+        return batch
+
+    def run_subclusters(self):
+        """Split the reserved hosts into sub-clusters and consume the
+        combinations in all of them in parallel. Each sub-cluster has its own
+        dfs, datasets and result files.
+        """
+
+        # 1. Create the sub-clusters
+        hosts_per_subcluster = len(self.hosts) // self.num_subclusters
+        if hosts_per_subcluster == 0:
+            logger.error("Not enough hosts for " + str(self.num_subclusters) +
+                         " sub-clusters")
+            raise ParameterException("Not enough hosts for " +
+                                     str(self.num_subclusters) +
+                                     " sub-clusters")
+
+        partition = [self.hosts[i * hosts_per_subcluster:
+                                (i + 1) * hosts_per_subcluster]
+                     for i in range(self.num_subclusters)]
+        if len(self.hosts) % self.num_subclusters:
+            logger.warn(str(len(self.hosts) % self.num_subclusters) +
+                        " hosts are not used by any sub-cluster")
+
+        if not self.subclusters:
+            self.subclusters = [self._create_subcluster(idx)
+                                for idx in range(self.num_subclusters)]
+        for (engine, hosts) in zip(self.subclusters, partition):
+            if not engine.hc or engine.hc.hosts != hosts:
+                engine._set_subcluster_hosts(hosts)
+
+        # 2. Consume the combinations in parallel
+        threads = [threading.Thread(target=engine._run_subcluster,
+                                    name="subcluster-" + str(idx))
+                   for (idx, engine) in enumerate(self.subclusters)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def _create_subcluster(self, idx):
+        """Return a copy of the engine that runs combinations in a
+        sub-cluster, sharing the store of combinations but with its own
+        cluster state and result files.
+
+        Args:
+          idx (int):
+            The index of the sub-cluster.
+        """
+
+        engine = copy.copy(self)
+        engine.subclusters = []
+        engine.subcluster_id = idx
+        engine.hc = None
+        engine.macro_manager = copy.deepcopy(self.macro_manager)
+        engine.comb_id = 0
+        engine.ds_id = 0
+
+        # The store and the datasets used by each sub-cluster are shared and
+        # only accessed with the lock of the store. The rest of the state
+        # belongs to the sub-cluster
+        engine.store = self.store
+        engine.subcluster_ds_keys = self.subcluster_ds_keys
+        if self.dataset_cache is not None:
+            engine.dataset_cache = DatasetCache(self.dataset_cache.max_fraction)
+        engine._reset_cluster_state()
+
+        # Results of each sub-cluster are kept apart
+        name = "sc" + str(idx)
+        if self.stats_path:
+            engine.stats_path = os.path.join(self.stats_path, name)
+            if not os.path.exists(engine.stats_path):
+                os.makedirs(engine.stats_path)
+        if self.output_path:
+            engine.output_path = os.path.join(self.output_path, name)
+            if not os.path.exists(engine.output_path):
+                os.makedirs(engine.output_path)
+        (root, ext) = os.path.splitext(self.summary_file_name)
+        engine.summary_file_name = root + "-" + name + ext
+        (root, ext) = os.path.splitext(self.ds_summary_file_name)
+        engine.ds_summary_file_name = root + "-" + name + ext
+        (root, ext) = os.path.splitext(self.throughput_file_name)
+        engine.throughput_file_name = root + "-" + name + ext
+        engine.batch_id = 0
+        engine._open_summary_files()
+
+        return engine
+
+    def _set_subcluster_hosts(self, hosts):
+        """Create the Hadoop cluster of a sub-cluster in the given hosts. Each
+        sub-cluster uses its own ports."""
+
+        self.hc = self._create_cluster(hosts)
+        self.hc.hdfs_port += 2 * self.subcluster_id
+        self.hc.mapred_port += 2 * self.subcluster_id
+
+        self._reset_cluster_state()
+
+    def _reset_cluster_state(self):
+        """Forget the datasets, snapshots and configuration of the Hadoop
+        cluster, as when it is created again."""
+
+        self.ds = None
+        self.ds_key = None
+        self.ds_resize_key = None
+        self.ds_snapshots = {}
+        self.hadoop_conf = None
+        self.job_properties = {}
+        if self.dataset_cache is not None:
+            self.dataset_cache.clear()
+        if self.subcluster_id is not None:
+            with self.store.lock:
+                self.subcluster_ds_keys.pop(self.subcluster_id, None)
+
+    def _run_subcluster(self):
+        """Consume combinations in the sub-cluster until none is left."""
+
+        logger.info("Sub-cluster " + str(self.subcluster_id) + " started in " +
+                    str(len(self.hc.hosts)) + " hosts")
+        try:
+            while self.run_ds_combinations():
+                pass
+        except:
+            logger.exception("Sub-cluster " + str(self.subcluster_id) +
+                             " stopped after an error")
+        finally:
+            with self.store.lock:
+                self.subcluster_ds_keys.pop(self.subcluster_id, None)
+        logger.info("Sub-cluster " + str(self.subcluster_id) + " finished")
+
+    def _get_next_combination(self, same_ds=False, same_conf=False):
+        """Return the next combination to be executed, the one sharing as
+        much as possible the dataset and configuration of the current one.
+
+        Args:
+          same_ds (bool, optional):
+            Whether only combinations using the current dataset are
+            considered.
+          same_conf (bool, optional):
+            Whether only combinations using the current dataset and daemon
+            configuration are considered.
+        """
+
+        if self.ds_key is not None:
+            current = self.raw_comb
+        else:
+            current = None
+
+        if self.dataset_cache is not None:
+            resident = self.dataset_cache.entries
+        else:
+            resident = ()
+
+        # Sub-clusters share the store and avoid loading the datasets of the
+        # others
+        if self.subcluster_id is None:
+            return self.store.get_next(current, resident, (), same_ds,
+                                       same_conf)
+
+        with self.store.lock:
+            busy = set(k for (idx, k) in self.subcluster_ds_keys.items()
+                       if idx != self.subcluster_id)
+            comb = self.store.get_next(current, resident, busy, same_ds,
+                                       same_conf)
+            if comb is not None:
+                self.subcluster_ds_keys[self.subcluster_id] = \
+                    self.store.get_ds_key(comb)
+            return comb
+
     def __define_test_parameters(self, config):
         if config.has_section("test_parameters"):
             test_parameters_names = config.options("test_parameters")
@@ -463,6 +733,71 @@ class HadoopEngine(Engine):
                                              self.hadoop_props +
                                              " does not exist")
 
+            if "test.snapshot_datasets" in test_parameters_names:
+                self.snapshot_datasets = \
+                    config.getboolean("test_parameters",
+                                      "test.snapshot_datasets")
+
+            if "test.incremental_datasets" in test_parameters_names:
+                self.incremental_datasets = \
+                    config.getboolean("test_parameters",
+                                      "test.incremental_datasets")
+
+            if "test.dataset_cache" in test_parameters_names and \
+                    config.getboolean("test_parameters", "test.dataset_cache"):
+                if "test.dataset_cache_fraction" in test_parameters_names:
+                    self.dataset_cache = DatasetCache(
+                        config.getfloat("test_parameters",
+                                        "test.dataset_cache_fraction"))
+                else:
+                    self.dataset_cache = DatasetCache()
+
+            if "test.hadoop.version" in test_parameters_names:
+                version = config.get("test_parameters", "test.hadoop.version")
+                if version.startswith("2"):
+                    self.hc_class = HadoopV2Cluster
+                elif not version.startswith("0") and \
+                        not version.startswith("1"):
+                    logger.error("Unknown hadoop version " + version)
+                    raise ParameterException("Unknown hadoop version " +
+                                             version)
+
+            if "test.concurrent_jobs" in test_parameters_names:
+                self.concurrent_jobs = \
+                    config.getint("test_parameters", "test.concurrent_jobs")
+
+            if "test.yarn_scheduler" in test_parameters_names:
+                self.yarn_scheduler = \
+                    config.get("test_parameters", "test.yarn_scheduler")
+
+            if "test.yarn_queues" in test_parameters_names:
+                self.yarn_queues = []
+                for q in config.get("test_parameters",
+                                    "test.yarn_queues").split(","):
+                    q = q.strip().split(":")
+                    if len(q) > 1:
+                        self.yarn_queues.append((q[0].strip(), float(q[1])))
+                    else:
+                        self.yarn_queues.append((q[0].strip(), 1.0))
+
+            if "test.throughput_file" in test_parameters_names:
+                self.throughput_file_name = \
+                    config.get("test_parameters", "test.throughput_file")
+
+            if self.concurrent_jobs > 1:
+                if self.hc_class is not HadoopV2Cluster:
+                    logger.error("Concurrent jobs require test.hadoop.version "
+                                 "= 2")
+                    raise ParameterException("Concurrent jobs require "
+                                             "test.hadoop.version = 2")
+                if not self.yarn_queues:
+                    self.yarn_queues = [("q" + str(i), 1.0)
+                                        for i in range(self.concurrent_jobs)]
+
+            if "test.num_subclusters" in test_parameters_names:
+                self.num_subclusters = \
+                    config.getint("test_parameters", "test.num_subclusters")
+
             if "test.use_kadeploy" in test_parameters_names:
                 self.use_kadeploy = config.getboolean("test_parameters",
                                                       "test.use_kadeploy")
@@ -561,23 +896,11 @@ class HadoopEngine(Engine):
         self.macro_manager.sort_macros()
 
         # SUMMARY FILES
-
-        # Xp summary
-        self.summary_file = open(self.summary_file_name, "w")
         self.summary_props = []
         self.summary_props.extend(self.ds_parameters.keys())
         self.summary_props.extend(self.xp_parameters.keys())
-        header = "comb_id, job_id"
-        for pn in self.summary_props:
-            header += ", " + str(pn)
-        self.summary_file.write(header + "\n")
-        self.summary_file.flush()
-
-        # Ds summary
-        self.ds_summary_file = open(self.ds_summary_file_name, "w")
-        header = "ds_id, ds_class, ds_class_properties"
-        self.ds_summary_file.write(header + "\n")
-        self.ds_summary_file.flush()
+        if self.num_subclusters == 1:
+            self._open_summary_files()
 
         # PRINT PARAMETERS
         print_ds_parameters = {}
@@ -586,14 +909,60 @@ class HadoopEngine(Engine):
         logger.info("Dataset parameters: " + str(print_ds_parameters))
         logger.info("Experiment parameters: " + str(self.xp_parameters))
 
-        self.sweeper = ParamSweeper(os.path.join(self.result_dir, "sweeps"),
-                                    sweep(self.parameters))
+        # SCHEDULING
+        # Only the properties read by the daemons require a restart
+        conf_params = []
+        job_params = []
+        for pn in self.xp_parameters:
+            if (pn.startswith("xp.") or
+                    get_property_component(pn, self.hc_class.properties) ==
+                    JOB):
+                job_params.append(pn)
+            else:
+                conf_params.append(pn)
+        self.scheduler = CombinationScheduler(self.ds_parameters.keys(),
+                                              conf_params, job_params,
+                                              ["ds.size"])
+
+        # Remaining combinations are indexed by dataset and configuration
+        self.store = CombinationStore(os.path.join(self.result_dir, "sweeps"),
+                                      self.parameters, self.scheduler)
 
         logger.info('Number of parameters combinations %s, '
                     'Number of repetitions %s',
-                    len(self.sweeper.get_remaining()),
+                    self.store.get_num_remaining(),
                     self.num_repetitions)
 
+        (groups, num_remaining) = self.store.get_group_representatives()
+        self.scheduler.log_savings(groups, self.scheduler.order(groups),
+                                   self.num_repetitions,
+                                   self.incremental_datasets, num_remaining)
+
+    def _open_summary_files(self):
+        """Create the summary files and write their headers."""
+
+        # Xp summary
+        self.summary_file = open(self.summary_file_name, "w")
+        header = "comb_id, job_id"
+        for pn in self.summary_props:
+            header += ", " + str(pn)
+        self.summary_file.write(header + "\n")
+        self.summary_file.flush()
+
+        # Ds summary
+        self.ds_summary_file = open(self.ds_summary_file_name, "w")
+        header = "ds_id, ds_class, ds_class_properties"
+        self.ds_summary_file.write(header + "\n")
+        self.ds_summary_file.flush()
+
+        # Throughput of concurrent jobs
+        if self.concurrent_jobs > 1:
+            self.throughput_file = open(self.throughput_file_name, "w")
+            header = ("batch_id, comb_id, job_id, queue, duration, "
+                      "input_size, throughput")
+            self.throughput_file.write(header + "\n")
+            self.throughput_file.flush()
+
     def __get_ds_parameters(self, params):
         ds_params = {}
         for pn in self.ds_parameters:
@@ -674,13 +1043,14 @@ class HadoopEngine(Engine):
         """
 
         self.hosts = get_oar_job_nodes(self.oar_job_id, self.frontend)
+        self.hadoop_conf = None
 
         if self.use_kadeploy:
             (deployed, undeployed) = self.deploy_nodes()
             return (len(deployed) != 0)
         else:
             if not self.hc:
-                self.hc = HadoopCluster(self.hosts)
+                self.hc = self._create_cluster(self.hosts)
             self.hc.bootstrap(self.hadoop_tar_file)
             return True
 
@@ -733,18 +1103,108 @@ class HadoopEngine(Engine):
 
         logger.info("Prepare dataset with combination " +
                     str(self.__get_ds_parameters(comb)))
-        self.ds_id += 1
-        self.macro_manager.update_test_macros(ds_id=self.ds_id)
+
+        ds_key = self._get_ds_key(comb)
+        resize_key = self._get_ds_key(comb, ["ds.size"])
+
+        # A dataset still resident in the dfs is reused with its original id,
+        # so that the dfs paths depending on it remain valid
+        if self.dataset_cache is not None and ds_key in self.dataset_cache:
+            entry = self.dataset_cache.get(ds_key)
+            self.macro_manager.update_test_macros(ds_id=entry["ds_id"])
+            self.macro_manager.replace_ds_macros(comb)
+            self.ds = entry["ds"]
+            self.ds_key = ds_key
+            self.ds_resize_key = resize_key
+            logger.info("Reusing dataset " + str(entry["ds_id"]) +
+                        " resident in " + entry["dest"])
+            return
+
+        # A dataset already loaded is restored with its original id
+        if self.snapshot_datasets and ds_key in self.ds_snapshots:
+            ds_id = self.ds_snapshots[ds_key]
+        else:
+            self.ds_id += 1
+            ds_id = self.ds_id
+        self.macro_manager.update_test_macros(ds_id=ds_id)
         self.macro_manager.replace_ds_macros(comb)
         logger.info("Combination after macro replacement " +
                     str(self.__get_ds_parameters(comb)))
 
-        # Initialize cluster and start
-        self.hc.initialize()
-        self.hc.start_and_wait()
+        # A dataset only differing in size is resized in place
+        if (self.incremental_datasets and self.ds is not None and
+                resize_key == self.ds_resize_key):
+            if self.dataset_cache is not None:
+                self.dataset_cache.evict_dest(self.hc, comb["ds.dest"],
+                                              self.ds_key)
+            if self.ds.resize(self.hc, comb["ds.dest"],
+                              int(comb["ds.size"])):
+                if self.dataset_cache is not None:
+                    self.dataset_cache.remove(self.ds_key)
+                    self.dataset_cache.add(self.hc, ds_key, self.ds, ds_id,
+                                           comb["ds.dest"])
+                self.ds_key = ds_key
+                self._update_ds_summary(comb)
+                return
+
+        restored = False
+        if (self.dataset_cache is not None and len(self.dataset_cache) and
+                self.hc.initialized):
+            # A resident dataset in the same folder would be overwritten.
+            # Keep the rest of the ones that fit along with the new one
+            self.dataset_cache.evict_dest(self.hc, comb["ds.dest"])
+            self.dataset_cache.make_room(self.hc, int(comb["ds.size"]))
+        else:
+            # Initialize cluster and start
+            self.ds_resize_key = None
+            if self.dataset_cache is not None:
+                self.dataset_cache.clear()
+            self.hc.initialize()
+            self.hadoop_conf = None
+
+            snapshot_name = "ds" + str(ds_id)
+            restored = (self.snapshot_datasets and
+                        ds_key in self.ds_snapshots and
+                        self.hc.restore_dfs(snapshot_name))
+            self.hc.start_and_wait()
 
         # Populate dataset
-        self.load_ds(comb)
+        if restored:
+            self.ds = self._create_ds(comb)
+            self.ds.deployments[self.hc, int(comb["ds.size"])] = \
+                comb["ds.dest"]
+            self._update_ds_summary(comb)
+            logger.info("Dataset " + str(ds_id) + " restored from its "
+                        "snapshot")
+        else:
+            self.load_ds(comb)
+        self.ds_key = ds_key
+        self.ds_resize_key = resize_key
+
+        if self.dataset_cache is not None:
+            self.dataset_cache.add(self.hc, ds_key, self.ds, ds_id,
+                                   comb["ds.dest"])
+
+        if self.snapshot_datasets and not restored:
+            if self.hc.snapshot_dfs("ds" + str(ds_id)):
+                self.ds_snapshots[ds_key] = ds_id
+
+    def _get_ds_key(self, comb, ignored_params=None):
+        """Return a key identifying the dataset of the given combination.
+
+        Args:
+          comb (dict):
+            The combination containing the dataset's parameters.
+          ignored_params (list of str, optional):
+            The dataset parameters not taken into account.
+        """
+
+        if not ignored_params:
+            ignored_params = []
+
+        return tuple(sorted((pn, str(comb[pn]))
+                            for pn in self.ds_parameters.keys()
+                            if pn not in ignored_params))
 
     def load_ds(self, comb):
         """Load the dataset corresponding to the given combination.
@@ -754,16 +1214,20 @@ class HadoopEngine(Engine):
             The combination containing the dataset's parameters.
         """
 
-        # Create dataset object
-        ds_idx = comb["ds.config"]
-        (ds_class_name, ds_params) = self.ds_config[ds_idx]
-        ds_class = import_class(ds_class_name)
-        self.ds = ds_class(ds_params)
+        self.ds = self._create_ds(comb)
 
         # Load dataset
         self.ds.load(self.hc, comb["ds.dest"], int(comb["ds.size"]))
         self._update_ds_summary(comb)
 
+    def _create_ds(self, comb):
+        """Create the dataset object of the given combination."""
+
+        ds_idx = comb["ds.config"]
+        (ds_class_name, ds_params) = self.ds_config[ds_idx]
+        ds_class = import_class(ds_class_name)
+        return ds_class(ds_params)
+
     def _update_ds_summary(self, comb):
         """Update ds summary with the loaded ds."""
 
@@ -805,10 +1269,109 @@ class HadoopEngine(Engine):
 
         finally:
             if comb_ok:
-                self.sweeper.done(comb)
+                self.store.done(comb)
             else:
-                self.sweeper.cancel(comb)
-            logger.info('%s Remaining', len(self.sweeper.get_remaining()))
+                self.store.cancel(comb)
+            logger.info('%s Remaining', self.store.get_num_remaining())
+
+    def xp_batch_wrapper(self, combs):
+        """Perform macro replacement and manage the repetitions of
+        experiments executed at the same time.
+
+        Args:
+          combs (list of dict):
+            The combinations with the experiments' parameters.
+        """
+
+        combs_ok = False
+        try:
+            logger.info("Execute " + str(len(combs)) + " experiments "
+                        "concurrently with combinations " +
+                        str([self.__get_xp_parameters(c) for c in combs]))
+
+            for nr in range(0, self.num_repetitions):
+
+                logger.info("Repetition " + str(nr + 1))
+                rep_combs = []
+                for comb in combs:
+                    rep_comb = comb.copy()
+
+                    self.comb_id += 1
+                    self.macro_manager.update_test_macros(comb_id=self.comb_id)
+                    self.macro_manager.replace_xp_macros(rep_comb)
+                    rep_combs.append((self.comb_id, rep_comb))
+
+                # Execution
+                self.xp_batch(rep_combs)
+
+            combs_ok = True
+
+        finally:
+            for comb in combs:
+                if combs_ok:
+                    self.store.done(comb)
+                else:
+                    self.store.cancel(comb)
+            logger.info('%s Remaining', self.store.get_num_remaining())
+
+    def xp_batch(self, rep_combs):
+        """Perform the experiments corresponding to the given combinations at
+        the same time, each one in a different queue of the cluster.
+
+        Args:
+          rep_combs (list of tuple):
+            The id of each combination and the combination with its
+            parameters. They should share the daemon configuration.
+        """
+
+        # 1. Prepare the jobs
+        queues = [name for (name, _) in self.yarn_queues]
+        jobs = []
+        for (idx, (comb_id, comb)) in enumerate(rep_combs):
+            self._change_hadoop_conf(comb)
+            job = self._create_hadoop_job(comb)
+            job.properties["mapreduce.job.queuename"] = \
+                queues[idx % len(queues)]
+            jobs.append(job)
+
+        if (any(str(comb.get("xp.wait_replication", "false")).lower() in
+                ["true", "yes", "1"] for (_, comb) in rep_combs) and
+                self.ds is not None):
+            self.ds.wait_for_replication(self.hc)
+
+        # 2. Execute the jobs at the same time
+        procs = [self.hc.start_job(j, verbose=False) for j in jobs]
+        for (job, proc) in zip(jobs, procs):
+            self.hc.wait_job(job, proc)
+
+        # 3. Post-execution
+        self.batch_id += 1
+        for ((comb_id, comb), job, proc) in zip(rep_combs, jobs, procs):
+            self.comb_id = comb_id
+            self.macro_manager.update_test_macros(comb_id=comb_id)
+            self._update_summary(comb, job)
+            self._update_throughput(str(comb_id), job.job_id,
+                                    job.properties["mapreduce.job.queuename"],
+                                    proc.end_date - proc.start_date,
+                                    int(comb["ds.size"]))
+            self._copy_xp_output()
+            self._remove_xp_output()
+
+        makespan = (max(p.end_date for p in procs) -
+                    min(p.start_date for p in procs))
+        total_size = sum(int(comb["ds.size"]) for (_, comb) in rep_combs)
+        self._update_throughput("all", "all", "all", makespan, total_size)
+        logger.info(str(len(jobs)) + " concurrent jobs processed " +
+                    str(total_size) + " bytes in " + "%.1f" % makespan +
+                    " seconds")
+
+        if self.stats_path:
+            self.hc.stop()
+            for ((comb_id, _), job) in zip(rep_combs, jobs):
+                local_path = os.path.join(self.stats_path, str(comb_id))
+                logger.info("Copying stats to " + local_path)
+                self.hc.copy_history(local_path, [job.job_id])
+            self.hc.clean_history()
 
     def xp(self, comb):
         """Perform the experiment corresponding to the given combination.
@@ -822,6 +1385,12 @@ class HadoopEngine(Engine):
         self._change_hadoop_conf(comb)
         job = self._create_hadoop_job(comb)
 
+        # Datasets loaded with a low replication are only waited for by the
+        # experiments declaring it
+        if (str(comb.get("xp.wait_replication", "false")).lower() in
+                ["true", "yes", "1"] and self.ds is not None):
+            self.ds.wait_for_replication(self.hc)
+
         # Execute job
         self.hc.execute_job(job)
         self._update_summary(comb, job)
@@ -833,23 +1402,58 @@ class HadoopEngine(Engine):
 
     def _change_hadoop_conf(self, comb):
         """Change hadoop's configuration by using the experiment's parameters.
+        All the properties are written to the configuration files, but only
+        the daemons reading the changed properties are restarted. Job-level
+        properties are also given to the job when it is submitted.
         
         Args:
           comb (dict):
             The combination with the experiment's parameters.
         """
 
-        self.hc.stop()  # Some parameters only take effect after restart
         mr_params = {}
         for pn in self.__get_xp_parameters(comb):
             if not pn.startswith("xp."):
                 mr_params[pn] = comb[pn]
 
-        self.hc.change_conf(mr_params)
-        self.hc.start_and_wait()
-
-        # TODO: provisional hack to avoid safemode
-        time.sleep(10)
+        (self.job_properties, daemon_params) = \
+            self.hc.classify_properties(mr_params)
+
+        if self.hadoop_conf is None or not self.hc.running:
+            self.hc.stop()  # Some parameters only take effect after restart
+            self.hc.change_conf(mr_params)
+            self.hadoop_conf = mr_params
+            self.hc.start_and_wait()
+
+            # TODO: provisional hack to avoid safemode
+            time.sleep(10)
+            return
+
+        changed = dict((pn, pv) for (pn, pv) in mr_params.items()
+                       if self.hadoop_conf.get(pn) != pv)
+        if not changed:
+            logger.info("Hadoop configuration unchanged, no restart needed")
+            return
+
+        # Job-level properties are read by the client when the job is
+        # submitted, so only the daemons reading the rest are restarted
+        daemons = set()
+        for pn in changed:
+            daemons.update(daemon_params.get(pn, []))
+
+        self.hc.change_conf(changed)
+        self.hadoop_conf = mr_params
+        if not daemons:
+            logger.info("Only job-level properties changed, no restart "
+                        "needed")
+            return
+
+        if not self.hc.restart_daemons(daemons):
+            logger.warn("Error while restarting " + ", ".join(daemons) +
+                        ". Restarting the whole cluster")
+            self.hc.stop()
+            self.hc.start_and_wait()
+            time.sleep(10)
 
     def _create_hadoop_job(self, comb):
         """Create the hadoop job.
@@ -871,7 +1475,8 @@ class HadoopEngine(Engine):
             params = None
             lib_jars = None
 
-        return HadoopJarJob(jar_path, params, lib_jars)
+        return HadoopJarJob(jar_path, params, lib_jars,
+                            dict(self.job_properties))
 
     def _update_summary(self, comb, job):
         """Update test summary with the executed job."""
@@ -882,6 +1487,20 @@ class HadoopEngine(Engine):
         self.summary_file.write(line + "\n")
         self.summary_file.flush()
 
+    def _update_throughput(self, comb_id, job_id, queue, duration, size):
+        """Update the throughput summary with a job or a batch of concurrent
+        jobs."""
+
+        if duration > 0:
+            throughput = "%.1f" % (size / duration)
+        else:
+            throughput = ""
+        line = (str(self.batch_id) + ", " + comb_id + ", " + job_id + ", " +
+                queue + ", " + "%.1f" % duration + ", " + str(size) + ", " +
+                throughput)
+        self.throughput_file.write(line + "\n")
+        self.throughput_file.flush()
+
     def _copy_xp_output(self):
         """Copy experiment's output."""
 
@@ -893,9 +1512,9 @@ class HadoopEngine(Engine):
             tmp_dir = "/tmp"
 
             # Remove file in tmp dir if exists
-            proc = SshProcess("rm -rf " +
-                              os.path.join(tmp_dir, os.path.basename(remote_path)),
-                              self.hc.master)
+            proc = get_process("rm -rf " +
+                               os.path.join(tmp_dir, os.path.basename(remote_path)),
+                               self.hc.master)
             proc.run()
 
             # Get files in master
@@ -903,9 +1522,9 @@ class HadoopEngine(Engine):
                             verbose=False)
 
             # Copy files from master
-            action = Get([self.hc.master],
-                         [os.path.join(tmp_dir, os.path.basename(remote_path))],
-                         local_path)
+            action = get_get([self.hc.master],
+                             [os.path.join(tmp_dir, os.path.basename(remote_path))],
+                             local_path)
             action.run()
 
     def _remove_xp_output(self):
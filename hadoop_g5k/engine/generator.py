@@ -0,0 +1,247 @@
+"""Generator of synthetic data.
+
+This module is copied to the nodes of the cluster and executed there by
+SyntheticDataset, so it only depends on the standard library and NumPy. It
+writes exactly the requested number of bytes to its standard output.
+
+Usage: python generator.py TYPE SIZE SEED PART [OPTIONS]
+"""
+
+import argparse
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    # Only needed to generate data, not to use the constants of the module
+    np = None
+
+# Data types
+TERASORT = "terasort"
+TEXT = "text"
+KEY_VALUE = "kv"
+
+DATA_TYPES = [TERASORT, TEXT, KEY_VALUE]
+
+# Size of a TeraSort record
+TERASORT_RECORD_SIZE = 100
+
+# Number of records generated in each vectorized step
+RECORDS_PER_CHUNK = 100000
+
+# Defaults of the text and key/value data
+DEFAULT_VOCABULARY_SIZE = 100000
+DEFAULT_ZIPF_EXPONENT = 1.1
+DEFAULT_WORDS_PER_LINE = 10
+DEFAULT_KEY_SIZE = 10
+DEFAULT_VALUE_SIZE = 90
+
+HEX_DIGITS = b"0123456789ABCDEF"
+LETTERS = b"ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+LOWER_LETTERS = b"abcdefghijklmnopqrstuvwxyz"
+
+
+def _get_table(chars):
+    return np.frombuffer(chars, dtype=np.uint8)
+
+
+def get_random_state(seed, part):
+    """Return the random generator of a part. It only depends on the global
+    seed and the index of the part, so the data is the same whatever the
+    node generating it."""
+
+    return np.random.RandomState([seed, part])
+
+
+def write_exact(out, chunks, size, lines=False):
+    """Write the given chunks of bytes until size bytes are written. The last
+    chunk is cut if needed.
+
+    Args:
+      lines (bool, optional):
+        If True, the last byte is replaced by a line break, so that the data
+        does not end with an incomplete line.
+
+    Returns (int):
+      The number of bytes written.
+    """
+
+    written = 0
+    for chunk in chunks:
+        if written + len(chunk) >= size:
+            chunk = chunk[:size - written]
+            if lines and chunk:
+                chunk = chunk[:-1] + b"\n"
+            out.write(chunk)
+            return size
+        out.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def terasort_chunks(rng, first_row, num_records):
+    """Generate records in the format of TeraGen: a 10-byte random key, 2
+    fixed bytes, the row id in hexadecimal (32 bytes), 4 fixed bytes, 48
+    bytes of filler and 4 fixed bytes.
+    """
+
+    hex_digits = _get_table(HEX_DIGITS)
+    letters = _get_table(LETTERS)
+
+    row = first_row
+    end = first_row + num_records
+    while row < end:
+        n = min(RECORDS_PER_CHUNK, end - row)
+        records = np.empty((n, TERASORT_RECORD_SIZE), dtype=np.uint8)
+
+        records[:, 0:10] = rng.randint(0, 256, (n, 10))
+        records[:, 10:12] = [0x00, 0x11]
+
+        rows = np.arange(row, row + n, dtype=np.uint64)
+        shifts = np.arange(60, -4, -4, dtype=np.uint64)
+        digits = (rows[:, None] >> shifts) & np.uint64(0xF)
+        records[:, 12:28] = hex_digits[0]
+        records[:, 28:44] = hex_digits[digits.astype(np.intp)]
+
+        records[:, 44:48] = [0x88, 0x99, 0xAA, 0xBB]
+        records[:, 48:96] = letters[rng.randint(0, len(letters), (n, 48))]
+        records[:, 96:100] = [0xCC, 0xDD, 0xEE, 0xFF]
+
+        yield records.tobytes()
+        row += n
+
+
+def get_vocabulary(seed, size):
+    """Return a vocabulary of random lowercase words. It only depends on the
+    global seed, so all the parts share it.
+
+    Returns (tuple of numpy.ndarray):
+      The bytes of all the words, each one followed by a space, and the offset
+      and length (including the space) of each word.
+    """
+
+    lower_letters = _get_table(LOWER_LETTERS)
+
+    rng = np.random.RandomState([seed, size])
+    lengths = rng.randint(2, 11, size) + 1
+    offsets = np.cumsum(lengths) - lengths
+
+    words = lower_letters[rng.randint(0, len(lower_letters), lengths.sum())]
+    words[offsets + lengths - 1] = ord(" ")
+    return (words, offsets, lengths)
+
+
+def text_chunks(rng, vocabulary, exponent, words_per_line):
+    """Generate lines of words whose frequencies follow a Zipf
+    distribution."""
+
+    (words, offsets, lengths) = vocabulary
+    num_words = len(offsets)
+    while True:
+        ranks = rng.zipf(exponent, RECORDS_PER_CHUNK * words_per_line)
+        ranks = ranks[ranks <= num_words] - 1
+        ranks = ranks[:len(ranks) - len(ranks) % words_per_line]
+
+        # Copy the bytes of each chosen word to its position in the chunk
+        word_lengths = lengths[ranks]
+        ends = np.cumsum(word_lengths)
+        shifts = np.repeat(offsets[ranks] - (ends - word_lengths),
+                           word_lengths)
+        chunk = words[np.arange(ends[-1]) + shifts]
+
+        # The space after the last word of each line becomes a line break
+        chunk[ends[words_per_line - 1::words_per_line] - 1] = ord("\n")
+        yield chunk.tobytes()
+
+
+def key_value_chunks(rng, key_size, value_size):
+    """Generate lines with a random key and a random value separated by a
+    tab."""
+
+    letters = _get_table(LETTERS)
+    lower_letters = _get_table(LOWER_LETTERS)
+
+    record_size = key_size + value_size + 2
+    while True:
+        records = np.empty((RECORDS_PER_CHUNK, record_size), dtype=np.uint8)
+        records[:, :key_size] = letters[
+            rng.randint(0, len(letters), (RECORDS_PER_CHUNK, key_size))]
+        records[:, key_size] = ord("\t")
+        records[:, key_size + 1:-1] = lower_letters[
+            rng.randint(0, len(lower_letters),
+                        (RECORDS_PER_CHUNK, value_size))]
+        records[:, -1] = ord("\n")
+        yield records.tobytes()
+
+
+def generate(out, data_type, size, seed, part, first_record=0,
+             vocabulary_size=DEFAULT_VOCABULARY_SIZE,
+             zipf_exponent=DEFAULT_ZIPF_EXPONENT,
+             words_per_line=DEFAULT_WORDS_PER_LINE,
+             key_size=DEFAULT_KEY_SIZE, value_size=DEFAULT_VALUE_SIZE):
+    """Write size bytes of synthetic data of the given type.
+
+    Args:
+      out (file):
+        The binary output.
+      data_type (str):
+        The type of data: terasort, text or kv.
+      size (int):
+        The number of bytes. For TeraSort, it should be a multiple of the
+        record size.
+      seed (int):
+        The global seed of the dataset.
+      part (int):
+        The index of the part generated.
+      first_record (int, optional):
+        The row id of the first TeraSort record.
+
+    Returns (int):
+      The number of bytes written.
+    """
+
+    rng = get_random_state(seed, part)
+
+    if data_type == TERASORT:
+        chunks = terasort_chunks(rng, first_record,
+                                 size // TERASORT_RECORD_SIZE)
+    elif data_type == TEXT:
+        vocabulary = get_vocabulary(seed, vocabulary_size)
+        chunks = text_chunks(rng, vocabulary, zipf_exponent, words_per_line)
+    elif data_type == KEY_VALUE:
+        chunks = key_value_chunks(rng, key_size, value_size)
+    else:
+        raise ValueError("Unknown data type " + data_type)
+
+    return write_exact(out, chunks, size, data_type != TERASORT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic data")
+    parser.add_argument("data_type", choices=DATA_TYPES)
+    parser.add_argument("size", type=int)
+    parser.add_argument("seed", type=int)
+    parser.add_argument("part", type=int)
+    parser.add_argument("--first-record", type=int, default=0)
+    parser.add_argument("--vocabulary-size", type=int,
+                        default=DEFAULT_VOCABULARY_SIZE)
+    parser.add_argument("--zipf-exponent", type=float,
+                        default=DEFAULT_ZIPF_EXPONENT)
+    parser.add_argument("--words-per-line", type=int,
+                        default=DEFAULT_WORDS_PER_LINE)
+    parser.add_argument("--key-size", type=int, default=DEFAULT_KEY_SIZE)
+    parser.add_argument("--value-size", type=int, default=DEFAULT_VALUE_SIZE)
+    args = parser.parse_args()
+
+    if np is None:
+        sys.exit("NumPy is required to generate data")
+
+    out = getattr(sys.stdout, "buffer", sys.stdout)
+    generate(out, args.data_type, args.size, args.seed, args.part,
+             args.first_record, args.vocabulary_size, args.zipf_exponent,
+             args.words_per_line, args.key_size, args.value_size)
+    out.flush()
+
+
+if __name__ == "__main__":
+    main()
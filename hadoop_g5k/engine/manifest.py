@@ -0,0 +1,514 @@
+"""This module keeps the information of the files of a local dataset
+directory between executions, and the journal of the files already loaded
+into the dfs.
+
+The manifest stores the size, modification time, checksum and number of
+records of each file, so that they are only computed again for the files
+which changed. The journal allows an interrupted load to be resumed without
+transferring again the files already stored.
+"""
+
+import bisect
+import getpass
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from execo_engine import logger
+
+# Name of the manifest file inside the dataset directory
+MANIFEST_FILE_NAME = ".hg5k_manifest"
+
+# Dir used when the dataset directory is not writable
+DEFAULT_MANIFESTS_DIR = "/tmp/" + getpass.getuser() + "_manifests"
+
+# Dir where the journals of the loads are stored
+DEFAULT_JOURNALS_DIR = "/tmp/" + getpass.getuser() + "_journals"
+
+# Size of the chunks read to compute checksums and count records
+READ_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Size of the chunks read backwards when looking for a record boundary
+BOUNDARY_CHUNK_SIZE = 64 * 1024
+
+
+class DatasetManifest(object):
+    """This class manages the manifest of a local dataset directory.
+
+    The manifest stores the name, size and modification time of every file
+    in the directory, along with their checksums and number of records when
+    they are requested. It is persisted between executions and revalidated
+    incrementally: only files whose size or modification time changed are
+    read again.
+
+    Files are kept sorted by name together with the cumulative size of the
+    sorted list, so that the shortest prefix of files reaching a given size
+    is found with a binary search.
+
+    Attributes:
+      dir_path (str):
+        The path of the dataset directory.
+      entries (list of dict):
+        The information of each file, sorted by name.
+      cumulative_sizes (list of int):
+        The sum of the sizes of the files up to each position (included).
+    """
+
+    def __init__(self, dir_path):
+        """Load the manifest of the given directory and revalidate it.
+
+        Args:
+          dir_path (str):
+            The path of the dataset directory.
+        """
+
+        self.dir_path = os.path.abspath(dir_path)
+        self.entries = []
+        self.cumulative_sizes = []
+        self._positions = {}
+
+        self._changed = False
+        self._load()
+        self.refresh()
+
+    def _get_manifest_path(self):
+        """Return the path of the manifest file. It is stored inside the
+        dataset directory if possible and in DEFAULT_MANIFESTS_DIR otherwise.
+        """
+
+        if os.access(self.dir_path, os.W_OK):
+            return os.path.join(self.dir_path, MANIFEST_FILE_NAME)
+        else:
+            if not os.path.exists(DEFAULT_MANIFESTS_DIR):
+                os.makedirs(DEFAULT_MANIFESTS_DIR)
+            name = hashlib.md5(self.dir_path).hexdigest()
+            return os.path.join(DEFAULT_MANIFESTS_DIR, name)
+
+    def _load(self):
+        """Load the stored manifest, if any."""
+
+        manifest_path = self._get_manifest_path()
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path) as f:
+                    self.entries = json.load(f)["files"]
+                # json returns unicode, while listdir returns byte strings
+                for e in self.entries:
+                    e["name"] = e["name"].encode("utf-8")
+            except (ValueError, KeyError, IOError):
+                logger.warn("Ignoring corrupted manifest " + manifest_path)
+                self.entries = []
+
+    def save(self):
+        """Store the manifest if it has changed."""
+
+        if not self._changed:
+            return
+
+        manifest_path = self._get_manifest_path()
+        (fd, tmp_path) = tempfile.mkstemp(
+            "", MANIFEST_FILE_NAME + ".", os.path.dirname(manifest_path))
+        with os.fdopen(fd, "w") as f:
+            json.dump({"dir": self.dir_path, "files": self.entries}, f)
+        os.rename(tmp_path, manifest_path)
+
+        self._changed = False
+
+    def refresh(self):
+        """Revalidate the manifest against the directory. New and modified
+        files are (re)stated and their checksums and number of records are
+        discarded, removed files are dropped."""
+
+        old_entries = dict((e["name"], e) for e in self.entries)
+
+        entries = []
+        for name in sorted(os.listdir(self.dir_path)):
+            if name.startswith(MANIFEST_FILE_NAME):
+                continue
+            path = os.path.join(self.dir_path, name)
+            if not os.path.isfile(path):
+                continue
+
+            st = os.stat(path)
+            old = old_entries.pop(name, None)
+            if (old and old["size"] == st.st_size and
+                    old["mtime"] == st.st_mtime):
+                entries.append(old)
+            else:
+                entries.append({"name": name, "size": st.st_size,
+                                "mtime": st.st_mtime})
+                self._changed = True
+
+        if old_entries:
+            self._changed = True
+
+        self.entries = entries
+        self._build_index()
+        self.save()
+
+    def _build_index(self):
+        self.cumulative_sizes = []
+        self._positions = {}
+        total = 0
+        for (idx, e) in enumerate(self.entries):
+            total += e["size"]
+            self.cumulative_sizes.append(total)
+            self._positions[e["name"]] = idx
+
+    def get_path(self, entry):
+        """Return the local path of the file of the given entry."""
+
+        return os.path.join(self.dir_path, entry["name"])
+
+    def get_total_size(self):
+        """Return the size of the whole dataset."""
+
+        if self.cumulative_sizes:
+            return self.cumulative_sizes[-1]
+        else:
+            return 0
+
+    def get_files(self):
+        """Return the local paths of all the files, sorted by name."""
+
+        return [self.get_path(e) for e in self.entries]
+
+    def select_prefix(self, desired_size):
+        """Return the shortest list of files, in name order, whose size
+        reaches the desired size.
+
+        Args:
+          desired_size (int):
+            The desired size in bytes.
+
+        Returns (tuple):
+          The list of local paths and their total size. If the dataset is
+          smaller than desired, all the files are returned.
+        """
+
+        idx = bisect.bisect_left(self.cumulative_sizes, desired_size)
+        if idx >= len(self.entries):
+            return (self.get_files(), self.get_total_size())
+
+        return ([self.get_path(e) for e in self.entries[:idx + 1]],
+                self.cumulative_sizes[idx])
+
+    def select_exact(self, desired_size, record_size=None):
+        """Return the files needed to obtain exactly the desired size, in name
+        order. The last file is cut at the last record boundary before the
+        desired size, so the selected size may be lower than desired by less
+        than a record.
+
+        Args:
+          desired_size (int):
+            The desired size in bytes.
+          record_size (int, optional):
+            The size of fixed-length records. If 1, files are cut at any byte.
+            If not indicated, records are lines.
+
+        Returns (tuple):
+          The list of local paths, their total size and a dictionary with the
+          number of bytes to be taken from the files which are cut.
+        """
+
+        (files, size) = self.select_prefix(desired_size)
+        if size <= desired_size:
+            return (files, size, {})
+
+        last_file = files[-1]
+        last_size = self.entries[len(files) - 1]["size"]
+        length = find_record_boundary(last_file,
+                                      last_size - (size - desired_size),
+                                      record_size)
+
+        size -= last_size
+        if length == 0:
+            return (files[:-1], size, {})
+        else:
+            return (files, size + length, {last_file: length})
+
+    def get_checksum(self, name, length=None):
+        """Return the md5 checksum of the given file, computing it only if it
+        is not cached.
+
+        Args:
+          name (str):
+            The name of the file in the dataset directory.
+          length (int, optional):
+            If indicated, the checksum of the first length bytes of the file
+            is returned (e.g., for a file which is cut).
+        """
+
+        entry = self.get_entry(name)
+        if length is None or length == entry["size"]:
+            if "checksum" not in entry:
+                entry["checksum"] = _read_file(self.get_path(entry))[0]
+                self._changed = True
+            return entry["checksum"]
+
+        checksums = entry.setdefault("prefix_checksums", {})
+        if str(length) not in checksums:
+            checksums[str(length)] = \
+                _read_file(self.get_path(entry), length)[0]
+            self._changed = True
+        return checksums[str(length)]
+
+    def get_num_records(self, name):
+        """Return the number of records (lines) of the given file, counting
+        them only if they are not cached.
+
+        Args:
+          name (str):
+            The name of the file in the dataset directory.
+        """
+
+        entry = self.get_entry(name)
+        if "records" not in entry:
+            (checksum, records) = _read_file(self.get_path(entry))
+            entry["checksum"] = checksum
+            entry["records"] = records
+            self._changed = True
+        return entry["records"]
+
+    def get_entry(self, name):
+        """Return the manifest entry of a file.
+
+        Args:
+          name (str):
+            The name of the file in the dataset directory.
+
+        Returns (dict):
+          The name, size and modification time of the file, along with its
+          checksum and number of records if they have been computed.
+        """
+
+        if name not in self._positions:
+            raise KeyError(name + " is not in the manifest of " +
+                           self.dir_path)
+        return self.entries[self._positions[name]]
+
+
+def find_record_boundary(path, offset, record_size=None):
+    """Return the position of the last record boundary of a file which is not
+    after the given offset.
+
+    Args:
+      path (str):
+        The path of the file.
+      offset (int):
+        The maximum position.
+      record_size (int, optional):
+        The size of fixed-length records. If not indicated, records are
+        lines.
+
+    Returns (int):
+      The number of bytes of the file up to the boundary.
+    """
+
+    if record_size:
+        return offset - offset % record_size
+
+    with open(path, "rb") as f:
+        end = offset
+        while end > 0:
+            start = max(0, end - BOUNDARY_CHUNK_SIZE)
+            f.seek(start)
+            pos = f.read(end - start).rfind("\n")
+            if pos >= 0:
+                return start + pos + 1
+            end = start
+
+    return 0
+
+
+def _read_file(path, length=None):
+    """Compute the md5 checksum and the number of lines of a file, or of its
+    first length bytes, in a single pass."""
+
+    md5 = hashlib.md5()
+    lines = 0
+    remaining = length
+    with open(path, "rb") as f:
+        while remaining is None or remaining > 0:
+            if remaining is None:
+                chunk = f.read(READ_CHUNK_SIZE)
+            else:
+                chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+                remaining -= len(chunk)
+            if not chunk:
+                break
+            md5.update(chunk)
+            lines += chunk.count("\n")
+    return (md5.hexdigest(), lines)
+
+
+class LoadJournal(object):
+    """This class records the files of a local dataset directory which have
+    been completely loaded into a dfs folder, so that an interrupted load can
+    be resumed.
+
+    The journal is an append-only file with one JSON record per line, which
+    is written as soon as a file is stored. Records refer to the size and
+    modification time of the local file and to the length and checksum of the
+    dfs file, and are only trusted if all of them still match.
+
+    Attributes:
+      path (str):
+        The path of the journal file.
+      entries (dict of str: dict):
+        The last record of each local file name.
+    """
+
+    def __init__(self, path):
+        """Load the journal stored in the given path, if any.
+
+        Args:
+          path (str):
+            The path of the journal file.
+        """
+
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def get_journal_path(cluster_id, dest, dir_path):
+        """Return the path of the journal of a load.
+
+        Args:
+          cluster_id (str):
+            The identifier of the dfs (e.g., the address of the NameNode).
+          dest (str):
+            The dfs destination folder.
+          dir_path (str):
+            The path of the dataset directory.
+        """
+
+        if not os.path.exists(DEFAULT_JOURNALS_DIR):
+            os.makedirs(DEFAULT_JOURNALS_DIR)
+        name = hashlib.md5(cluster_id + "|" + dest + "|" +
+                           os.path.abspath(dir_path)).hexdigest()
+        return os.path.join(DEFAULT_JOURNALS_DIR, name)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last record may be truncated by an interruption
+                    continue
+                name = record["name"].encode("utf-8")
+                if record.get("removed"):
+                    self.entries.pop(name, None)
+                else:
+                    record["name"] = name
+                    record["dfs_file"] = record["dfs_file"].encode("utf-8")
+                    self.entries[name] = record
+
+    def _append(self, records):
+        with open(self.path, "a") as f:
+            for r in records:
+                f.write(json.dumps(r) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record(self, entry, dfs_file, stored, length=None):
+        """Record a file as loaded.
+
+        Args:
+          entry (dict):
+            The manifest entry of the local file.
+          dfs_file (str):
+            The dfs path where it has been stored.
+          stored (int):
+            The number of bytes stored in the dfs.
+          length (int, optional):
+            The number of bytes taken from the local file, if it was cut.
+        """
+
+        record = {"name": entry["name"], "size": entry["size"],
+                  "mtime": entry["mtime"], "length": length,
+                  "dfs_file": dfs_file, "stored": stored}
+        with self._lock:
+            self.entries[entry["name"]] = record
+            self._append([record])
+
+    def set_checksums(self, checksums):
+        """Add the dfs checksums of the loaded files.
+
+        Args:
+          checksums (dict of str: str):
+            The checksum of each dfs file.
+        """
+
+        with self._lock:
+            records = []
+            for record in self.entries.values():
+                checksum = checksums.get(record["dfs_file"])
+                if checksum and record.get("checksum") != checksum:
+                    record["checksum"] = checksum
+                    records.append(record)
+            if records:
+                self._append(records)
+
+    def get_loaded(self, manifest, files, lengths, dfs_lengths,
+                   dfs_checksums=None):
+        """Return the files whose load is complete and still valid. The
+        records of the rest are discarded.
+
+        Args:
+          manifest (DatasetManifest):
+            The manifest of the dataset directory.
+          files (list of str):
+            The local paths of the files to be loaded.
+          lengths (dict of str: int):
+            The number of bytes to be taken from the files which are cut.
+          dfs_lengths (dict of str: int):
+            The length of the files present in the dfs.
+          dfs_checksums (dict of str: str, optional):
+            The checksum of the files present in the dfs.
+
+        Returns (dict of str: dict):
+          The record of each loaded file, identified by its local path.
+        """
+
+        if dfs_checksums is None:
+            dfs_checksums = {}
+
+        loaded = {}
+        invalid = []
+        for f in files:
+            name = os.path.basename(f)
+            record = self.entries.get(name)
+            if not record:
+                continue
+
+            entry = manifest.get_entry(name)
+            dfs_file = record["dfs_file"]
+            valid = (record["size"] == entry["size"] and
+                     record["mtime"] == entry["mtime"] and
+                     record["length"] == lengths.get(f) and
+                     dfs_lengths.get(dfs_file) == record["stored"])
+            if valid and record.get("checksum") and dfs_file in dfs_checksums:
+                valid = dfs_checksums[dfs_file] == record["checksum"]
+
+            if valid:
+                loaded[f] = record
+            else:
+                invalid.append(name)
+
+        if invalid:
+            with self._lock:
+                for name in invalid:
+                    del self.entries[name]
+                self._append([{"name": name, "removed": True}
+                              for name in invalid])
+
+        return loaded
@@ -0,0 +1,292 @@
+"""This module orders the combinations of a test suite so that consecutive
+experiments share as much state of the cluster as possible.
+
+Two transitions are costly: loading a new dataset, which reinitializes the
+cluster, and changing a daemon-level Hadoop parameter, which restarts it.
+Combinations are thus grouped by dataset and, within each dataset, by the
+values of the daemon-level parameters. The groups and the combinations inside
+them are visited so that each one differs as little as possible from the
+previous one.
+"""
+
+from execo_engine import logger
+
+
+def _get_value(value):
+    """Return the value to compare parameters with, numeric if possible."""
+
+    try:
+        return (0, float(value))
+    except (TypeError, ValueError):
+        return (1, str(value))
+
+
+def _get_distance(key1, key2):
+    """Return the number of parameters with different values in two keys."""
+
+    if key1 is None or key2 is None:
+        return len(key1 or key2 or ())
+    return sum(1 for (v1, v2) in zip(key1, key2) if v1 != v2)
+
+
+class CombinationScheduler(object):
+    """This class orders combinations by the cost of the transitions between
+    them.
+
+    Attributes:
+      ds_params (list of str):
+        The parameters identifying the dataset.
+      resize_params (list of str):
+        The dataset parameters that can change without a new load when
+        datasets are resized in place.
+      conf_params (list of str):
+        The Hadoop parameters whose change requires a restart.
+      job_params (list of str):
+        The rest of the parameters, which can change at no cost.
+    """
+
+    def __init__(self, ds_params, conf_params, job_params, resize_params=None):
+        """Create a new scheduler.
+
+        Args:
+          ds_params (list of str):
+            The parameters identifying the dataset.
+          conf_params (list of str):
+            The Hadoop parameters whose change requires a restart.
+          job_params (list of str):
+            The rest of the parameters.
+          resize_params (list of str, optional):
+            The dataset parameters that can change without a new load.
+        """
+
+        self.ds_params = sorted(ds_params)
+        self.resize_params = sorted(resize_params or [])
+        self.conf_params = sorted(conf_params)
+        self.job_params = sorted(job_params)
+
+    def _get_key(self, comb, params):
+        return tuple((pn, str(comb[pn])) for pn in params)
+
+    def get_ds_key(self, comb):
+        """Return the key of the dataset of a combination, in the same form
+        as the keys of the dataset cache."""
+
+        return self._get_key(comb, self.ds_params)
+
+    def get_resize_key(self, comb):
+        """Return the key of the dataset parameters of a combination that
+        cannot change without a new load."""
+
+        return self._get_key(comb, [pn for pn in self.ds_params
+                                    if pn not in self.resize_params])
+
+    def get_conf_key(self, comb):
+        """Return the key of the daemon-level parameters of a combination."""
+
+        return self._get_key(comb, self.conf_params)
+
+    def get_job_key(self, comb):
+        """Return the key of the rest of parameters of a combination."""
+
+        return self._get_key(comb, self.job_params)
+
+    def _get_nearest(self, keys, current):
+        """Sort the given keys by the number of parameters changed from the
+        current one, visiting each one from the previous."""
+
+        pending = sorted(keys)
+        ordered = []
+        while pending:
+            best = min(pending,
+                       key=lambda k: _get_distance(current, k))
+            pending.remove(best)
+            ordered.append(best)
+            current = best
+        return ordered
+
+    def _get_resize_order(self, ds_key):
+        """Return the value by which datasets only differing in the
+        resizable parameters are visited consecutively and in increasing
+        order of those parameters."""
+
+        return ([v for (pn, v) in ds_key if pn not in self.resize_params],
+                [_get_value(v) for (pn, v) in ds_key
+                 if pn in self.resize_params])
+
+    def _sort_datasets(self, groups, current, resident):
+        """Return the dataset keys in the order they should be loaded."""
+
+        first = [current] if current in groups else []
+        first.extend(sorted(k for k in groups
+                            if k in resident and k != current))
+        rest = [k for k in groups if k not in first]
+
+        return first + sorted(rest, key=self._get_resize_order)
+
+    def get_next_ds_key(self, keys, current=None, resident=()):
+        """Return the key of the dataset to be used next, in the same order
+        as the one given by order, without sorting all of them.
+
+        Args:
+          keys (collection of tuple):
+            The keys of the candidate datasets.
+          current (tuple, optional):
+            The key of the dataset currently loaded.
+          resident (collection of tuple, optional):
+            The keys of datasets already present in the cluster.
+
+        Returns (tuple):
+          The key of the next dataset or None if there are no candidates.
+        """
+
+        if not keys:
+            return None
+        if current in keys:
+            return current
+        resident_keys = [k for k in keys if k in resident]
+        if resident_keys:
+            return min(resident_keys)
+        return min(keys, key=self._get_resize_order)
+
+    def get_nearest_key(self, keys, current=None):
+        """Return the key differing in less parameters from the current one.
+        Ties are broken in the same order as in order.
+
+        Args:
+          keys (collection of tuple):
+            The candidate keys.
+          current (tuple, optional):
+            The current key.
+
+        Returns (tuple):
+          The nearest key or None if there are no candidates.
+        """
+
+        if not keys:
+            return None
+        return min(keys, key=lambda k: (_get_distance(current, k), k))
+
+    def order(self, combs, current=None, resident=()):
+        """Order the given combinations.
+
+        Args:
+          combs (iterable of dict):
+            The combinations to order.
+          current (dict, optional):
+            The combination whose dataset and configuration are currently
+            deployed.
+          resident (collection of tuple, optional):
+            The keys of datasets already present in the cluster.
+
+        Returns (list of dict):
+          The combinations, from the first to be executed to the last.
+        """
+
+        # 1. Group by dataset and daemon configuration
+        groups = {}
+        for comb in combs:
+            ds_groups = groups.setdefault(self.get_ds_key(comb), {})
+            ds_groups.setdefault(self.get_conf_key(comb), []).append(comb)
+
+        if current is not None:
+            current_ds = self.get_ds_key(current)
+            current_conf = self.get_conf_key(current)
+            current_job = self.get_job_key(current)
+        else:
+            current_ds = current_conf = current_job = None
+
+        # 2. Order datasets, configurations and combinations
+        ordered = []
+        for ds_key in self._sort_datasets(groups, current_ds, resident):
+            conf_groups = groups[ds_key]
+            for conf_key in self._get_nearest(conf_groups, current_conf):
+                by_job = dict((self.get_job_key(c), c)
+                              for c in conf_groups[conf_key])
+                for job_key in self._get_nearest(by_job, current_job):
+                    ordered.append(by_job[job_key])
+                    current_job = job_key
+                current_conf = conf_key
+
+        return ordered
+
+    def count_transitions(self, combs, incremental=False):
+        """Count the costly transitions of executing the given combinations
+        in order.
+
+        Args:
+          combs (list of dict):
+            The ordered combinations.
+          incremental (bool, optional):
+            Whether datasets only differing in the resizable parameters are
+            resized instead of loaded.
+
+        Returns (tuple of int):
+          The number of dataset loads, dataset resizes and cluster restarts.
+        """
+
+        loads = resizes = restarts = 0
+        (ds_key, resize_key, conf_key) = (None, None, None)
+        for comb in combs:
+            new_ds_key = self.get_ds_key(comb)
+            if new_ds_key != ds_key:
+                new_resize_key = self.get_resize_key(comb)
+                if incremental and new_resize_key == resize_key:
+                    resizes += 1
+                else:
+                    # Loading a dataset reinitializes the configuration
+                    loads += 1
+                    conf_key = None
+                (ds_key, resize_key) = (new_ds_key, new_resize_key)
+
+            new_conf_key = self.get_conf_key(comb)
+            if new_conf_key != conf_key:
+                restarts += 1
+                conf_key = new_conf_key
+
+        return (loads, resizes, restarts)
+
+    def log_savings(self, combs, ordered, num_repetitions=1,
+                    incremental=False, num_combs=None):
+        """Log the transitions saved by the given order with respect to
+        executing the combinations grouped by dataset in arbitrary order and
+        restarting the cluster in every experiment.
+
+        Combinations sharing dataset and configuration cause the same
+        transitions wherever they are placed in their group, so a single one
+        of each group can be given along with the total number of
+        experiments.
+
+        Args:
+          combs (list of dict):
+            The combinations in arbitrary order.
+          ordered (list of dict):
+            The same combinations, ordered.
+          num_repetitions (int, optional):
+            The number of times each combination is executed.
+          incremental (bool, optional):
+            Whether datasets are resized in place.
+          num_combs (int, optional):
+            The number of combinations represented by the given ones. The
+            length of combs by default.
+        """
+
+        # Combinations were consumed dataset by dataset, in the order of
+        # their first appearance
+        first_seen = {}
+        for (idx, comb) in enumerate(combs):
+            first_seen.setdefault(self.get_ds_key(comb), idx)
+        unordered = sorted(combs,
+                           key=lambda c: first_seen[self.get_ds_key(c)])
+
+        (loads, _, _) = self.count_transitions(unordered, incremental)
+        (new_loads, new_resizes, new_restarts) = \
+            self.count_transitions(ordered, incremental)
+        if num_combs is None:
+            num_combs = len(combs)
+        restarts = num_combs * num_repetitions
+
+        logger.info("Combinations ordered with " + str(new_loads) +
+                    " dataset loads, " + str(new_resizes) + " resizes and " +
+                    str(new_restarts) + " restarts (saving " +
+                    str(loads - new_loads) + " loads and " +
+                    str(restarts - new_restarts) + " restarts)")
@@ -0,0 +1,385 @@
+"""This module provides the remote sources from which the nodes of a cluster
+can fetch the files of a dataset directly, without going through the
+frontend.
+
+A source lists its files and builds the shell commands that the nodes execute
+to write a file, or a byte range of it, to their standard output. Large files
+are fetched with several range requests in parallel.
+"""
+
+import pipes
+import re
+import urllib
+import urlparse
+
+from abc import ABCMeta, abstractmethod
+from xml.etree import ElementTree
+
+from execo_engine import logger
+from hadoop_g5k.local import get_process
+
+# Default parallel connections used to fetch a single file
+DEFAULT_CONNECTIONS = 4
+
+# Minimum size of a range fetched by a connection
+DEFAULT_RANGE_SIZE = 64 * 1024 * 1024
+
+# Maximum number of files queried by a single command
+MAX_FILES_PER_COMMAND = 100
+
+# Default endpoint of s3:// sources
+DEFAULT_S3_ENDPOINT = "https://s3.amazonaws.com"
+DEFAULT_S3_REGION = "us-east-1"
+
+# Links of an HTML directory index
+HREF_PATTERN = re.compile(r"""href\s*=\s*["']([^"'?#]+)["']""", re.I)
+
+
+def split_ranges(size, num_ranges):
+    """Split a file into contiguous byte ranges of similar size.
+
+    Args:
+      size (int):
+        The size of the file.
+      num_ranges (int):
+        The number of ranges.
+
+    Returns (list of tuple):
+      The offset and length of each range, in order.
+    """
+
+    num_ranges = max(1, min(num_ranges, size))
+    length = size // num_ranges
+    ranges = []
+    offset = 0
+    for i in range(num_ranges):
+        range_length = length + (1 if i < size % num_ranges else 0)
+        ranges.append((offset, range_length))
+        offset += range_length
+    return ranges
+
+
+class DataSource(object):
+    """This class defines a source of files reachable from the nodes.
+
+    Attributes:
+      url (str):
+        The URL of the source.
+      ranges (bool):
+        Whether files can be fetched by byte ranges.
+    """
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self, url, params):
+        """Create a source.
+
+        Args:
+          url (str):
+            The URL of the source.
+          params (dict):
+            The parameters of the dataset.
+        """
+
+        self.url = url
+        self.ranges = True
+
+    def _run(self, hc, command):
+        """Execute a command in the master of the cluster and return its
+        output, or None if it failed."""
+
+        proc = get_process(command, hc.master)
+        proc.nolog_exit_code = True
+        proc.run()
+        if not proc.finished_ok:
+            logger.warn("Error while accessing " + self.url + ": " +
+                        proc.stderr.strip())
+            return None
+        return proc.stdout
+
+    @abstractmethod
+    def list_files(self, hc):
+        """List the files of the source from the master of the cluster.
+
+        Args:
+          hc (HadoopCluster):
+            The Hadoop cluster which accesses the source.
+
+        Returns (dict of str: int):
+          The size of each file, identified by its name.
+        """
+
+        pass
+
+    def _parse_listing(self, listing):
+        """Parse a listing with the name and size of a file in each line."""
+
+        sizes = {}
+        for line in listing.splitlines():
+            fields = line.rsplit(None, 1)
+            if len(fields) == 2 and fields[1].isdigit():
+                sizes[fields[0].strip()] = int(fields[1])
+        return sizes
+
+    @abstractmethod
+    def get_command(self, name, offset=None, length=None):
+        """Return the shell command writing a file, or a range of it, to the
+        standard output.
+
+        Args:
+          name (str):
+            The name of the file.
+          offset (int, optional):
+            The offset of the range.
+          length (int, optional):
+            The length of the range.
+        """
+
+        pass
+
+    def get_fetch_command(self, name, size, num_ranges=1, tmp_dir="/tmp"):
+        """Return the shell command writing a file to the standard output.
+        If several ranges are used, they are fetched in parallel into a
+        temporary directory of the node and then written in order.
+
+        Args:
+          name (str):
+            The name of the file.
+          size (int):
+            The size of the file.
+          num_ranges (int, optional):
+            The number of ranges fetched in parallel.
+          tmp_dir (str, optional):
+            The directory of the node where the ranges are stored.
+        """
+
+        if not self.ranges or num_ranges <= 1 or size <= 1:
+            return self.get_command(name)
+
+        ranges = split_ranges(size, num_ranges)
+        commands = ["d=$(mktemp -d " + tmp_dir + "/hg5k_fetch.XXXXXX) || "
+                    "exit 1",
+                    "trap 'rm -rf \"$d\"' EXIT"]
+        for (idx, (offset, length)) in enumerate(ranges):
+            commands.append(self.get_command(name, offset, length) +
+                            " > \"$d/%05d\" & p%d=$!" % (idx, idx))
+        segments = " ".join("\"$d/%05d\"" % idx for idx in range(len(ranges)))
+        commands.append(" && ".join("wait $p%d" % idx
+                                    for idx in range(len(ranges))) +
+                        " && cat " + segments)
+
+        return "{ " + "; ".join(commands) + "; }"
+
+
+class HttpSource(DataSource):
+    """A directory served over HTTP(S).
+
+    Files are listed from a listing file, if given, or from the HTML index of
+    the directory along with a HEAD request for each file. Ranges are used if
+    the server announces them.
+    """
+
+    def __init__(self, url, params):
+        super(HttpSource, self).__init__(url, params)
+
+        self.base_url = url.rstrip("/") + "/"
+        self.listing = params.get("listing")
+        self.curl_options = params.get("curl_options", "")
+
+    def _get_file_url(self, name):
+        return self.base_url + urllib.quote(name)
+
+    def _get_curl_command(self, url, options=""):
+        command = "curl -sSfL"
+        if self.curl_options:
+            command += " " + self.curl_options
+        if options:
+            command += " " + options
+        return command + " " + pipes.quote(url)
+
+    def get_command(self, name, offset=None, length=None):
+        if offset is None:
+            return self._get_curl_command(self._get_file_url(name))
+        return self._get_curl_command(
+            self._get_file_url(name),
+            "-r " + str(offset) + "-" + str(offset + length - 1))
+
+    def _head_files(self, hc, names):
+        """Return the size of the given files and whether they accept
+        ranges, according to HEAD requests."""
+
+        sizes = {}
+        ranges = True
+        for i in range(0, len(names), MAX_FILES_PER_COMMAND):
+            chunk = names[i:i + MAX_FILES_PER_COMMAND]
+            command = "; ".join(
+                self._get_curl_command(self._get_file_url(n), "-I") +
+                " | tr -d '\\r' | awk 'tolower($1) == \"content-length:\" "
+                "{ n = $2 } tolower($1) == \"accept-ranges:\" { r = $2 } "
+                "END { print n \" \" r }'"
+                for n in chunk)
+            output = self._run(hc, "bash -c " + pipes.quote(command))
+            if output is None:
+                return (sizes, False)
+
+            for (name, line) in zip(chunk, output.splitlines()):
+                fields = line.split()
+                if fields and fields[0].isdigit():
+                    sizes[name] = int(fields[0])
+                ranges = ranges and len(fields) > 1 and fields[1] == "bytes"
+        return (sizes, ranges)
+
+    def list_files(self, hc):
+        if self.listing:
+            output = self._run(hc, self.get_command(self.listing))
+            if output is None:
+                return {}
+            sizes = self._parse_listing(output)
+            (_, self.ranges) = self._head_files(hc, sorted(sizes)[:1])
+        else:
+            output = self._run(hc, self._get_curl_command(self.base_url))
+            if output is None:
+                return {}
+            names = set()
+            for link in HREF_PATTERN.findall(output):
+                link = urlparse.urljoin(self.base_url, link)
+                if not link.startswith(self.base_url):
+                    continue
+                name = urllib.unquote(link[len(self.base_url):])
+                if name and "/" not in name:
+                    names.add(name)
+            (sizes, self.ranges) = self._head_files(hc, sorted(names))
+
+        if not self.ranges:
+            logger.warn(self.url + " does not accept range requests. Each "
+                        "file will be fetched with a single connection")
+        return sizes
+
+
+class S3Source(HttpSource):
+    """A prefix of a bucket of an S3-compatible object store, given as
+    s3://bucket/prefix.
+
+    Objects are accessed through path-style URLs of the endpoint. Requests
+    are signed by curl if credentials are given, and anonymous otherwise.
+    """
+
+    def __init__(self, url, params):
+        super(S3Source, self).__init__(url, params)
+
+        parsed = urlparse.urlparse(url)
+        self.bucket = parsed.netloc
+        self.prefix = parsed.path.lstrip("/")
+        if self.prefix and not self.prefix.endswith("/"):
+            self.prefix += "/"
+
+        self.endpoint = params.get("s3_endpoint",
+                                   DEFAULT_S3_ENDPOINT).rstrip("/")
+        self.base_url = (self.endpoint + "/" + self.bucket + "/" +
+                         urllib.quote(self.prefix))
+
+        if "s3_access_key" in params:
+            region = params.get("s3_region", DEFAULT_S3_REGION)
+            self.curl_options = (
+                "--aws-sigv4 " + pipes.quote("aws:amz:" + region + ":s3") +
+                " --user " + pipes.quote(params["s3_access_key"] + ":" +
+                                         params.get("s3_secret_key", "")) +
+                (" " + self.curl_options if self.curl_options else ""))
+
+    def list_files(self, hc):
+        if self.listing:
+            return super(S3Source, self).list_files(hc)
+
+        sizes = {}
+        token = None
+        while True:
+            query = {"list-type": "2", "prefix": self.prefix}
+            if token:
+                query["continuation-token"] = token
+            output = self._run(hc, self._get_curl_command(
+                self.endpoint + "/" + self.bucket + "?" +
+                urllib.urlencode(sorted(query.items()))))
+            if output is None:
+                break
+
+            root = ElementTree.fromstring(output)
+            token = None
+            truncated = False
+            for elem in root:
+                tag = elem.tag.split("}")[-1]
+                if tag == "Contents":
+                    fields = dict((child.tag.split("}")[-1], child.text)
+                                  for child in elem)
+                    name = fields["Key"][len(self.prefix):]
+                    if name and "/" not in name:
+                        sizes[name] = int(fields["Size"])
+                elif tag == "IsTruncated":
+                    truncated = elem.text == "true"
+                elif tag == "NextContinuationToken":
+                    token = elem.text
+            if not truncated or not token:
+                break
+
+        return sizes
+
+
+class FileSource(DataSource):
+    """A directory mounted in every node, such as an NFS export, given as
+    file:///path or nfs:///path."""
+
+    def __init__(self, url, params):
+        super(FileSource, self).__init__(url, params)
+
+        self.path = urlparse.urlparse(url).path
+        self.listing = params.get("listing")
+
+    def get_command(self, name, offset=None, length=None):
+        path = pipes.quote(self.path.rstrip("/") + "/" + name)
+        if offset is None:
+            return "cat " + path
+        return ("dd if=" + path + " bs=1M iflag=skip_bytes,count_bytes "
+                "skip=" + str(offset) + " count=" + str(length) +
+                " status=none")
+
+    def list_files(self, hc):
+        if self.listing:
+            output = self._run(hc, self.get_command(self.listing))
+            if output is None:
+                return {}
+            return self._parse_listing(output)
+
+        output = self._run(hc, "find " + pipes.quote(self.path) +
+                           " -maxdepth 1 -type f -printf '%f\\t%s\\n'")
+        if output is None:
+            return {}
+        return self._parse_listing(output)
+
+
+# Source classes by URL scheme
+SOURCES = {
+    "http": HttpSource,
+    "https": HttpSource,
+    "s3": S3Source,
+    "file": FileSource,
+    "nfs": FileSource
+}
+
+
+def get_data_source(url, params):
+    """Return the source of the given URL.
+
+    Args:
+      url (str):
+        The URL of the source: http(s)://, s3://, file:// or nfs://.
+      params (dict):
+        The parameters of the dataset.
+
+    Returns (DataSource):
+      The source.
+    """
+
+    scheme = urlparse.urlparse(url).scheme
+    if scheme not in SOURCES:
+        raise ValueError("Unsupported source " + url + ". Supported schemes "
+                         "are " + ", ".join(sorted(SOURCES)))
+    return SOURCES[scheme](url, params)
@@ -0,0 +1,391 @@
+"""This module stores the combinations of a test suite indexed by dataset and
+daemon configuration, so that the next combination to be executed is found
+without scanning all the remaining ones.
+
+The combinations are the cartesian product of the values of the parameters.
+They are never materialized: each one is identified by the positions of its
+values in the dataset, configuration and job sub-products, and the
+combinations sharing dataset and configuration are consumed in order from a
+cursor.
+"""
+
+import itertools
+import json
+import os
+import threading
+
+from execo_engine import logger
+from execo_engine.sweep import HashableDict
+
+# Name of the journal file inside the persistence directory
+JOURNAL_FILE_NAME = "combinations"
+
+# States of the combinations in the journal
+DONE = "done"
+IN_PROGRESS = "inprogress"
+CANCELLED = "cancelled"
+
+
+class Combination(HashableDict):
+    """A combination of parameters which knows its position in the store,
+    so that it is found even if its values are modified afterwards (e.g., by
+    macro replacement).
+
+    Attributes:
+      key (tuple of int):
+        The positions of the combination in the dataset, configuration and
+        job sub-products.
+    """
+
+    key = None
+
+    def copy(self):
+        comb = Combination(self)
+        comb.key = self.key
+        return comb
+
+
+class _Group(object):
+    """The combinations of a dataset and configuration not executed yet.
+
+    Job positions are given by a cursor, skipping the ones already taken, and
+    cancelled ones are given again before advancing it.
+    """
+
+    def __init__(self, num_jobs):
+        self.num_jobs = num_jobs
+        self.cursor = 0
+        self.cancelled = []
+
+    def next(self, is_taken, ds_idx, conf_idx):
+        """Return the position of the next job or None if there are none
+        left."""
+
+        while self.cancelled:
+            job_idx = self.cancelled.pop()
+            if not is_taken((ds_idx, conf_idx, job_idx)):
+                return job_idx
+        while self.cursor < self.num_jobs:
+            job_idx = self.cursor
+            self.cursor += 1
+            if not is_taken((ds_idx, conf_idx, job_idx)):
+                return job_idx
+        return None
+
+
+class CombinationStore(object):
+    """This class stores the combinations of a test suite and their state,
+    as ParamSweeper does, indexed by dataset and daemon configuration.
+
+    Combinations are first in progress, when they are given by get_next, and
+    then either done or cancelled, which makes them available again. The
+    changes of state are appended to a journal so that an interrupted test
+    suite is resumed. Combinations in progress when it was interrupted are
+    executed again.
+
+    The store can be shared by several threads.
+
+    Attributes:
+      scheduler (CombinationScheduler):
+        The scheduler giving the parameters of each kind and the order of
+        datasets and configurations.
+      lock (threading.RLock):
+        The lock protecting the store. It can be held by the caller to make
+        several operations atomic.
+    """
+
+    def __init__(self, persistence_dir, parameters, scheduler):
+        """Create the store and load the state of its combinations.
+
+        Args:
+          persistence_dir (str):
+            The directory where the journal is stored.
+          parameters (dict of str: list):
+            The values of each parameter.
+          scheduler (CombinationScheduler):
+            The scheduler classifying the parameters.
+        """
+
+        self.scheduler = scheduler
+        self.lock = threading.RLock()
+
+        # 1. Split the parameter space into sub-products
+        self._params = [scheduler.ds_params,
+                        scheduler.conf_params,
+                        scheduler.job_params]
+        self._values = {}
+        self._positions = {}
+        for pn in itertools.chain(*self._params):
+            values = []
+            for v in parameters[pn]:
+                if v not in values:
+                    values.append(v)
+            self._values[pn] = values
+            self._positions[pn] = dict((str(v), idx)
+                                       for (idx, v) in enumerate(values))
+
+        self._spaces = [list(itertools.product(
+            *[range(len(self._values[pn])) for pn in params]))
+            for params in self._params]
+        self._space_indices = [dict((positions, idx)
+                                    for (idx, positions) in enumerate(space))
+                               for space in self._spaces]
+        (num_ds, num_confs, num_jobs) = [len(s) for s in self._spaces]
+
+        self._ds_keys = [scheduler.get_ds_key(self._get_values(0, idx))
+                         for idx in range(num_ds)]
+        self._ds_indices = dict((k, idx)
+                                for (idx, k) in enumerate(self._ds_keys))
+        self._conf_keys = [scheduler.get_conf_key(self._get_values(1, idx))
+                           for idx in range(num_confs)]
+        self._conf_indices = dict((k, idx)
+                                  for (idx, k) in enumerate(self._conf_keys))
+
+        # 2. Load the journal
+        self._done = set()
+        self._inprogress = set()
+        self._journal_path = os.path.join(persistence_dir, JOURNAL_FILE_NAME)
+        if not os.path.exists(persistence_dir):
+            os.makedirs(persistence_dir)
+        self._load()
+        if self._inprogress:
+            logger.info(str(len(self._inprogress)) + " combinations were in "
+                        "progress when the test suite was interrupted. They "
+                        "will be executed again")
+            self._inprogress = set()
+
+        # 3. Index the groups with remaining combinations
+        self._groups = {}
+        num_done = dict(((d, c), 0) for d in range(num_ds)
+                        for c in range(num_confs))
+        for (d, c, _) in self._done:
+            num_done[(d, c)] += 1
+        for ((d, c), n) in num_done.items():
+            if n < num_jobs:
+                self._groups.setdefault(d, {})[c] = _Group(num_jobs)
+        self._num_remaining = num_ds * num_confs * num_jobs - len(self._done)
+
+    def _get_values(self, space, idx):
+        """Return the values of the parameters of a sub-product."""
+
+        params = self._params[space]
+        positions = self._spaces[space][idx]
+        return dict((pn, self._values[pn][pos])
+                    for (pn, pos) in zip(params, positions))
+
+    def _get_comb(self, key):
+        """Return the combination of the given key."""
+
+        comb = Combination()
+        for (space, idx) in enumerate(key):
+            comb.update(self._get_values(space, idx))
+        comb.key = key
+        return comb
+
+    def _get_key(self, comb):
+        """Return the key of a combination or None if it is not in the
+        store."""
+
+        if getattr(comb, "key", None) is not None:
+            return comb.key
+
+        key = []
+        for (space, params) in enumerate(self._params):
+            try:
+                positions = tuple(self._positions[pn][str(comb[pn])]
+                                  for pn in params)
+            except KeyError:
+                return None
+            key.append(self._space_indices[space][positions])
+        return tuple(key)
+
+    def _is_taken(self, key):
+        return key in self._done or key in self._inprogress
+
+    def _load(self):
+        if not os.path.exists(self._journal_path):
+            return
+
+        with open(self._journal_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last record may be truncated by an interruption
+                    continue
+                key = self._get_key(record["comb"])
+                if key is None:
+                    # The parameters changed since the record was written
+                    continue
+                self._inprogress.discard(key)
+                self._done.discard(key)
+                if record["state"] == DONE:
+                    self._done.add(key)
+                elif record["state"] == IN_PROGRESS:
+                    self._inprogress.add(key)
+
+    def _append(self, combs, state):
+        with open(self._journal_path, "a") as f:
+            for comb in combs:
+                values = dict((pn, self._values[pn][pos])
+                              for (space, idx) in enumerate(comb.key)
+                              for (pn, pos) in
+                              zip(self._params[space],
+                                  self._spaces[space][idx]))
+                f.write(json.dumps({"comb": values, "state": state}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def get_num_remaining(self):
+        """Return the number of combinations not done nor in progress."""
+
+        with self.lock:
+            return self._num_remaining
+
+    def get_num_done(self):
+        """Return the number of combinations done."""
+
+        with self.lock:
+            return len(self._done)
+
+    def get_ds_key(self, comb):
+        """Return the key of the dataset of a combination given by the store,
+        in the same form as the keys of the dataset cache."""
+
+        return self._ds_keys[comb.key[0]]
+
+    def get_conf_key(self, comb):
+        """Return the key of the daemon configuration of a combination given
+        by the store."""
+
+        return self._conf_keys[comb.key[1]]
+
+    def get_next(self, current=None, resident=(), busy=(), same_ds=False,
+                 same_conf=False):
+        """Return the next combination to be executed and mark it in
+        progress.
+
+        The dataset and configuration of the current combination are kept as
+        long as they have combinations left. Otherwise, the nearest
+        configuration of the dataset is chosen and, after that, the next
+        dataset given by the scheduler.
+
+        Args:
+          current (Combination, optional):
+            The combination whose dataset and configuration are currently
+            deployed.
+          resident (collection of tuple, optional):
+            The keys of datasets already present in the cluster.
+          busy (collection of tuple, optional):
+            The keys of datasets used by other clusters. They are only chosen
+            if there are no others left.
+          same_ds (bool, optional):
+            Whether only combinations of the current dataset are considered.
+          same_conf (bool, optional):
+            Whether only combinations of the current dataset and
+            configuration are considered.
+
+        Returns (Combination):
+          The next combination or None if there are none left.
+        """
+
+        with self.lock:
+            if current is not None:
+                (ds_idx, conf_idx, _) = current.key
+            else:
+                (ds_idx, conf_idx) = (None, None)
+
+            while True:
+                # 1. Choose the dataset
+                if ds_idx not in self._groups:
+                    if same_ds or same_conf or not self._groups:
+                        return None
+                    keys = [self._ds_keys[d] for d in self._groups]
+                    free = [k for k in keys if k not in busy]
+                    ds_key = self.scheduler.get_next_ds_key(
+                        free or keys, None, resident)
+                    ds_idx = self._ds_indices[ds_key]
+                conf_groups = self._groups[ds_idx]
+
+                # 2. Choose the configuration
+                if conf_idx not in conf_groups:
+                    if same_conf:
+                        return None
+                    current_conf = (self._conf_keys[conf_idx]
+                                    if conf_idx is not None else None)
+                    conf_key = self.scheduler.get_nearest_key(
+                        [self._conf_keys[c] for c in conf_groups],
+                        current_conf)
+                    conf_idx = self._conf_indices[conf_key]
+
+                # 3. Take the next job of the group
+                job_idx = conf_groups[conf_idx].next(self._is_taken, ds_idx,
+                                                     conf_idx)
+                if job_idx is not None:
+                    break
+
+                del conf_groups[conf_idx]
+                if not conf_groups:
+                    del self._groups[ds_idx]
+
+            key = (ds_idx, conf_idx, job_idx)
+            comb = self._get_comb(key)
+            self._inprogress.add(key)
+            self._num_remaining -= 1
+            self._append([comb], IN_PROGRESS)
+            return comb
+
+    def done(self, comb):
+        """Mark a combination given by get_next as done.
+
+        Args:
+          comb (Combination):
+            The combination.
+        """
+
+        with self.lock:
+            key = self._get_key(comb)
+            if key is None or key not in self._inprogress:
+                return
+            self._inprogress.discard(key)
+            self._done.add(key)
+            self._append([self._get_comb(key)], DONE)
+
+    def cancel(self, comb):
+        """Cancel a combination given by get_next, so that it is given again.
+
+        Args:
+          comb (Combination):
+            The combination.
+        """
+
+        with self.lock:
+            key = self._get_key(comb)
+            if key is None or key not in self._inprogress:
+                return
+            self._inprogress.discard(key)
+            self._num_remaining += 1
+            (ds_idx, conf_idx, job_idx) = key
+            conf_groups = self._groups.setdefault(ds_idx, {})
+            if conf_idx not in conf_groups:
+                group = _Group(len(self._spaces[2]))
+                group.cursor = group.num_jobs
+                conf_groups[conf_idx] = group
+            conf_groups[conf_idx].cancelled.append(job_idx)
+            self._append([self._get_comb(key)], CANCELLED)
+
+    def get_group_representatives(self):
+        """Return a combination of each group of remaining combinations
+        sharing dataset and configuration, along with the number of
+        combinations remaining.
+
+        Returns (tuple):
+          The list of combinations and the number of remaining ones.
+        """
+
+        with self.lock:
+            combs = []
+            for (ds_idx, conf_groups) in self._groups.items():
+                for conf_idx in conf_groups:
+                    combs.append(self._get_comb((ds_idx, conf_idx, 0)))
+            return (combs, self._num_remaining)
@@ -0,0 +1,362 @@
+"""This module provides the tools to run a pseudo-distributed deployment in the
+local machine.
+
+Each node of the cluster is represented by a LocalHost, a virtual host living
+in localhost. Every virtual host has its own root directory, under which the
+base, configuration, log and data directories of the cluster are created, and
+its own port range. Commands addressed to virtual hosts are executed as local
+subprocesses instead of through ssh.
+"""
+
+import getpass
+import multiprocessing
+import os
+import pipes
+
+from execo.action import Local, ParallelActions, Put, Get, Remote, \
+    TaktukPut, TaktukRemote
+from execo.host import Host
+from execo.process import Process, SshProcess
+from execo.ssh_utils import get_ssh_command, get_rewritten_host_address
+from execo.utils import comma_join
+from execo.log import style
+from execo_g5k.api_utils import get_host_attributes as get_g5k_host_attributes
+
+# Default parameters
+DEFAULT_LOCAL_ROOT_DIR = "/tmp/" + getpass.getuser() + "_local"
+DEFAULT_LOCAL_PORT_STRIDE = 100
+
+# Environment variable containing the root dir of each virtual host
+LOCAL_ROOT_VAR = "HG5K_ROOT"
+
+
+class LocalHost(Host):
+    """A virtual host of a pseudo-distributed deployment.
+
+    Attributes:
+      index (int):
+        The index of the virtual host.
+      root_dir (str):
+        The directory under which all the files of the virtual host are
+        stored.
+      port_offset (int):
+        The offset to be added to the ports used by the daemons running in
+        the virtual host.
+      num_hosts (int):
+        The number of virtual hosts sharing the local machine.
+    """
+
+    def __init__(self, index, root_dir=DEFAULT_LOCAL_ROOT_DIR,
+                 port_stride=DEFAULT_LOCAL_PORT_STRIDE, num_hosts=1):
+        """Create a new virtual host.
+
+        Args:
+          index (int):
+            The index of the virtual host.
+          root_dir (str, optional):
+            The directory where the roots of the virtual hosts are created.
+          port_stride (int, optional):
+            The distance between the port ranges of two consecutive virtual
+            hosts.
+          num_hosts (int, optional):
+            The number of virtual hosts sharing the local machine.
+        """
+
+        super(LocalHost, self).__init__("localhost")
+
+        self.index = index
+        self.root_dir = os.path.join(root_dir, "vh" + str(index))
+        self.port_offset = index * port_stride
+        self.num_hosts = num_hosts
+
+    def __eq__(self, other):
+        if not isinstance(other, LocalHost):
+            return False
+        return self.root_dir == other.root_dir
+
+    def __hash__(self):
+        return self.root_dir.__hash__()
+
+    def _args(self):
+        return comma_join(style.host(repr(self.address)),
+                          "index=%r" % (self.index,))
+
+    def __repr__(self):
+        return "LocalHost(%s)" % (self._args())
+
+
+def generate_local_hosts(num_hosts, root_dir=DEFAULT_LOCAL_ROOT_DIR):
+    """Generate the given number of virtual hosts.
+
+    Args:
+      num_hosts (int):
+        The number of virtual hosts.
+      root_dir (str, optional):
+        The directory where the roots of the virtual hosts are created.
+
+    Returns (list of LocalHost):
+      The list of virtual hosts.
+    """
+
+    return [LocalHost(idx, root_dir, num_hosts=num_hosts)
+            for idx in range(0, num_hosts)]
+
+
+def is_local_deployment(hosts):
+    """Determine whether the given hosts form a pseudo-distributed deployment.
+
+    Args:
+      hosts (list of Host):
+        The hosts of the cluster.
+
+    Returns (bool):
+      True if all the hosts are virtual hosts, False otherwise.
+    """
+
+    return bool(hosts) and all(isinstance(h, LocalHost) for h in hosts)
+
+
+def local_path(path):
+    """Return the given path relative to the root of the virtual host where it
+    is used.
+
+    The returned path is expanded by the shell of each virtual host.
+
+    Args:
+      path (str):
+        An absolute path.
+    """
+
+    return "${" + LOCAL_ROOT_VAR + "}" + path
+
+
+def expand_path(path, host):
+    """Return the actual path corresponding to the given path in the host.
+
+    Args:
+      path (str):
+        The path, possibly relative to the root of a virtual host.
+      host (Host):
+        The host where the path is used.
+    """
+
+    if isinstance(host, LocalHost):
+        return path.replace("${" + LOCAL_ROOT_VAR + "}", host.root_dir)
+    else:
+        return path
+
+
+def get_local_port(port, host):
+    """Return the port to be used in the host for the given default port.
+
+    Args:
+      port (int):
+        The default port.
+      host (Host):
+        The host where the port is used.
+    """
+
+    if isinstance(host, LocalHost):
+        return port + host.port_offset
+    else:
+        return port
+
+
+def get_host_attributes(host):
+    """Return the attributes of the host, as given by the Grid5000 API.
+
+    For a virtual host the attributes are computed from the local machine,
+    sharing its cores and memory among the virtual hosts.
+
+    Args:
+      host (Host):
+        The host whose attributes are queried.
+    """
+
+    if isinstance(host, LocalHost):
+        num_cores = max(2, multiprocessing.cpu_count() / host.num_hosts)
+        ram_size = (os.sysconf("SC_PAGE_SIZE") *
+                    os.sysconf("SC_PHYS_PAGES") / host.num_hosts)
+        return {
+            u'architecture': {u'smt_size': num_cores},
+            u'main_memory': {u'ram_size': ram_size},
+            u'network_adapters': []
+        }
+    else:
+        return get_g5k_host_attributes(host)
+
+
+# Transport ###################################################################
+
+def _local_command(cmd, host):
+    return ("export " + LOCAL_ROOT_VAR + "=" + host.root_dir + " ; " +
+            "mkdir -p " + host.root_dir + " ; " + cmd)
+
+
+def get_process(cmd, host):
+    """Return a process executing the command in the given host.
+
+    Args:
+      cmd (str):
+        The command to be executed.
+      host (Host):
+        The host where the command is executed.
+
+    Returns (Process):
+      A local process for virtual hosts and a SshProcess otherwise.
+    """
+
+    if isinstance(host, LocalHost):
+        proc = Process(_local_command(cmd, host), shell=True)
+        proc.host = host
+        return proc
+    else:
+        return SshProcess(cmd, host)
+
+
+def get_stream_process(local_file, cmd, host, length=None):
+    """Return a process executing the command in the given host with the
+    contents of a local file as its standard input. The file is streamed over
+    the connection and never stored in the host.
+
+    Args:
+      local_file (str):
+        The path of the local file.
+      cmd (str):
+        The command to be executed.
+      host (Host):
+        The host where the command is executed.
+      length (int, optional):
+        If indicated, only the given number of bytes from the beginning of the
+        file are streamed.
+
+    Returns (Process):
+      A local process running the command or the ssh connection.
+    """
+
+    full_cmd = _get_receiving_command(cmd, host)
+    if length is None:
+        full_cmd += " < " + pipes.quote(local_file)
+    else:
+        full_cmd = ("head -c " + str(length) + " " + pipes.quote(local_file) +
+                    " | " + full_cmd)
+
+    proc = Process(full_cmd, shell=True)
+    proc.host = host
+    return proc
+
+
+def get_pipe_process(local_cmd, cmd, host):
+    """Return a process executing the command in the given host with the
+    output of a local command as its standard input.
+
+    Args:
+      local_cmd (str):
+        The command executed locally.
+      cmd (str):
+        The command to be executed in the host.
+      host (Host):
+        The host where the command is executed.
+
+    Returns (Process):
+      A local process running both commands.
+    """
+
+    proc = Process("bash -c " + pipes.quote(
+        "set -o pipefail; " + local_cmd + " | " +
+        _get_receiving_command(cmd, host)), shell=True)
+    proc.host = host
+    return proc
+
+
+def _get_receiving_command(cmd, host):
+    """Return the local command running cmd in the host with the local
+    standard input."""
+
+    if isinstance(host, LocalHost):
+        return "(" + _local_command(cmd, host) + ")"
+    else:
+        # A pseudo-terminal would alter binary data, so it is disabled
+        ssh_cmd = [arg for arg in get_ssh_command(host.user, host.keyfile,
+                                                  host.port)
+                   if arg not in ["-t", "-tt"]]
+        ssh_cmd = ssh_cmd[:1] + ["-T"] + ssh_cmd[1:] + \
+            [get_rewritten_host_address(host.address, None), cmd]
+        return " ".join(pipes.quote(arg) for arg in ssh_cmd)
+
+
+def _local_action(cmd, hosts):
+    actions = []
+    for h in hosts:
+        action = Local(_local_command(cmd, h), process_args={"shell": True})
+        for p in action.processes:
+            p.host = h
+        actions.append(action)
+    return ParallelActions(actions)
+
+
+def get_remote(cmd, hosts, taktuk=False):
+    """Return an action executing the command in all the given hosts.
+
+    Args:
+      cmd (str):
+        The command to be executed.
+      hosts (list of Host):
+        The hosts where the command is executed.
+      taktuk (bool, optional):
+        If True, TaktukRemote is used for non-virtual hosts.
+    """
+
+    if is_local_deployment(hosts):
+        return _local_action(cmd, hosts)
+    elif taktuk:
+        return TaktukRemote(cmd, hosts)
+    else:
+        return Remote(cmd, hosts)
+
+
+def get_put(hosts, local_files, remote_location=".", taktuk=False):
+    """Return an action copying local files into all the given hosts.
+
+    Args:
+      hosts (list of Host):
+        The hosts where the files are copied.
+      local_files (list of str):
+        The paths of the local files.
+      remote_location (str, optional):
+        The remote directory where the files are copied.
+      taktuk (bool, optional):
+        If True, TaktukPut is used for non-virtual hosts.
+    """
+
+    if is_local_deployment(hosts):
+        if not local_files:
+            return ParallelActions([])
+        return _local_action("mkdir -p " + remote_location + " && " +
+                             "cp -r " + " ".join(local_files) + " " +
+                             remote_location, hosts)
+    elif taktuk:
+        return TaktukPut(hosts, local_files, remote_location)
+    else:
+        return Put(hosts, local_files, remote_location)
+
+
+def get_get(hosts, remote_files, local_location="."):
+    """Return an action copying remote files from all the given hosts.
+
+    Args:
+      hosts (list of Host):
+        The hosts from which the files are copied.
+      remote_files (list of str):
+        The paths of the remote files.
+      local_location (str, optional):
+        The local directory where the files are copied.
+    """
+
+    if is_local_deployment(hosts):
+        if not remote_files:
+            return ParallelActions([])
+        return _local_action("cp -r " + " ".join(remote_files) + " " +
+                             local_location, hosts)
+    else:
+        return Get(hosts, remote_files, local_location)
@@ -1,9 +1,12 @@
 import os
+import pipes
 import stat
 
 from execo_engine import logger
 from execo_g5k.api_utils import get_host_attributes
 
+from hadoop_g5k.local import LocalHost
+
 
 class HadoopException(Exception):
     pass
@@ -38,6 +41,9 @@ class HadoopTopology(object):
         logger.info("Discovering topology automatically")
         self.topology = {}
         for h in hosts:
+            if isinstance(h, LocalHost):
+                self.topology[h] = "/default-rack"
+                continue
             nw_adapters = get_host_attributes(h)[u'network_adapters']
             for nwa in nw_adapters:
                 if (u'network_address' in nwa and
@@ -129,6 +135,8 @@ class HadoopJarJob(object):
         The list of parameters of the job.
       lib_paths (list of str):
         The list of local paths to the libraries used by the job.
+      properties (dict of str:str):
+        The Hadoop properties given to the job with -D options.
       state (int):
         State of the job.
       job_id (str):
@@ -142,7 +150,8 @@ class HadoopJarJob(object):
     job_id = "unknown"
     success = None
 
-    def __init__(self, jar_path, params=None, lib_paths=None):
+    def __init__(self, jar_path, params=None, lib_paths=None,
+                 properties=None):
         """Creates a new Hadoop MapReduce jar job with the given parameters.
 
         Args:
@@ -152,12 +161,18 @@ class HadoopJarJob(object):
             The list of parameters of the job.
           lib_paths (list of str, optional):
             The list of local paths to the libraries used by the job.
+          properties (dict of str:str, optional):
+            The Hadoop properties given to the job. They are passed after the
+            first parameter (the main class or the program of the jar), as
+            expected by ToolRunner, and ignored if there are no parameters.
         """
 
         if not params:
             params = []
         if not lib_paths:
             lib_paths = []
+        if not properties:
+            properties = {}
 
         # Check if the jar file exists
         if not os.path.exists(jar_path):
@@ -173,6 +188,7 @@ class HadoopJarJob(object):
         self.jar_path = jar_path
         self.params = params
         self.lib_paths = lib_paths
+        self.properties = properties
 
     def get_files_to_copy(self):
         """Return the set of files that are used by the job and need to be
@@ -205,11 +221,20 @@ class HadoopJarJob(object):
             libs_param = ""
 
         if isinstance(self.params, basestring):
-            params_str = " " + self.params
+            params = self.params.split(None, 1)
         else:
-            params_str = ""
-            for p in self.params:
-                params_str += " " + p
+            params = list(self.params)
+
+        # Generic options go after the main class. Without it, properties
+        # are only taken from the configuration files
+        if self.properties and params:
+            props = [pipes.quote("-D" + pn + "=" + str(pv))
+                     for (pn, pv) in sorted(self.properties.items())]
+            params[1:1] = props
+
+        params_str = ""
+        for p in params:
+            params_str += " " + p
 
         return "jar " + jar_file + libs_param + params_str
 
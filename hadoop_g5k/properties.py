@@ -0,0 +1,141 @@
+"""Classification of the Hadoop configuration properties by the component
+reading them.
+
+Job-level properties are read by the client when a job is submitted, so they
+can be given per job with -D options. The rest of properties are read by the
+daemons when they start, so changing them requires restarting only those
+daemons.
+
+Properties are matched by name or, if the entry ends with a dot, by prefix.
+The longest matching entry is used.
+"""
+
+# Component of the properties read at job submission
+JOB = "job"
+
+# Properties of Hadoop 0.* and 1.*
+V1_PROPERTIES = {
+    # Job
+    "mapred.map.": JOB,
+    "mapred.reduce.": JOB,
+    "mapred.job.reuse.jvm.num.tasks": JOB,
+    "mapred.job.shuffle.": JOB,
+    "mapred.job.reduce.input.buffer.percent": JOB,
+    "mapred.job.map.memory.mb": JOB,
+    "mapred.job.reduce.memory.mb": JOB,
+    "mapred.child.": JOB,
+    "mapred.compress.map.output": JOB,
+    "mapred.output.": JOB,
+    "mapred.min.split.size": JOB,
+    "mapred.max.split.size": JOB,
+    "mapred.inmem.merge.threshold": JOB,
+    "mapred.skip.": JOB,
+    "mapred.speculative.execution": JOB,
+    "mapred.task.timeout": JOB,
+    "mapred.task.profile": JOB,
+    "mapred.task.profile.": JOB,
+    "io.sort.": JOB,
+    "dfs.replication": JOB,
+    "dfs.block.size": JOB,
+
+    # NameNode
+    "dfs.name.": ["NameNode"],
+    "dfs.namenode.": ["NameNode"],
+    "dfs.permissions": ["NameNode"],
+    "dfs.permissions.": ["NameNode"],
+    "dfs.replication.min": ["NameNode"],
+    "dfs.replication.max": ["NameNode"],
+    "dfs.replication.interval": ["NameNode"],
+    "dfs.safemode.": ["NameNode"],
+    "dfs.hosts": ["NameNode"],
+    "dfs.hosts.exclude": ["NameNode"],
+    "dfs.heartbeat.interval": ["NameNode", "DataNode"],
+    "dfs.support.append": ["NameNode", "DataNode"],
+
+    # DataNode
+    "dfs.data.dir": ["DataNode"],
+    "dfs.datanode.": ["DataNode"],
+    "dfs.max.xcievers": ["DataNode"],
+    "dfs.balance.bandwidthPerSec": ["DataNode"],
+    "dfs.blockreport.intervalMsec": ["DataNode"],
+
+    # JobTracker
+    "mapred.jobtracker.": ["JobTracker"],
+    "mapred.job.tracker.": ["JobTracker"],
+    "mapred.system.dir": ["JobTracker"],
+    "mapred.hosts": ["JobTracker"],
+    "mapred.hosts.exclude": ["JobTracker"],
+    "mapred.fairscheduler.": ["JobTracker"],
+    "mapred.capacity-scheduler.": ["JobTracker"],
+    "mapred.queue.names": ["JobTracker"],
+    "jobtracker.": ["JobTracker"],
+
+    # TaskTracker
+    "mapred.tasktracker.": ["TaskTracker"],
+    "mapred.local.dir": ["TaskTracker"],
+    "mapred.task.tracker.": ["TaskTracker"],
+    "tasktracker.": ["TaskTracker"]
+}
+
+# Properties of Hadoop 2.*
+V2_PROPERTIES = {
+    # Job
+    "mapreduce.job.": JOB,
+    "mapreduce.map.": JOB,
+    "mapreduce.reduce.": JOB,
+    "mapreduce.task.": JOB,
+    "mapreduce.input.": JOB,
+    "mapreduce.output.": JOB,
+    "mapreduce.fileoutputcommitter.": JOB,
+    "mapreduce.framework.name": JOB,
+    "yarn.app.mapreduce.am.": JOB,
+    "dfs.replication": JOB,
+    "dfs.blocksize": JOB,
+
+    # NameNode
+    "dfs.namenode.": ["NameNode"],
+    "dfs.permissions.": ["NameNode"],
+    "dfs.replication.max": ["NameNode"],
+    "dfs.hosts": ["NameNode"],
+    "dfs.hosts.exclude": ["NameNode"],
+    "dfs.heartbeat.interval": ["NameNode", "DataNode"],
+
+    # DataNode
+    "dfs.datanode.": ["DataNode"],
+    "dfs.blockreport.": ["DataNode"],
+
+    # ResourceManager
+    "yarn.resourcemanager.": ["ResourceManager"],
+    "yarn.scheduler.": ["ResourceManager"],
+    "yarn.acl.": ["ResourceManager"],
+
+    # NodeManager
+    "yarn.nodemanager.": ["NodeManager"],
+    "mapreduce.shuffle.": ["NodeManager"]
+}
+
+
+def get_property_component(name, properties):
+    """Return the component reading the given property.
+
+    Args:
+      name (str):
+        The name of the property.
+      properties (dict):
+        The classification of the properties of the Hadoop version.
+
+    Returns (str or list of str):
+      JOB for job-level properties, the names of the daemons reading the
+      property or None if it is not classified.
+    """
+
+    match = None
+    for entry in properties:
+        if (entry == name or
+                (entry.endswith(".") and name.startswith(entry))):
+            if match is None or len(entry) > len(match):
+                match = entry
+
+    if match is None:
+        return None
+    return properties[match]
@@ -0,0 +1,415 @@
+"""This module provides the tools to distribute the transfer of a set of local
+files among the hosts of a cluster, with a bounded and adaptive number of
+concurrent transfers.
+"""
+
+import heapq
+import os
+import threading
+import time
+
+from collections import deque
+
+from execo_engine import logger
+
+# Default limits of concurrent transfers
+DEFAULT_MAX_TRANSFERS = 64
+DEFAULT_MAX_TRANSFERS_PER_HOST = 4
+
+# Throughput measurement
+DEFAULT_MONITOR_INTERVAL = 10
+THROUGHPUT_TOLERANCE = 0.05
+
+
+def get_path_size(path):
+    """Return the size in bytes of a local file or directory.
+
+    Args:
+      path (str):
+        The local path.
+
+    Returns (int):
+      The size of the file or the sum of the sizes of the files in the
+      directory tree.
+    """
+
+    if os.path.isdir(path):
+        size = 0
+        for (dir_path, _, file_names) in os.walk(path):
+            for f in file_names:
+                size += os.path.getsize(os.path.join(dir_path, f))
+        return size
+    else:
+        return os.path.getsize(path)
+
+
+def balance_files(files, sizes, num_bins):
+    """Assign the files to the given number of bins balancing their sizes.
+    The longest-processing-time-first heuristic is used: files are taken in
+    decreasing size and assigned to the least loaded bin.
+
+    Args:
+      files (list of str):
+        The files to be assigned.
+      sizes (dict of str: int):
+        The size of each file.
+      num_bins (int):
+        The number of bins.
+
+    Returns (tuple of list):
+      The list of files assigned to each bin, in decreasing size, and the
+      total size of each bin.
+    """
+
+    bins = [[] for _ in range(num_bins)]
+    loads = [0] * num_bins
+
+    heap = [(0, idx) for idx in range(num_bins)]
+    for f in sorted(files, key=lambda x: sizes[x], reverse=True):
+        (load, idx) = heapq.heappop(heap)
+        bins[idx].append(f)
+        loads[idx] = load + sizes[f]
+        heapq.heappush(heap, (loads[idx], idx))
+
+    return (bins, loads)
+
+
+class FileDispatcher(object):
+    """This class dispatches a set of files among hosts.
+
+    Files are first assigned to hosts with balance_files. Each host consumes
+    its own queue from the largest file to the smallest one. When a host
+    empties its queue, it steals the smallest pending file of the host with
+    the most pending bytes, so that the end of the transfer is not held up by
+    the slowest host.
+
+    Attributes:
+      hosts (list of Host):
+        The hosts among which the files are dispatched.
+      sizes (dict of str: int):
+        The size of each file.
+      expected (dict of Host: int):
+        The bytes initially assigned to each host.
+      achieved (dict of Host: int):
+        The bytes actually processed by each host.
+      failed (list of str):
+        The files whose processing raised an exception.
+    """
+
+    def __init__(self, hosts, files, sizes=None):
+        """Create a new dispatcher.
+
+        Args:
+          hosts (list of Host):
+            The hosts among which the files are dispatched.
+          files (list of str):
+            The local paths of the files.
+          sizes (dict of str: int, optional):
+            The size of each file. If not indicated, it is computed from the
+            local filesystem.
+        """
+
+        if sizes is None:
+            sizes = dict((f, get_path_size(f)) for f in files)
+
+        self.hosts = hosts
+        self.sizes = sizes
+
+        (bins, loads) = balance_files(files, sizes, len(hosts))
+
+        self._queues = {}
+        self._pending = {}
+        self.expected = {}
+        self.achieved = {}
+        self._num_files = {}
+        self._time = {}
+        for (idx, h) in enumerate(hosts):
+            self._queues[h] = deque(bins[idx])
+            self._pending[h] = loads[idx]
+            self.expected[h] = loads[idx]
+            self.achieved[h] = 0
+            self._num_files[h] = 0
+            self._time[h] = 0
+
+        self.failed = []
+        self._lock = threading.Lock()
+
+    def next_file(self, host):
+        """Return the next file to be processed by the given host.
+
+        Args:
+          host (Host):
+            The host asking for work.
+
+        Returns (str):
+          The path of the file, or None if there are no pending files.
+        """
+
+        with self._lock:
+            queue = self._queues[host]
+            owner = host
+            if not queue:
+                # Steal from the host with the most pending bytes
+                owner = max(self.hosts, key=lambda h: self._pending[h])
+                queue = self._queues[owner]
+                if not queue:
+                    return None
+                f = queue.pop()
+            else:
+                f = queue.popleft()
+
+            self._pending[owner] -= self.sizes[f]
+            return f
+
+    def file_done(self, host, f):
+        """Account the given file as processed by the host.
+
+        Args:
+          host (Host):
+            The host which processed the file.
+          f (str):
+            The path of the file.
+        """
+
+        with self._lock:
+            self.achieved[host] += self.sizes[f]
+            self._num_files[host] += 1
+
+    def run(self, function, max_transfers=DEFAULT_MAX_TRANSFERS,
+            max_transfers_per_host=DEFAULT_MAX_TRANSFERS_PER_HOST):
+        """Process all the files in parallel.
+
+        Each host runs up to max_transfers_per_host transfers at the same
+        time, while the total number of concurrent transfers is bounded by a
+        ConcurrencyController that adapts its limit to the measured aggregate
+        throughput.
+
+        Args:
+          function (callable):
+            The function processing a file in a host. It receives the host and
+            the path of the file as arguments.
+          max_transfers (int, optional):
+            The maximum number of concurrent transfers in the whole cluster.
+          max_transfers_per_host (int, optional):
+            The maximum number of concurrent transfers in each host.
+
+        Returns (list of str):
+          The files whose processing raised an exception.
+        """
+
+        max_transfers = min(max_transfers,
+                            max_transfers_per_host * len(self.hosts))
+        controller = ConcurrencyController(
+            min(len(self.hosts), max_transfers), 1, max_transfers)
+
+        start = time.time()
+
+        def worker(host):
+            while True:
+                controller.acquire()
+                try:
+                    f = self.next_file(host)
+                    if f is None:
+                        break
+                    try:
+                        function(host, f)
+                    except Exception:
+                        logger.exception("Error while transferring " + f +
+                                         " through " + str(host))
+                        with self._lock:
+                            self.failed.append(f)
+                        controller.add_bytes(0)
+                        continue
+                    self.file_done(host, f)
+                    controller.add_bytes(self.sizes[f])
+                    with self._lock:
+                        self._time[host] = time.time() - start
+                finally:
+                    controller.release()
+
+        threads = []
+        for h in self.hosts:
+            for _ in range(max_transfers_per_host):
+                t = threading.Thread(target=worker, args=(h,))
+                t.start()
+                threads.append(t)
+
+        controller.start_monitor()
+        for t in threads:
+            t.join()
+        controller.stop_monitor()
+
+        self.log_report()
+
+        elapsed = time.time() - start
+        total = sum(self.achieved.values())
+        if elapsed:
+            logger.info("Transferred " + str(total) + " bytes in %.1f s "
+                        "(%.1f MB/s), concurrency limit between %d and %d" %
+                        (elapsed, total / 1048576.0 / elapsed,
+                         controller.min_used, controller.max_used))
+        if self.failed:
+            logger.error("The transfer of " + str(len(self.failed)) +
+                         " files failed: " + ", ".join(sorted(self.failed)))
+
+        return list(self.failed)
+
+    def log_report(self):
+        """Log the expected and achieved load of each host."""
+
+        for h in self.hosts:
+            if self._time[h]:
+                rate = " (%.1f MB/s)" % (self.achieved[h] / 1048576.0 /
+                                        self._time[h])
+            else:
+                rate = ""
+            logger.info(str(h) + ": expected " +
+                        str(self.expected[h]) + " bytes, achieved " +
+                        str(self.achieved[h]) + " bytes in " +
+                        str(self._num_files[h]) + " files, %.1f s" %
+                        self._time[h] + rate)
+
+
+class ConcurrencyController(object):
+    """This class bounds the number of concurrent transfers and adapts the
+    bound to the aggregate throughput.
+
+    A monitor thread measures the throughput periodically and follows a
+    hill-climbing strategy: the limit keeps moving in the same direction
+    while throughput improves, and the direction is reversed when it
+    degrades.
+
+    Bytes are only known when a transfer completes, so a measurement spans
+    as many intervals as needed for a number of transfers equal to the limit
+    to complete. With large files, measurements are thus longer instead of
+    seeing no bytes at all.
+
+    Attributes:
+      limit (int):
+        The current maximum number of concurrent transfers.
+      min_used (int):
+        The minimum limit used so far.
+      max_used (int):
+        The maximum limit used so far.
+    """
+
+    def __init__(self, initial_limit, min_limit, max_limit,
+                 interval=DEFAULT_MONITOR_INTERVAL):
+        """Create a new controller.
+
+        Args:
+          initial_limit (int):
+            The initial maximum number of concurrent transfers.
+          min_limit (int):
+            The lowest limit allowed.
+          max_limit (int):
+            The highest limit allowed.
+          interval (float, optional):
+            The seconds between two throughput measurements.
+        """
+
+        self.limit = max(min_limit, min(initial_limit, max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.interval = interval
+
+        self.min_used = self.max_used = self.limit
+
+        self._active = 0
+        self._bytes = 0
+        self._completed = 0
+        self._window_start = None
+        self._condition = threading.Condition()
+
+        self._direction = 1
+        self._last_throughput = None
+        self._stop = threading.Event()
+        self._monitor = None
+
+    def acquire(self):
+        """Wait until a new transfer can be started."""
+
+        with self._condition:
+            while self._active >= self.limit:
+                self._condition.wait()
+            self._active += 1
+
+    def release(self):
+        """Notify the end of a transfer."""
+
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def add_bytes(self, num_bytes):
+        """Account a completed transfer.
+
+        Args:
+          num_bytes (int):
+            The number of bytes transferred.
+        """
+
+        with self._condition:
+            self._bytes += num_bytes
+            self._completed += 1
+
+    def start_monitor(self):
+        """Start measuring throughput and adapting the limit."""
+
+        self._monitor = threading.Thread(target=self._monitor_loop)
+        self._monitor.daemon = True
+        self._monitor.start()
+
+    def stop_monitor(self):
+        """Stop the monitor thread."""
+
+        self._stop.set()
+        if self._monitor:
+            self._monitor.join()
+
+    def _monitor_loop(self):
+        self._window_start = time.time()
+        while not self._stop.wait(self.interval):
+            with self._condition:
+                if self._completed < self.limit:
+                    continue
+                now = time.time()
+                throughput = self._bytes / (now - self._window_start)
+                self._bytes = 0
+                self._completed = 0
+                self._window_start = now
+            self.adjust(throughput)
+
+    def adjust(self, throughput):
+        """Update the limit with a new throughput measurement.
+
+        Args:
+          throughput (float):
+            The aggregate throughput in bytes per second during the last
+            interval.
+        """
+
+        last = self._last_throughput
+        self._last_throughput = throughput
+
+        if last is None:
+            step = self._direction
+        elif throughput > last * (1 + THROUGHPUT_TOLERANCE):
+            step = self._direction
+        elif throughput < last * (1 - THROUGHPUT_TOLERANCE):
+            self._direction = -self._direction
+            step = self._direction
+        else:
+            return
+
+        with self._condition:
+            new_limit = max(self.min_limit,
+                            min(self.limit + step, self.max_limit))
+            if new_limit != self.limit:
+                logger.debug("Transfer concurrency limit: " +
+                             str(self.limit) + " -> " + str(new_limit) +
+                             " (%.1f MB/s)" % (throughput / 1048576.0))
+                self.limit = new_limit
+                self.min_used = min(self.min_used, new_limit)
+                self.max_used = max(self.max_used, new_limit)
+            self._condition.notify_all()
@@ -1,14 +1,17 @@
+import bz2
+import gzip
 import os
 import re
 import shutil
 import tempfile
 
-from execo.action import Remote
 from execo.host import Host
 from execo.log import style
 from execo_engine import logger
 from execo_g5k import get_oar_job_nodes, get_oargrid_job_nodes
 
+from hadoop_g5k.local import generate_local_hosts, get_process
+
 
 # Imports #####################################################################
 
@@ -50,49 +53,300 @@ def import_function(name):
 
 # Compression #################################################################
 
+class Codec(object):
+    """This class describes a compression or archive format.
+
+    Attributes:
+      name (str):
+        The name of the codec.
+      magic (str):
+        The bytes identifying the format at the beginning of the files.
+      extensions (list of str):
+        The extensions of the files in this format, used when their contents
+        cannot be read.
+      decompressors (list of str):
+        Commands decompressing stdin into stdout, in order of preference
+        (multi-threaded implementations first).
+      extractor (str):
+        For archives, the command extracting the file {file} into the
+        directory {dir}.
+    """
+
+    def __init__(self, name, magic, extensions, decompressors=None,
+                 extractor=None):
+        self.name = name
+        self.magic = magic
+        self.extensions = extensions
+        self.decompressors = decompressors or []
+        self.extractor = extractor
+
+    def is_archive(self):
+        """Return whether the format contains several files."""
+
+        return self.extractor is not None
+
+
+# Registered codecs, in order of detection
+CODECS = []
+
+# Identification of uncompressed tar files (ustar header)
+TAR_MAGIC = "ustar"
+TAR_MAGIC_OFFSET = 257
+
+# Output of the uncompress command when the format is unknown. The exit code
+# is not used, as local processes may not report it as is
+UNKNOWN_FORMAT_OUTPUT = "hg5k-unknown-format"
+
+# Extensions of tar files, which are also valid after a codec extension
+TAR_EXTENSIONS = [".tar", ".tgz", ".tbz2", ".tbz", ".txz", ".tzst"]
+
+
+def register_codec(codec):
+    """Add a codec to the registry. A codec with the same name is replaced.
+
+    Args:
+      codec (Codec):
+        The codec to be registered.
+    """
+
+    for (idx, c) in enumerate(CODECS):
+        if c.name == codec.name:
+            CODECS[idx] = codec
+            return
+    CODECS.append(codec)
+
+
+def get_codec(name):
+    """Return the registered codec with the given name, or None."""
+
+    for c in CODECS:
+        if c.name == name:
+            return c
+    return None
+
+
+register_codec(Codec("gzip", "\x1f\x8b", [".gz", ".tgz"],
+                     ["pigz -dc", "gzip -dc"]))
+register_codec(Codec("bzip2", "BZh", [".bz2", ".tbz2", ".tbz"],
+                     ["lbzip2 -dc", "pbzip2 -dc", "bzip2 -dc"]))
+register_codec(Codec("xz", "\xfd7zXZ\x00", [".xz", ".txz"],
+                     ["pixz -d", "xz -dc"]))
+register_codec(Codec("zstd", "\x28\xb5\x2f\xfd", [".zst", ".tzst"],
+                     ["pzstd -dc", "zstd -dcq"]))
+register_codec(Codec("lz4", "\x04\x22\x4d\x18", [".lz4"],
+                     ["lz4 -dc"]))
+register_codec(Codec("zip", "PK\x03\x04", [".zip"],
+                     extractor="unzip -q -o {file} -d {dir}"))
+
+
+def _read_header(file_name, num_bytes):
+    try:
+        with open(file_name, "rb") as f:
+            return f.read(num_bytes)
+    except IOError:
+        return None
+
+
+def detect_codec(file_name):
+    """Return the codec of a local file. It is identified by the magic bytes
+    of the file if it can be read and by its extension otherwise.
+
+    Args:
+      file_name (str):
+        The path of the file.
+
+    Returns (Codec):
+      The codec of the file or None if it is not compressed.
+    """
+
+    header = _read_header(file_name, max(len(c.magic) for c in CODECS))
+    if header is not None:
+        for c in CODECS:
+            if header.startswith(c.magic):
+                return c
+        return None
+
+    for c in CODECS:
+        for ext in c.extensions:
+            if file_name.endswith(ext):
+                return c
+    return None
+
+
+def _is_tar(file_name, codec):
+    """Return whether the decompressed contents of the file are a tar."""
+
+    base_name = os.path.basename(file_name)
+    for ext in TAR_EXTENSIONS:
+        if base_name.endswith(ext) or ext + "." in base_name:
+            return True
+
+    # Only the codecs supported by the standard library can be sniffed
+    header_size = TAR_MAGIC_OFFSET + len(TAR_MAGIC)
+    try:
+        if codec.name == "gzip":
+            with gzip.open(file_name) as f:
+                header = f.read(header_size)
+        elif codec.name == "bzip2":
+            with open(file_name, "rb") as f:
+                header = bz2.BZ2Decompressor().decompress(f.read(65536))
+        else:
+            return False
+    except (IOError, EOFError):
+        return False
+    return header[TAR_MAGIC_OFFSET:header_size] == TAR_MAGIC
+
+
+def get_stream_codec(file_name):
+    """Return the codec of a compressed file which can be decompressed as a
+    stream, i.e., it is not an archive containing several files.
+
+    Args:
+      file_name (str):
+        The name of the file.
+
+    Returns (Codec):
+      The codec or None if the file cannot be decompressed as a stream.
+    """
+
+    codec = detect_codec(file_name)
+    if codec is None or codec.is_archive() or _is_tar(file_name, codec):
+        return None
+    return codec
+
+
+def get_uncompressed_name(file_name):
+    """Return the name given to a file once decompressed.
+
+    Args:
+      file_name (str):
+        The name of the compressed file.
+    """
+
+    dir_name = os.path.dirname(file_name)
+    base_name = os.path.basename(file_name)
+
+    extensions = TAR_EXTENSIONS[:]
+    for c in CODECS:
+        extensions.extend(c.extensions)
+    for ext in sorted(extensions, key=len, reverse=True):
+        if base_name.endswith(ext):
+            base_name = base_name[:-len(ext)]
+            break
+    if base_name.endswith(".tar"):
+        base_name = base_name[:-4]
+
+    return os.path.join(dir_name, "data-" + base_name)
+
+
+def get_stream_decompression_command(codec):
+    """Return a shell command decompressing stdin into stdout with the first
+    available implementation of the codec in the host where it is executed.
+
+    Args:
+      codec (Codec):
+        The codec of the data.
+    """
+
+    commands = codec.decompressors
+    if len(commands) == 1:
+        return commands[0]
+
+    branches = ["command -v " + c.split()[0] + " >/dev/null 2>&1; then " + c
+                for c in commands[:-1]]
+    return ("if " + "; elif ".join(branches) + "; else " + commands[-1] +
+            "; fi")
+
+
+def get_uncompress_command(file_name, new_name):
+    """Return a shell command which detects the format of a remote file from
+    its magic bytes and decompresses it with the fastest available
+    implementation.
+
+    Compressed files are decompressed into new_name. Archives (zip and tar,
+    compressed or not) are extracted into new_name, which is a file if they
+    contain a single file and a directory otherwise. The original file is
+    removed. If the format is unknown, the command writes
+    UNKNOWN_FORMAT_OUTPUT and exits successfully.
+
+    Args:
+      file_name (str):
+        The path of the file in the host.
+      new_name (str):
+        The path of the result in the host.
+    """
+
+    magic_size = max(len(c.magic) for c in CODECS)
+
+    cases = []
+    for c in CODECS:
+        pattern = "".join("%02x" % ord(b) for b in c.magic) + "*"
+        if c.is_archive():
+            value = "archive:" + c.name
+        else:
+            value = get_stream_decompression_command(c)
+        cases.append(pattern + ") dec='" + value + "' ;;")
+    cases.append("*) dec=cat ;;")
+
+    extractors = []
+    for c in CODECS:
+        if c.is_archive():
+            extractors.append(
+                "archive:" + c.name + ") " +
+                c.extractor.format(file='"$f"', dir='"$t"') + " ;;")
+
+    tar_start = TAR_MAGIC_OFFSET + len(TAR_MAGIC)
+
+    return (
+        'f="' + file_name + '" ; n="' + new_name + '" ; t="$n.tmp" ; '
+        'rm -rf "$n" "$t" ; '
+        'magic=$(od -An -tx1 -N' + str(magic_size) + ' "$f" | tr -d " \\n") ; '
+        'case "$magic" in ' + " ".join(cases) + ' esac ; '
+        'case "$dec" in '
+        'archive:*) mkdir -p "$t" && '
+        'case "$dec" in ' + " ".join(extractors) + ' esac || exit 1 ;; '
+        '*) if [ "$(eval "$dec" < "$f" 2>/dev/null | head -c ' +
+        str(tar_start) + ' | tail -c ' + str(len(TAR_MAGIC)) + ')" = ' +
+        TAR_MAGIC + ' ]; then '
+        'mkdir -p "$t" && { eval "$dec" < "$f" | tar xf - -C "$t" ; } '
+        '|| exit 1 ; '
+        'elif [ "$dec" = cat ]; then echo ' + UNKNOWN_FORMAT_OUTPUT +
+        ' ; exit 0 ; '
+        'else eval "$dec" < "$f" > "$n" || exit 1 ; rm -f "$f" ; exit 0 ; '
+        'fi ;; '
+        'esac ; '
+        'if [ $(ls -A "$t" | wc -l) -eq 1 ]; then mv "$t"/* "$n" && '
+        'rmdir "$t" ; else mv "$t" "$n" ; fi ; '
+        'rm -f "$f"')
+
+
 def uncompress(file_name, host):
-    if file_name.endswith("tar.gz"):
-        decompression = Remote("tar xf " + file_name, [host])
-        decompression.run()
-
-        base_name = os.path.basename(file_name[:-7])
-        dir_name = os.path.dirname(file_name[:-7])
-        new_name = dir_name + "/data-" + base_name
-
-        action = Remote("mv " + file_name[:-7] + " " + new_name, [host])
-        action.run()
-    elif file_name.endswith("gz"):
-        decompression = Remote("gzip -d " + file_name, [host])
-        decompression.run()
-
-        base_name = os.path.basename(file_name[:-3])
-        dir_name = os.path.dirname(file_name[:-3])
-        new_name = dir_name + "/data-" + base_name
-
-        action = Remote("mv " + file_name[:-3] + " " + new_name, [host])
-        action.run()
-    elif file_name.endswith("zip"):
-        decompression = Remote("unzip " + file_name, [host])
-        decompression.run()
-
-        base_name = os.path.basename(file_name[:-4])
-        dir_name = os.path.dirname(file_name[:-4])
-        new_name = dir_name + "/data-" + base_name
-
-        action = Remote("mv " + file_name[:-4] + " " + new_name, [host])
-        action.run()
-    elif file_name.endswith("bz2"):
-        decompression = Remote("bzip2 -d " + file_name, [host])
-        decompression.run()
-
-        base_name = os.path.basename(file_name[:-4])
-        dir_name = os.path.dirname(file_name[:-4])
-        new_name = dir_name + "/data-" + base_name
-
-        action = Remote("mv " + file_name[:-4] + " " + new_name, [host])
-        action.run()
-    else:
-        logger.warn("Unknown extension")
+    """Decompress a file in the given host. Detection, decompression and
+    renaming are executed as a single remote command.
+
+    Args:
+      file_name (str):
+        The path of the file in the host.
+      host (Host):
+        The host where the file is stored.
+
+    Returns (str):
+      The path of the decompressed file or directory, or the original path if
+      the format is unknown.
+    """
+
+    new_name = get_uncompressed_name(file_name)
+
+    action = get_process(get_uncompress_command(file_name, new_name), host)
+    action.nolog_exit_code = True
+    action.run()
+
+    if not action.finished_ok:
+        logger.error("Could not uncompress " + file_name + " in " +
+                     str(host) + ": " + action.stderr.strip())
+        return file_name
+    elif UNKNOWN_FORMAT_OUTPUT in action.stdout.splitlines():
+        logger.warn("Unknown compression format of " + file_name)
         return file_name
 
     return new_name
@@ -106,9 +360,11 @@ def generate_hosts(hosts_input):
     Args:
       hosts_input: The path of the file containing the hosts to be used,
         or a comma separated list of site:job_id or an a comma separated list
-        of hosts or an oargrid_job_id.
+        of hosts or an oargrid_job_id or local:N.
         If a file is used, each host should be in a different line.
         Repeated hosts are pruned.
+        If local:N is used, N virtual hosts are created in the local machine
+        (pseudo-distributed deployment).
         Hint: in a running Grid5000 job, $OAR_NODEFILE should be used.
 
     Return:
@@ -120,6 +376,9 @@ def generate_hosts(hosts_input):
             h = Host(line.rstrip())
             if h not in hosts:
                 hosts.append(h)
+    elif hosts_input.startswith("local:"):
+        # Pseudo-distributed deployment with N virtual hosts
+        hosts = generate_local_hosts(int(hosts_input[len("local:"):]))
     elif ':' in hosts_input:
         # We assume the string is a comma separated list of site:job_id
         for job in hosts_input.split(','):